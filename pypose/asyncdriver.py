@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+
+"""
+  PyPose: Serial driver with a background bus thread.
+  Copyright (c) 2008,2009 Michael E. Ferguson.  All right reserved.
+
+  This program is free software; you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation; either version 2 of the License, or
+  (at your option) any later version.
+
+  This program is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+  GNU General Public License for more details.
+
+  You should have received a copy of the GNU General Public License
+  along with this program; if not, write to the Free Software Foundation,
+  Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+
+import wx
+import queue
+import serial
+import itertools
+import threading
+from concurrent.futures import Future
+from pypose.driver import Driver, FOREGROUND, BACKGROUND
+
+# sorts after every request, so close() lets queued work finish first
+STOP = BACKGROUND + 1
+
+
+class AsyncDriver(Driver):
+    """ Driver that owns the serial port on a background I/O thread.
+
+    Requests are queued with submit() and answered through a Future; a
+    callback, if given, is called on the GUI thread with wx.CallAfter.
+    The usual Driver methods still work, they queue a request and wait. """
+
+    def __init__(self, *args, **kwargs):
+        """ This may throw errors up the line -- that's a good thing. """
+        Driver.__init__(self, *args, **kwargs)
+        self.requests = queue.PriorityQueue()
+        self.order = itertools.count()  # keeps FIFO order within a priority
+        self.closed = False
+        self.closing = threading.Lock()  # no request may be queued after STOP
+        self.thread = threading.Thread(target=self.run, name="pypose-bus", daemon=True)
+        self.thread.start()
+
+    def run(self):
+        """ The I/O thread: take requests off the queue, one at a time. """
+        while True:
+            priority, n, future, method, args = self.requests.get()
+            if priority == STOP:
+                return
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(method(*args))
+            except Exception as e:
+                future.set_exception(e)
+
+    def submit(self, method, *args, callback=None, priority=FOREGROUND):
+        """ Queue a Driver method (given by name) or a callable, return a Future.
+        Once the driver is closed, the Future holds a SerialException. """
+        if not callable(method):
+            method = getattr(Driver, method).__get__(self)
+        future = Future()
+        if callback is not None:
+            future.add_done_callback(lambda f: self.deliver(f, callback))
+        with self.closing:
+            if not self.closed:
+                self.requests.put((priority, next(self.order), future, method, args))
+                return future
+        future.set_running_or_notify_cancel()
+        future.set_exception(serial.SerialException("port closed"))
+        return future
+
+    def deliver(self, future, callback):
+        if future.cancelled():
+            return
+        if future.exception() is not None:
+            print("Bus request failed: " + str(future.exception()))
+            return
+        wx.CallAfter(callback, future.result())
+
+    def pending(self):
+        """ Number of requests waiting for the bus. """
+        return self.requests.qsize()
+
+    def call(self, name, *args):
+        """ Run a Driver method on the I/O thread and wait for the result. """
+        if threading.current_thread() is self.thread:
+            return getattr(Driver, name)(self, *args)
+        return self.submit(name, *args).result()
+
+    def close(self):
+        """ Finish queued requests, stop the I/O thread, close the port. """
+        with self.closing:
+            self.closed = True
+            if self.thread.is_alive():
+                self.requests.put((STOP, next(self.order), None, None, None))
+        if self.thread.is_alive():
+            if threading.current_thread() is not self.thread:
+                self.thread.join()
+        Driver.close(self)
+
+    ###########################################################################
+    # blocking wrappers
+
+    def execute(self, index, ins, params):
+        return self.call("execute", index, ins, params)
+
+    def send(self, packet):
+        if threading.current_thread() is self.thread:
+            return Driver.send(self, packet)
+        # packet may be a view of a buffer that is reused, so queue a copy
+        return self.submit("send", bytes(packet)).result()
+
+    def setReg(self, index, regstart, values):
+        return self.call("setReg", index, regstart, values)
+
+    def getReg(self, index, regstart, rlength):
+        return self.call("getReg", index, regstart, rlength)
+
+    def readMany(self, ids, regstart, rlength, window=None, retries=None):
+        return self.call("readMany", ids, regstart, rlength, window, retries)
+
+    def readWindow(self, ids, regstart, rlength, timeout):
+        return self.call("readWindow", ids, regstart, rlength, timeout)
+
+    def syncWrite(self, regstart, vals):
+        return self.call("syncWrite", regstart, vals)
+
+    def syncWriteWords(self, regstart, ids, values):
+        return self.call("syncWriteWords", regstart, ids, values)
+
+    def setPoseSize(self, count):
+        return self.call("setPoseSize", count)
+
+    def loadPose(self, slot, pose):
+        return self.call("loadPose", slot, pose)
+
+    def loadSequence(self, transitions):
+        return self.call("loadSequence", transitions)
+
+    def playSequence(self):
+        return self.call("playSequence")
+
+    def loopSequence(self):
+        return self.call("loopSequence")
+
+    def haltSequence(self):
+        return self.call("haltSequence")
+
+    def forgetBoard(self):
+        return self.call("forgetBoard")
+
+    def record(self, path):
+        return self.call("record", path)
+
+    def stopRecording(self):
+        return self.call("stopRecording")
@@ -73,6 +73,10 @@ P_LOCK = 47
 P_PUNCH_L = 48
 P_PUNCH_H = 49
 
+# Baud Rates, P_BAUD_RATE value -> bps
+BAUD_RATES = {1: 1000000, 3: 500000, 4: 400000, 7: 250000, 9: 200000,
+              16: 115200, 34: 57600, 103: 19200, 207: 9600}
+
 # Status Return Levels
 AX_RETURN_NONE = 0
 AX_RETURN_READ = 1
@@ -86,3 +90,13 @@ AX_REG_WRITE = 4
 AX_ACTION = 5
 AX_RESET = 6
 AX_SYNC_WRITE = 131
+AX_SYNC_READ = 132  # ArbotiX firmware only, not the servos themselves
+
+# ArbotiX Instruction Set, sent to the board itself
+ARB_ID = 253
+ARB_SIZE_POSE = 7
+ARB_LOAD_POSE = 8
+ARB_LOAD_SEQ = 9
+ARB_PLAY_SEQ = 10
+ARB_LOOP_SEQ = 11
+ARB_TEST = 25
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+
+"""
+  PyPose: bus throughput and latency benchmark
+  Copyright (c) 2008-2010 Michael E. Ferguson.  All right reserved.
+
+  This program is free software; you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation; either version 2 of the License, or
+  (at your option) any later version.
+
+  This program is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+  GNU General Public License for more details.
+
+  You should have received a copy of the GNU General Public License
+  along with this program; if not, write to the Free Software Foundation,
+  Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+
+import sys
+import json
+import time
+import argparse
+import numpy
+from pypose import ax12
+from pypose.driver import Driver
+from pypose.simulator import VirtualBus, SIM_PORT
+
+# poses in the sequence of the runSeq workload
+SEQUENCE_LENGTH = 8
+
+
+def capturePose(port, count):
+    """ PoseEditor.capturePose: read every present position. """
+    port.readMany(range(1, count + 1), ax12.P_PRESENT_POSITION_L, 2)
+
+
+def setPose(port, count):
+    """ PoseEditor.setPose: move to one pose. """
+    pose = [512] * count
+    if port.hasInterpolation:
+        port.setPoseSize(count)
+        port.loadPose(0, pose)
+        port.loadSequence([(0, 500)])
+        port.playSequence()
+    else:
+        port.syncWriteWords(ax12.P_GOAL_POSITION_L, list(range(1, count + 1)), pose)
+
+
+def runSeq(port, count):
+    """ SeqEditor.runSeq: download poses and a sequence, then play it. """
+    port.setPoseSize(count)
+    for slot in range(SEQUENCE_LENGTH):
+        port.loadPose(slot, [512 + 8 * slot] * count)
+    port.loadSequence([(slot, 100) for slot in range(SEQUENCE_LENGTH)])
+    port.playSequence()
+    port.haltSequence()
+
+
+def doRelax(port, count):
+    """ Editor.doRelax: torque off on every servo. """
+    port.syncWrite(ax12.P_TORQUE_ENABLE, [(servo, 0) for servo in range(1, count + 1)])
+
+
+WORKLOADS = {"capturePose": capturePose, "setPose": setPose, "runSeq": runSeq, "doRelax": doRelax}
+# workloads that talk to the arbotiX itself (ARB_ID), there is none on a
+# direct bus; setPose falls back to a sync write there
+ARBOTIX_WORKLOADS = ["runSeq"]
+
+
+def measure(port, workload, count, repeat, cached=False):
+    """ Run workload repeat times, returns the result record. Each run
+    uploads its poses and sequence again, unless cached, when runs after
+    the first only time what the board doesn't hold yet. """
+    # every read must go to the bus
+    port.mirror.ttl = 0
+    port.mirror.invalidate()
+    port.forgetBoard()
+    port.resetStats()
+    start = time.monotonic()
+    for i in range(repeat):
+        if not cached:
+            port.forgetBoard()
+        WORKLOADS[workload](port, count)
+    elapsed = time.monotonic() - start
+    stats = port.stats()
+    latencies = numpy.array(port.latencies) * 1000.0
+    result = {"workload": workload, "servos": count, "repeat": repeat, "seconds": elapsed,
+              "perRun": elapsed / repeat,
+              "packetsPerSec": stats["packets"] / elapsed,
+              "bytesPerSec": (stats["bytesSent"] + stats["bytesRead"]) / elapsed,
+              "p50": None, "p99": None,
+              "timeouts": stats["timeouts"], "retries": stats["retries"],
+              "uploadsSkipped": stats["uploadsSkipped"]}
+    if len(latencies) > 0:
+        result["p50"] = float(numpy.percentile(latencies, 50))
+        result["p99"] = float(numpy.percentile(latencies, 99))
+    return result
+
+
+def ms(value):
+    if value is None:
+        return "-".rjust(8)
+    return ("%.2f" % value).rjust(8)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="pypose-bench", description="Measure bus throughput and latency of the PyPose workloads.")
+    parser.add_argument("--port", default=SIM_PORT, help="serial port, or '" + SIM_PORT + "' for a simulated bus (default)")
+    parser.add_argument("--baud", type=int, default=1000000, help="baud rate of the port (default 1000000)")
+    parser.add_argument("--servos", type=int, nargs="+", default=[4, 8, 18, 30], help="servo counts to run at")
+    parser.add_argument("--workloads", nargs="+", default=list(WORKLOADS.keys()), choices=list(WORKLOADS.keys()))
+    parser.add_argument("--repeat", type=int, default=20, help="runs of each workload")
+    parser.add_argument("--direct", action="store_true", help="servos are on the port, no arbotiX")
+    parser.add_argument("--cached", action="store_true",
+                        help="keep what the board holds between runs, so poses and sequences are uploaded once")
+    parser.add_argument("--noise", type=float, default=0.0, help="simulated bus only: chance of a corrupted reply")
+    parser.add_argument("--drop", type=float, default=0.0, help="simulated bus only: chance of a lost reply")
+    parser.add_argument("--output", help="write the results as JSON to this file ('-' for stdout)")
+    args = parser.parse_args(argv)
+    workloads = args.workloads
+    if args.direct:
+        workloads = [w for w in workloads if w not in ARBOTIX_WORKLOADS]
+        for w in args.workloads:
+            if w in ARBOTIX_WORKLOADS:
+                print("skipping " + w + ", it needs an arbotiX", file=sys.stderr)
+
+    results = list()
+    port = None
+    for count in args.servos:
+        if args.port == SIM_PORT:
+            bus = VirtualBus(count, args.baud, noise=args.noise, drop=args.drop, arbotix=not args.direct, seed=count)
+            port = Driver(args.port, args.baud, not args.direct, args.direct, ser=bus)
+        elif port is None:
+            port = Driver(args.port, args.baud, not args.direct, args.direct)
+        for workload in workloads:
+            result = measure(port, workload, count, args.repeat, args.cached)
+            results.append(result)
+            print(workload.ljust(12) + str(count).rjust(4) + " servos: " + ms(result["perRun"] * 1000) + " ms/run " +
+                  ("%.0f" % result["packetsPerSec"]).rjust(7) + " pkt/s " + ("%.0f" % result["bytesPerSec"]).rjust(8) + " B/s" +
+                  "  rtt p50" + ms(result["p50"]) + " p99" + ms(result["p99"]) + " ms" +
+                  "  timeouts " + str(result["timeouts"]) + ", retries " + str(result["retries"]), file=sys.stderr)
+        if args.port == SIM_PORT:
+            port.close()
+    if args.port != SIM_PORT and port is not None:
+        port.close()
+
+    if args.output is not None:
+        report = {"port": args.port, "baud": args.baud, "direct": args.direct, "cached": args.cached,
+                  "results": results}
+        if args.output == "-":
+            json.dump(report, sys.stdout, indent=2)
+            print()
+        else:
+            with open(args.output, "w") as f:
+                json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+
+"""
+  PyPose: coalescing register writes for live updates
+  Copyright (c) 2008-2010 Michael E. Ferguson.  All right reserved.
+
+  This program is free software; you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation; either version 2 of the License, or
+  (at your option) any later version.
+
+  This program is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+  GNU General Public License for more details.
+
+  You should have received a copy of the GNU General Public License
+  along with this program; if not, write to the Free Software Foundation,
+  Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+
+import time
+import threading
+from pypose import ax12
+
+# BIOLOID_FRAME_LENGTH, in seconds
+FRAME_LENGTH = 0.033
+
+
+class CoalescingWriter:
+    """ Write queue for one 16-bit register (goal position by default).
+
+    Only the latest value of each servo is kept; every period, all servos
+    with a new value are flushed as one sync write. Values replaced before
+    they ever reached the bus are counted as dropped. """
+
+    def __init__(self, port, regstart=ax12.P_GOAL_POSITION_L, period=FRAME_LENGTH):
+        self.port = port
+        self.regstart = regstart
+        self.period = period
+        self.dirty = dict()         # id -> latest value, not yet sent
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.thread = None
+        self.running = False
+        # statistics
+        self.requested = 0          # values handed to set()
+        self.written = 0            # values that went out on the bus
+        self.dropped = 0            # values replaced by a newer one first
+        self.flushes = 0            # sync write packets sent
+
+    def set(self, index, value):
+        """ Queue value for servo index, replacing any unsent value. """
+        with self.lock:
+            if index in self.dirty:
+                self.dropped = self.dropped + 1
+            self.dirty[index] = value
+            self.requested = self.requested + 1
+        self.wake.set()
+
+    def flush(self):
+        """ Send every dirty servo as one sync write, returns how many. """
+        with self.lock:
+            if len(self.dirty) == 0:
+                return 0
+            dirty = self.dirty
+            self.dirty = dict()
+        ids = list(dirty.keys())
+        self.port.syncWriteWords(self.regstart, ids, [dirty[i] for i in ids])
+        self.written = self.written + len(ids)
+        self.flushes = self.flushes + 1
+        return len(ids)
+
+    def start(self):
+        if self.thread is None:
+            self.running = True
+            self.thread = threading.Thread(target=self.run, name="pypose-writer", daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        """ Stop the flush thread, sending anything still queued. """
+        if self.thread is not None:
+            self.running = False
+            self.wake.set()
+            self.thread.join()
+            self.thread = None
+        self.flush()
+
+    def run(self):
+        """ Flush at most once per period, sleep while nothing changes. """
+        frame = time.monotonic()
+        while self.running:
+            self.wake.wait()
+            self.wake.clear()
+            if not self.running:
+                break
+            # hold off until the next frame boundary
+            frame = max(frame + self.period, time.monotonic())
+            delay = frame - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            try:
+                self.flush()
+            except Exception as e:
+                print("Live update failed: " + str(e))
+
+    def stats(self):
+        return {"requested": self.requested, "written": self.written,
+                "dropped": self.dropped, "flushes": self.flushes}
+
+    def __str__(self):
+        return (str(self.requested) + " updates, " + str(self.written) + " written in " +
+                str(self.flushes) + " packets, " + str(self.dropped) + " dropped by coalescing")
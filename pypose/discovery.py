@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+
+"""
+  PyPose: bus scan and servo discovery
+  Copyright (c) 2008-2010 Michael E. Ferguson.  All right reserved.
+
+  This program is free software; you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation; either version 2 of the License, or
+  (at your option) any later version.
+
+  This program is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+  GNU General Public License for more details.
+
+  You should have received a copy of the GNU General Public License
+  along with this program; if not, write to the Free Software Foundation,
+  Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+
+from pypose import ax12
+
+# every ID a servo can have, 254 is broadcast and 253 the arbotiX itself
+ALL_IDS = range(0, ax12.ARB_ID)
+# the EEPROM header: model number (2), version, id, baud rate, return delay
+HEADER_LENGTH = ax12.P_RETURN_DELAY_TIME - ax12.P_MODEL_NUMBER_L + 1
+
+
+class ServoInfo:
+    """ One servo found on the bus. """
+
+    def __init__(self, index, header, baud):
+        self.id = index
+        self.model = header[0] + (header[1] << 8)
+        self.version = header[2]
+        self.baudRate = header[4]           # P_BAUD_RATE register value
+        self.returnDelay = 2 * header[5]    # microseconds
+        self.baud = baud                    # bps the servo answered at
+
+    def __str__(self):
+        return ("ID " + str(self.id).rjust(3) + ": model " + str(self.model) + ", firmware " +
+                str(self.version) + ", return delay " + str(self.returnDelay) + "us @ " + str(self.baud))
+
+
+def probe(port, ids=ALL_IDS, window=None, timeout=0.02):
+    """ Ask every id for its EEPROM header, returns a dict of id -> header.
+
+    Each probe is a READ_DATA of the header rather than a PING: one answer
+    then carries everything we want to know, and the arbotiX only passes
+    READ/WRITE through to the bus. Probes are pipelined and asked once,
+    with a short timeout, and absent IDs don't count against the driver's
+    timeout policy. """
+    ids = list(ids)
+    if window is None:
+        window = port.readWindowSize()
+    found = dict()
+    for i in range(0, len(ids), window):
+        answers = port.readWindow(ids[i:i + window], ax12.P_MODEL_NUMBER_L, HEADER_LENGTH, timeout)
+        for index, (header, rtt) in answers.items():
+            found[index] = header
+            port.roundTrip(index, rtt)
+    return found
+
+
+def scan(port, ids=ALL_IDS, bauds=None, window=None, timeout=0.02):
+    """ Find the servos on the bus, returns a list of ServoInfo.
+
+    bauds is a list of bus speeds to sweep; that only makes sense with a
+    direct connection, the arbotiX talks to the bus at its own speed. The
+    result is kept in port.inventory, so later tools can skip the scan. """
+    servos = dict()
+    if bauds is None or not port.direct:
+        for index, header in probe(port, ids, window, timeout).items():
+            servos[index] = ServoInfo(index, header, port.ser.baudrate)
+    else:
+        baud = port.ser.baudrate
+        try:
+            for b in bauds:
+                port.ser.baudrate = b
+                for index, header in probe(port, ids, window, timeout).items():
+                    if index not in servos:
+                        servos[index] = ServoInfo(index, header, b)
+        finally:
+            port.ser.baudrate = baud
+    port.inventory = [servos[index] for index in sorted(servos.keys())]
+    return port.inventory
+
+
+def inventory(port, refresh=False):
+    """ The servos on the bus, scanning only if we haven't yet. """
+    if port.inventory is None or refresh:
+        return scan(port)
+    return port.inventory
@@ -19,131 +19,434 @@
   Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
 """
 
+import time
 import serial
+from collections import deque
+from concurrent.futures import Future
 from pypose import ax12
+from pypose.packet import PacketBuilder
+from pypose.mirror import RegisterMirror
+from pypose.recorder import Recorder
+from pypose.timeouts import TimeoutPolicy
+
+# request priorities for submit(), lower numbers go on the bus first
+FOREGROUND = 0
+BACKGROUND = 1
+# round trips kept for stats()
+LATENCY_HISTORY = 10000
+# READ_DATA requests in flight at once through the arbotiX, more can
+# overflow its serial buffer
+READ_WINDOW = 8
 
 
 class Driver:
     """ Class to open a serial port and control AX-12 servos
     through an arbotiX board or USBDynamixel. """
 
-    def __init__(self, port="/dev/ttyUSB0", baud=115200, interpolation=False, direct=False):
-        """ This may throw errors up the line -- that's a good thing. """
-        self.ser = serial.Serial()
-        self.ser.baudrate = baud
-        self.ser.port = port
-        self.ser.timeout = 0.5
-        self.ser.open()
+    def __init__(self, port="/dev/ttyUSB0", baud=115200, interpolation=False, direct=False, syncRead=False, ser=None):
+        """ This may throw errors up the line -- that's a good thing.
+        ser, if given, is used in place of opening port (e.g. a simulator.VirtualBus). """
+        if ser is None:
+            ser = serial.Serial()
+            ser.baudrate = baud
+            ser.port = port
+            ser.timeout = 0.5
+            ser.open()
+        else:
+            ser.timeout = 0.5
+        self.ser = ser
         self.error = 0
+        self.rxbuf = bytearray()  # received bytes not yet framed
+        self.packets = PacketBuilder()
+        self.policy = TimeoutPolicy()
         self.hasInterpolation = interpolation
         self.direct = direct
+        self.hasSyncRead = syncRead  # firmware answers AX_SYNC_READ for the bus
+        self.inventory = None       # servos found by the last bus scan
+        self.mirror = RegisterMirror()
+        self.tap = None             # recorder.Recorder, if recording
+        # a fresh port, nothing is known to be on the board
+        Driver.forgetBoard(self)
+        self.resetStats()
 
     def execute(self, index, ins, params):
         """ Send an instruction to a device. """
-        self.ser.flushInput()
-        packet = b""
-        length = 2 + len(params)
-        checksum = 255 - ((index + length + ins + sum(params)) % 256)
-        packet += bytes([0xFF, 0xFF, index, length, ins])
-        for val in params:
-            packet += bytes([val])
-        packet += bytes([checksum])
-        self.ser.write(packet)
-        return self.getPacket(0)
+        if ins == ax12.AX_RESET:
+            # back to factory settings, ID 1 included
+            self.mirror.invalidate(index)
+            self.mirror.invalidate(1)
+            self.inventory = None
+        if index == ax12.ARB_ID and ins == ax12.ARB_TEST:
+            # the test plays its own poses
+            self.forgetBoard()
+        vals = self.send(self.packets.instruction(index, ins, params))
+        if vals is None and index == ax12.ARB_ID:
+            # no answer, the board may have been reset
+            self.forgetBoard()
+        return vals
+
+    def send(self, packet):
+        """ Send an encoded packet, return the parameters of the reply.
+        Timeouts and retries come from self.policy. """
+        index = packet[2]
+        if not self.policy.available(index):
+            return None
+        for attempt in range(self.policy.attempts(index)):
+            self.ser.flushInput()
+            del self.rxbuf[:]
+            self.setTimeout(self.policy.timeout(index, attempt))
+            start = time.monotonic()
+            if attempt > 0:
+                self.retries = self.retries + 1
+            self.transmit(packet)
+            vals = self.getPacket(0)
+            if vals is not None:
+                self.roundTrip(index, time.monotonic() - start)
+                return vals
+        self.policy.failure(index)
+        return None
+
+    def transmit(self, data, packets=1):
+        """ Write encoded packets to the port. """
+        self.ser.write(data)
+        if self.tap is not None:
+            self.tap.sent(data)
+        self.packetsSent = self.packetsSent + packets
+        self.bytesSent = self.bytesSent + len(data)
+
+    def roundTrip(self, index, rtt):
+        """ index answered after rtt seconds. """
+        self.policy.success(index, rtt)
+        self.latencies.append(rtt)
+
+    def resetStats(self):
+        self.packetsSent = 0
+        self.bytesSent = 0
+        self.bytesRead = 0
+        self.timeouts = 0       # reads that gave up waiting
+        self.retries = 0        # requests sent again after a failure
+        self.latencies = deque(maxlen=LATENCY_HISTORY)
+        self.uploadsSkipped = 0  # poses and sequences already on the board
+
+    def stats(self):
+        """ Bus counters since the last resetStats(). """
+        return {"packets": self.packetsSent, "bytesSent": self.bytesSent, "bytesRead": self.bytesRead,
+                "timeouts": self.timeouts, "retries": self.retries, "roundTrips": len(self.latencies),
+                "uploadsSkipped": self.uploadsSkipped}
+
+    def setTimeout(self, timeout):
+        # changing the timeout reconfigures the port, skip it when we can
+        if self.ser.timeout != timeout:
+            self.ser.timeout = timeout
 
     def setReg(self, index, regstart, values):
         """ Set the value of registers. Should be called as such:
         ax12.setReg(1,1,(0x01,0x05)) """
-        self.execute(index, ax12.AX_WRITE_DATA, [regstart] + values)
+        vals = self.execute(index, ax12.AX_WRITE_DATA, [regstart] + values)
+        end = regstart + len(values)
+        if regstart <= ax12.P_ID < end or regstart <= ax12.P_BAUD_RATE < end:
+            # whether it went through or not, the last scan may be wrong now
+            self.inventory = None
+        if vals is not None and self.error == 0:
+            self.mirror.written(index, regstart, values)
+        else:
+            # we can't tell if the write happened
+            self.mirror.invalidate(index, regstart, len(values))
         return self.error
 
-    def getPacket(self, mode, id=-1, leng=-1, error=-1, params=None):
-        """ Read a return packet, iterative attempt """
-        # need a positive byte
-        b = self.ser.read()
-        if b == b'':
-            print("Fail Read")
+    def getPacket(self, mode=0):
+        """ Read a return packet, returns the parameters or None. """
+        status = self.getStatus()
+        if status is None:
             return None
+        return status[2]
+
+    def getStatus(self):
+        """ Read a return packet, returns (id, error, params) or None.
 
-        d = b[0]
-        # now process our byte
-        if mode == 0:           # get our first 0xFF
-            if d == 0xff:
-                print("Oxff found")
-                return self.getPacket(1)
-            else:
-                print("Oxff NOT found, restart: " + str(d))
-                return self.getPacket(0)
-        elif mode == 1:         # get our second 0xFF
-            if d == 0xff:
-                print("Oxff found")
-                return self.getPacket(2)
-            else:
-                print("Oxff NOT found, restart: " + str(d))
-                return self.getPacket(0)
-        elif mode == 2:         # get id
-            if d != 0xff:
-                print("ID found: " + str(d))
-                return self.getPacket(3, d)
-            else:
-                print("0xff is not ID, restart")
-                return self.getPacket(0)
-        elif mode == 3:         # get length
-            print("Length found: " + str(d))
-            return self.getPacket(4, id, d)
-        elif mode == 4:         # read error
-            print("Error level found: " + str(d))
-            self.error = d
-            if leng == 2:
-                return self.getPacket(6, id, leng, d, list())
-            else:
-                return self.getPacket(5, id, leng, d, list())
-        elif mode == 5:         # read params
-            print("Parameter found: " + str(d))
-            params.append(d)
-            if len(params) + 2 == leng:
-                return self.getPacket(6, id, leng, error, params)
-            else:
-                return self.getPacket(5, id, leng, error, params)
-        elif mode == 6:         # read checksum
-            print("Checksum found: " + str(d))
-            checksum = id + leng + error + sum(params) + d
-            print("Checksum computed: " + str(checksum))
+        Bytes are pulled from the port in bulk and framed by an iterative
+        state machine over the receive buffer; anything past the end of the
+        packet is kept for the next call. """
+        while True:
+            needed = self.parseStatus()
+            if isinstance(needed, tuple):
+                return needed
+            # read what the packet still needs, or whatever is already waiting
+            data = self.ser.read(max(needed, self.ser.inWaiting()))
+            if data == b'':
+                # counted, not printed: a poller would print it every time
+                self.timeouts = self.timeouts + 1
+                return None
+            self.bytesRead = self.bytesRead + len(data)
+            if self.tap is not None:
+                self.tap.received(data)
+            self.rxbuf += data
+
+    def parseStatus(self):
+        """ Frame one status packet out of the receive buffer.
+
+        Returns (id, error, params) and consumes the packet, or the number
+        of bytes still needed to complete the packet at the buffer head. """
+        buf = self.rxbuf
+        while True:
+            # get our 0xFF 0xFF, drop any junk before it
+            start = buf.find(b"\xff\xff")
+            if start < 0:
+                if buf[-1:] == b"\xff":
+                    del buf[:-1]
+                    return 1
+                del buf[:]
+                return 2
+            if start > 0:
+                del buf[:start]
+            if len(buf) < 4:
+                return 4 - len(buf)
+            # 0xff is not ID, restart one byte later
+            if buf[2] == 0xff:
+                del buf[:1]
+                continue
+            leng = buf[3]
+            if leng < 2:
+                del buf[:2]
+                continue
+            # header + id + length + (error, params, checksum)
+            total = 4 + leng
+            if len(buf) < total:
+                return total - len(buf)
+            with memoryview(buf) as view:
+                checksum = sum(view[2:total])
+                params = list(view[5:total - 1])
+            error = buf[4]
+            index = buf[2]
             if checksum % 256 != 255:
                 print("Checksum ERROR")
-                return None
-            return params
-        # fail
-        return None
+                del buf[:2]
+                continue
+            del buf[:total]
+            self.error = error
+            return (index, error, params)
 
     def getReg(self, index, regstart, rlength):
         """ Get the value of registers, should be called as such:
-        ax12.getReg(1,1,1) """
-        vals = self.execute(index, ax12.AX_READ_DATA, [regstart, rlength])
+        ax12.getReg(1,1,1)
+
+        Registers are served from self.mirror while they are fresh. """
+        vals = self.mirror.get(index, regstart, rlength)
         if vals is None:
-            print("Read Failed: Servo ID = " + str(index))
-            return -1
+            vals = self.execute(index, ax12.AX_READ_DATA, [regstart, rlength])
+            if vals is None:
+                print("Read Failed: Servo ID = " + str(index))
+                return -1
+            if self.error == 0:
+                self.mirror.store(index, regstart, vals)
         if rlength == 1:
             return vals[0]
         return vals
 
+    def readMany(self, ids, regstart, rlength, window=None, retries=None):
+        """ Get the value of registers on many servos, should be called as such:
+        ax12.readMany((1,2,3),36,2)
+
+        Returns a dict of id -> values, each value as getReg would return it.
+        READ_DATA requests are sent back-to-back, up to window at a time, and
+        all replies are collected in one receive pass. Servos that did not
+        answer are asked again, up to retries times (default from self.policy).
+        Servos whose registers are fresh in self.mirror aren't asked at all. """
+        ids = list(ids)
+        values = dict()
+        for index in ids:
+            vals = self.mirror.get(index, regstart, rlength)
+            if vals is not None:
+                values[index] = vals[0] if rlength == 1 else vals
+        ask = [index for index in ids if index not in values]
+        if len(ask) == 0:
+            return values
+        if self.hasSyncRead and not self.direct:
+            # one instruction, the board reads the bus and answers for everyone
+            vals = self.execute(0xFE, ax12.AX_SYNC_READ, [regstart, rlength] + ask)
+            # on an error the board padded the servos that failed with zeros,
+            # ask each one instead
+            if vals is not None and self.error == 0 and len(vals) == rlength * len(ask):
+                for i, index in enumerate(ask):
+                    self.mirror.store(index, regstart, vals[i * rlength:(i + 1) * rlength])
+                    if rlength == 1:
+                        values[index] = vals[i]
+                    else:
+                        values[index] = vals[i * rlength:(i + 1) * rlength]
+                return dict([(index, values[index]) for index in ids])
+        if window is None:
+            window = self.readWindowSize()
+        if retries is None:
+            retries = self.policy.retries
+        # don't pay a timeout for servos that keep failing
+        tried = [index for index in ask if self.policy.available(index)]
+        todo = tried
+        attempt = 0
+        while len(todo) > 0:
+            failed = list()
+            for i in range(0, len(todo), window):
+                batch = todo[i:i + window]
+                answers = self.readWindow(batch, regstart, rlength,
+                                          max([self.policy.timeout(index, attempt) for index in batch]))
+                for index, (vals, rtt) in answers.items():
+                    self.roundTrip(index, rtt)
+                    values[index] = vals
+                failed.extend([index for index in batch if index not in answers])
+            attempt = attempt + 1
+            todo = [index for index in failed if attempt < min(retries + 1, self.policy.attempts(index))]
+            self.retries = self.retries + len(todo)
+        result = dict()
+        for index in ids:
+            if index not in values and index in tried:
+                # self.policy reports a servo that keeps failing
+                self.policy.failure(index)
+            result[index] = values.get(index, -1)
+        return result
+
+    def readWindowSize(self):
+        """ Requests readWindow() sends at once by default. """
+        # a half-duplex bus can't take a request while a servo is replying
+        return 1 if self.direct else READ_WINDOW
+
+    def readWindow(self, ids, regstart, rlength, timeout):
+        """ Send READ_DATA to every id back-to-back and collect the replies.
+        Returns a dict of id -> (values, round trip) for those that answered. """
+        answers = dict()
+        self.ser.flushInput()
+        del self.rxbuf[:]
+        self.setTimeout(timeout)
+        start = time.monotonic()
+        self.transmit(self.packets.reads(ids, regstart, rlength), len(ids))
+        pending = set(ids)
+        while len(pending) > 0:
+            status = self.getStatus()
+            if status is None:
+                break
+            index, error, vals = status
+            if index in pending and len(vals) == rlength:
+                pending.discard(index)
+                if error == 0:
+                    self.mirror.store(index, regstart, vals)
+                if rlength == 1:
+                    vals = vals[0]
+                answers[index] = (vals, time.monotonic() - start)
+        return answers
+
     def syncWrite(self, regstart, vals):
         """ Set the value of registers. Should be called as such:
         ax12.syncWrite(reg, ((id1, val1, val2), (id2, val1, val2))) """
-        self.ser.flushInput()
-        length = 4
-        valsum = 0
-        packet = ""
-        for i in vals:
-            length = length + len(i)
-            valsum = valsum + sum(i)
-        checksum = 255 - ((254 + length + ax12.AX_SYNC_WRITE +
-                           regstart + len(vals[0]) - 1 + valsum) % 256)
-        # packet: FF FF ID LENGTH INS(0x03) PARAM .. CHECKSUM
-        packet += chr(0xFF) + chr(0xFF) + chr(0xFE) + chr(length) + chr(ax12.AX_SYNC_WRITE) + chr(regstart) + chr(len(vals[0]) - 1)
         for servo in vals:
-            for value in servo:
-                packet += chr(value)
-        packet += chr(checksum)
-        self.ser.write(packet.encode())
+            self.mirror.store(servo[0], regstart, servo[1:])
+        self.ser.flushInput()
+        del self.rxbuf[:]
+        self.transmit(self.packets.syncWrite(regstart, vals))
         # no return info...
+
+    def syncWriteWords(self, regstart, ids, values):
+        """ Set a 16-bit register on many servos. Should be called as such:
+        ax12.syncWriteWords(reg, (id1, id2), (val1, val2)) """
+        for index, value in zip(ids, values):
+            self.mirror.store(index, regstart, [value % 256, value >> 8])
+        self.ser.flushInput()
+        del self.rxbuf[:]
+        self.transmit(self.packets.syncWords(regstart, ids, values))
+        # no return info...
+
+    ###########################################################################
+    # arbotiX interpolation engine
+
+    #
+    # What the board holds is tracked by the packets that put it there, so
+    # poses and sequences that are already loaded aren't sent again.
+
+    def setPoseSize(self, count):
+        """ Set the number of servos in a pose -- IMPORTANT! """
+        if count == self.poseSize:
+            self.uploadsSkipped = self.uploadsSkipped + 1
+            return list()
+        # poses loaded at another size are no use now
+        self.forgetBoard()
+        vals = self.execute(ax12.ARB_ID, ax12.ARB_SIZE_POSE, [count])
+        if vals is not None:
+            self.poseSize = count
+        return vals
+
+    def loadPose(self, slot, pose):
+        """ Download a pose into a slot of the board, unless it's there already. """
+        packet = self.packets.pose(slot, pose)
+        if self.slots.get(slot) == packet:
+            self.uploadsSkipped = self.uploadsSkipped + 1
+            return list()
+        self.slots[slot] = bytes(packet)
+        vals = self.send(packet)
+        if vals is None:
+            self.forgetBoard()
+        return vals
+
+    def loadSequence(self, transitions):
+        """ Download a sequence of (pose slot, time) transitions, unless it's there already. """
+        packet = self.packets.sequence(transitions)
+        if self.sequence == packet:
+            self.uploadsSkipped = self.uploadsSkipped + 1
+            return list()
+        self.sequence = bytes(packet)
+        vals = self.send(packet)
+        if vals is None:
+            self.forgetBoard()
+        return vals
+
+    def forgetBoard(self):
+        """ Assume nothing is loaded on the board, e.g. after it was reset.
+        Done when an upload or a board command fails, on ARB_TEST, halt and
+        relax; a port opened again starts with a new driver. """
+        self.poseSize = None
+        self.slots = dict()         # pose slot -> ARB_LOAD_POSE packet that filled it
+        self.sequence = None        # ARB_LOAD_SEQ packet of the sequence loaded
+
+    def playSequence(self):
+        return self.execute(ax12.ARB_ID, ax12.ARB_PLAY_SEQ, list())
+
+    def loopSequence(self):
+        return self.execute(ax12.ARB_ID, ax12.ARB_LOOP_SEQ, list())
+
+    def haltSequence(self):
+        """ send halt message ("H") """
+        self.forgetBoard()
+        self.transmit(b"H")
+
+    def record(self, path):
+        """ Start appending the traffic on the port to the log at path. """
+        self.stopRecording()
+        self.tap = Recorder(path)
+
+    def stopRecording(self):
+        if self.tap is not None:
+            self.tap.close()
+            self.tap = None
+
+    def close(self):
+        if self.tap is not None:
+            self.tap.close()
+            self.tap = None
+        self.ser.close()
+
+    ###########################################################################
+    # requests
+
+    def submit(self, method, *args, callback=None, priority=FOREGROUND):
+        """ Run a Driver method (given by name) or a callable, return a Future.
+
+        This driver is synchronous: the work is done before submit returns,
+        and callback is called with the result straight away. """
+        if not callable(method):
+            method = getattr(self, method)
+        result = method(*args)
+        future = Future()
+        future.set_result(result)
+        if callback is not None:
+            callback(result)
+        return future
+
+    def pending(self):
+        """ Number of requests waiting for the bus, always none here. """
+        return 0
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+
+"""
+  PyPose: exporting projects for the robot
+  Copyright (c) 2008-2010 Michael E. Ferguson.  All right reserved.
+
+  This program is free software; you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation; either version 2 of the License, or
+  (at your option) any later version.
+
+  This program is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+  GNU General Public License for more details.
+
+  You should have received a copy of the GNU General Public License
+  along with this program; if not, write to the Free Software Foundation,
+  Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+
+import struct
+import numpy
+
+TARGETS = ("progmem", "delta", "blob")
+# bytes buffered before a write goes to the disk
+BUFFER = 1 << 16
+
+# A blob, for loading from an SD card, is little endian:
+#   header          magic, servos, poses, sequences
+#   sequences       uint32[sequences], offset of each sequence in the file
+#   poses           uint16[poses][servos]
+#   each sequence   uint16 transitions, then (uint16 pose, uint16 time) each
+#   names           pose names then sequence names, each ending in a 0
+BLOB_MAGIC = b"PPX1"
+BLOB_HEADER = struct.Struct("<4sHHH")
+
+# largest pose delta a two byte zigzag varint of the delta table holds
+DELTA_LIMIT = 8191
+
+DELTA_DECODER = """/* Positions of pose index into pose[], each is the base position plus
+ * a zigzag varint delta: 7 bits a byte, the high bit set if one follows. */
+static void @NAME_pose(unsigned char index, int * pose){
+    const prog_uint8_t * p = @NAME_poses + pgm_read_word_near(@NAME_offsets + index);
+    for(int i = 0; i < @COUNT; i++){
+        unsigned int z = pgm_read_byte_near(p++);
+        if(z & 0x80)
+            z = (z & 0x7f) | (pgm_read_byte_near(p++) << 7);
+        pose[i] = pgm_read_word_near(@NAME_base + i) + (int)((z >> 1) ^ -(z & 1));
+    }
+}
+
+"""
+
+# delta tables hold pose indexes, not pointers, so they can't go through
+# BioloidController::playSeq(); this plays them, include BioloidController.h
+# before the exported header
+DELTA_PLAYER = """typedef struct{
+    unsigned char pose;     // index of the pose, see @NAME_pose()
+    unsigned int time;      // time for transition
+} @NAME_transition_t;
+
+/* Play seq, a @NAME_transition_t table starting with {0, transitions},
+ * on bioloid. Blocks until the last pose is reached. */
+static void @NAME_play(BioloidController & bioloid, const @NAME_transition_t * seq){
+    int pose[@COUNT];
+    int transitions = pgm_read_word_near(&seq[0].time);
+    for(int t = 1; t <= transitions; t++){
+        @NAME_pose(pgm_read_byte_near(&seq[t].pose), pose);
+        for(int i = 0; i < @COUNT; i++)
+            bioloid.setNextPose(i + 1, pose[i]);
+        bioloid.interpolateSetup(pgm_read_word_near(&seq[t].time));
+        while(bioloid.interpolating > 0){
+            bioloid.interpolateStep();
+            delay(3);
+        }
+    }
+}
+
+"""
+
+
+def transition(t):
+    """ (pose, time) of a "pose|time" transition, as text. """
+    return t[0:t.find("|")], t[t.find("|") + 1:]
+
+
+def reachable(project, sequences):
+    """ The poses and sequences to export when only sequences are wanted:
+    the poses their transitions use, in project order. """
+    sequences = [s for s in project.sequences.keys() if s in sequences]
+    used = set()
+    for s in sequences:
+        for t in project.sequences[s]:
+            used.add(transition(t)[0])
+    return [p for p in project.poses.keys() if p in used], sequences
+
+
+def check(project, poses, sequences):
+    """ Raise ValueError if one of sequences uses a pose not in poses. """
+    exported = set(poses)
+    for s in sequences:
+        for t in project.sequences[s]:
+            pose = transition(t)[0]
+            if pose not in exported:
+                raise ValueError("sequence " + s + " uses pose " + pose + ", which isn't exported")
+
+
+def export(project, filename, target="progmem", sequences=None):
+    """ Export project to filename for target, one of TARGETS. With
+    sequences, only those and the poses they reach are exported. Returns
+    the bytes written. """
+    if sequences is None:
+        poses = list(project.poses.keys())
+        sequences = list(project.sequences.keys())
+    else:
+        poses, sequences = reachable(project, sequences)
+    poses = [p for p in poses if not p.startswith("ik_")]
+    check(project, poses, sequences)
+    if target == "blob":
+        with open(filename, "wb", buffering=BUFFER) as f:
+            return blob(project, poses, sequences, f)
+    if target not in TARGETS:
+        raise ValueError("unknown export target " + str(target))
+    with open(filename, "w", buffering=BUFFER) as f:
+        f.write("#ifndef " + project.name.upper() + "_POSES" + '\n')
+        f.write("#define " + project.name.upper() + "_POSES" + '\n\n')
+        f.write("#include <avr/pgmspace.h>\n\n")
+        transition_t = "transition_t"
+        if target == "progmem":
+            progmem(project, poses, f)
+        else:
+            delta(project, poses, f)
+            transition_t = project.name.lower() + "_transition_t"
+        for s in sequences:
+            f.write("PROGMEM " + transition_t + " " + s + "[] = {{0," + str(len(project.sequences[s])) + "}\n")
+            for pose, time in [transition(t) for t in project.sequences[s]]:
+                if target == "delta":
+                    pose = define(project, pose)
+                f.write(",{" + pose + "," + time + "}\n")
+            f.write("};\n\n")
+        f.write("#endif\n")
+        return f.tell()
+
+
+def positions(project, poses):
+    """ The positions of poses, one row each. """
+    if len(poses) == 0:
+        return numpy.zeros((0, project.count), dtype=numpy.int32)
+    return project.poses.array(poses)
+
+
+def progmem(project, poses, f):
+    """ One PROGMEM array a pose, starting with the servo count. """
+    for p, values in zip(poses, positions(project, poses).tolist()):
+        f.write("PROGMEM prog_uint16_t " + p + "[] = {" + str(project.count) + ",\n")
+        f.write(",\n".join([str(x) for x in values]) + "};\n\n")
+
+
+def define(project, pose):
+    return project.name.upper() + "_" + pose.upper()
+
+
+def delta(project, poses, f):
+    """ Every pose as the deltas from a base pose, packed as varints in one
+    table, with the offset of each pose in it and a decoder. Sequences then
+    hold pose indexes, see the @NAME_POSE defines, and are played with
+    @NAME_play(). """
+    name = project.name.lower()
+    table = positions(project, poses)
+    base = numpy.zeros(project.count, dtype=numpy.int32)
+    if len(table) > 0:
+        base = numpy.rint(numpy.median(table, axis=0)).astype(numpy.int32)
+    deltas = table - base
+    if len(deltas) > 0 and numpy.abs(deltas).max() > DELTA_LIMIT:
+        raise ValueError("pose too far from the base pose to delta encode")
+    # zigzag, then one byte if it fits in 7 bits, else two
+    zigzag = numpy.where(deltas < 0, -2 * deltas - 1, 2 * deltas)
+    sizes = numpy.where(zigzag < 0x80, 1, 2).sum(axis=1)
+    offsets = numpy.concatenate(([0], numpy.cumsum(sizes)[:-1])).astype(int)
+    data = list()
+    for z in zigzag.ravel().tolist():
+        if z < 0x80:
+            data.append(z)
+        else:
+            data.extend((0x80 | (z & 0x7f), z >> 7))
+
+    for i, p in enumerate(poses):
+        f.write("#define " + define(project, p) + " " + str(i) + "\n")
+    f.write("\nPROGMEM prog_uint16_t " + name + "_base[] = {" + ", ".join([str(x) for x in base.tolist()]) + "};\n")
+    f.write("PROGMEM prog_uint16_t " + name + "_offsets[] = {" + ", ".join([str(x) for x in offsets.tolist()]) + "};\n")
+    f.write("PROGMEM prog_uint8_t " + name + "_poses[] = {\n")
+    for i in range(0, len(data), 16):
+        f.write(", ".join([str(x) for x in data[i:i + 16]]) + ",\n")
+    f.write("};\n\n")
+    f.write(DELTA_DECODER.replace("@NAME", name).replace("@COUNT", str(project.count)))
+    f.write(DELTA_PLAYER.replace("@NAME", name).replace("@COUNT", str(project.count)))
+
+
+def blob(project, poses, sequences, f):
+    """ The binary layout above, see BLOB_HEADER. """
+    index = dict([(p, i) for i, p in enumerate(poses)])
+    f.write(BLOB_HEADER.pack(BLOB_MAGIC, project.count, len(poses), len(sequences)))
+    offset = BLOB_HEADER.size + 4 * len(sequences) + 2 * project.count * len(poses)
+    directory = list()
+    for s in sequences:
+        directory.append(offset)
+        offset = offset + 2 + 4 * len(project.sequences[s])
+    f.write(struct.pack("<%dI" % len(sequences), *directory))
+    f.write(positions(project, poses).astype("<u2").tobytes())
+    for s in sequences:
+        table = [len(project.sequences[s])]
+        for pose, time in [transition(t) for t in project.sequences[s]]:
+            if pose not in index:
+                raise ValueError("sequence " + s + " uses pose " + pose + ", which isn't exported")
+            table.extend((index[pose], int(time)))
+        f.write(struct.pack("<%dH" % len(table), *table))
+    for name in poses + sequences:
+        f.write(name.encode("utf-8") + b"\0")
+    return f.tell()
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+
+"""
+  PyPose: gait compiler, whole gait cycles solved ahead of time
+  Copyright (c) 2008-2010 Michael E. Ferguson.  All right reserved.
+
+  This program is free software; you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation; either version 2 of the License, or
+  (at your option) any later version.
+
+  This program is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+  GNU General Public License for more details.
+
+  You should have received a copy of the GNU General Public License
+  along with this program; if not, write to the Free Software Foundation,
+  Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+
+import numpy
+
+# the gaitSelect() table of gaits.h: for each gait, whether it uses
+# SmoothGaitGen, then for 4 and 6 legs (gaitLegNo, pushSteps, stepsInCycle,
+# tranTime)
+GAITS = {
+    "ripple": (False, {
+        4: ({"RIGHT_FRONT": 0, "LEFT_REAR": 2, "LEFT_FRONT": 4, "RIGHT_REAR": 6}, 6, 8, 98),
+        6: ({"RIGHT_FRONT": 0, "LEFT_REAR": 2, "LEFT_MIDDLE": 4, "LEFT_FRONT": 6, "RIGHT_REAR": 8,
+             "RIGHT_MIDDLE": 10}, 10, 12, 98)}),
+    "ripple-smooth": (True, {
+        4: ({"RIGHT_FRONT": 0, "LEFT_REAR": 4, "LEFT_FRONT": 8, "RIGHT_REAR": 12}, 12, 16, 98),
+        6: ({"RIGHT_FRONT": 0, "LEFT_REAR": 4, "LEFT_MIDDLE": 8, "LEFT_FRONT": 12, "RIGHT_REAR": 16,
+             "RIGHT_MIDDLE": 20}, 20, 24, 65)}),
+    "amble": (False, {
+        4: ({"RIGHT_FRONT": 0, "LEFT_REAR": 0, "LEFT_FRONT": 2, "RIGHT_REAR": 2}, 2, 4, 98),
+        6: ({"RIGHT_FRONT": 0, "LEFT_REAR": 0, "LEFT_FRONT": 2, "RIGHT_REAR": 2, "RIGHT_MIDDLE": 4,
+             "LEFT_MIDDLE": 4}, 4, 6, 98)}),
+    "amble-smooth": (True, {
+        4: ({"RIGHT_FRONT": 0, "LEFT_REAR": 0, "LEFT_FRONT": 4, "RIGHT_REAR": 4}, 4, 8, 65),
+        6: ({"RIGHT_FRONT": 0, "LEFT_REAR": 0, "LEFT_FRONT": 4, "RIGHT_REAR": 4, "RIGHT_MIDDLE": 8,
+             "LEFT_MIDDLE": 8}, 8, 12, 65)}),
+    # gaits.h gives RIGHT_REAR both tripods and RIGHT_MIDDLE none, this is the tripod it means
+    "tripod": (False, {
+        6: ({"RIGHT_FRONT": 0, "LEFT_MIDDLE": 0, "RIGHT_REAR": 0, "LEFT_REAR": 2, "LEFT_FRONT": 2,
+             "RIGHT_MIDDLE": 2}, 2, 4, 98)}),
+}
+
+# cycles run before the one kept, so every leg has stepped once
+WARMUP = 1
+# (Xspeed, Yspeed, Rspeed) of the tables exported with a NUKE sketch
+EXPORT_SPEEDS = [(50, 0, 0), (100, 0, 0), (-50, 0, 0)]
+
+
+def cint(x):
+    """ A C assignment of a float to an int: truncates. """
+    return int(x)
+
+
+def cdiv(a, b):
+    """ C integer division, truncates toward zero. """
+    return int(a / b)
+
+
+class GaitGen:
+    """ DefaultGaitGen and SmoothGaitGen of gaits.h, with the same int and
+    float fields, so the offsets come out as the robot computes them. """
+
+    def __init__(self, smooth, legNo, pushSteps, stepsInCycle, tranTime, speed, liftHeight):
+        self.smooth = smooth
+        self.legNo = legNo
+        self.pushSteps = pushSteps
+        self.stepsInCycle = stepsInCycle
+        self.Xspeed, self.Yspeed, self.Rspeed = speed
+        self.liftHeight = liftHeight
+        self.cycleTime = (stepsInCycle * tranTime) / 1000.0
+        self.gaits = dict([(leg, [0, 0, 0, 0.0]) for leg in legNo])     # x, y, z ints, r float
+
+    def moving(self):
+        return abs(self.Xspeed) > 5 or abs(self.Yspeed) > 5 or abs(self.Rspeed) > 0.05
+
+    def stride(self, divisor):
+        """ speed*cycleTime*pushSteps/(divisor*stepsInCycle), for x, y and r. """
+        d = divisor * self.stepsInCycle
+        return (cint(self.Xspeed * self.cycleTime * self.pushSteps / d),
+                cint(self.Yspeed * self.cycleTime * self.pushSteps / d),
+                self.Rspeed * self.cycleTime * self.pushSteps / d)
+
+    def __call__(self, leg, step):
+        g = self.gaits[leg]
+        n = self.legNo[leg]
+        if not self.moving():
+            g[2] = 0
+        elif not self.smooth and step == n:
+            # leg up, middle position
+            g[:] = [0, 0, -self.liftHeight, 0.0]
+        elif not self.smooth and (step == n + 1 or step == n - (self.stepsInCycle - 1)) and g[2] < 0:
+            # leg down position
+            x, y, r = self.stride(2)
+            g[:] = [x, y, 0, r]
+        elif self.smooth and step == n:
+            # leg up, halfway to middle
+            g[:] = [cdiv(g[0], 2), cdiv(g[1], 2), cdiv(-self.liftHeight, 2), g[3] / 2]
+        elif self.smooth and step == n + 1 and g[2] < 0:
+            # leg up position
+            g[:] = [0, 0, -self.liftHeight, 0.0]
+        elif self.smooth and step == n + 2 and g[2] < 0:
+            # leg halfway down
+            x, y, r = self.stride(4)
+            g[:] = [x, y, cdiv(-self.liftHeight, 2), r]
+        elif self.smooth and step == n + 3 and g[2] < 0:
+            # leg down position
+            x, y, r = self.stride(2)
+            g[:] = [x, y, 0, r]
+        else:
+            # move body forward
+            g[:] = [cint(g[0] - (self.Xspeed * self.cycleTime) / self.stepsInCycle),
+                    cint(g[1] - (self.Yspeed * self.cycleTime) / self.stepsInCycle), 0,
+                    g[3] - (self.Rspeed * self.cycleTime) / self.stepsInCycle]
+        return list(g)
+
+
+class GaitTable:
+    """ One gait cycle at one speed, solved: positions and reachable are
+    (stepsInCycle x servos), for servo IDs 1 and up. """
+
+    def __init__(self, gait, speed, tranTime, offsets, positions, reachable):
+        self.gait = gait
+        self.speed = speed
+        self.tranTime = tranTime
+        self.offsets = offsets          # (steps x legs x 4) gaitGen output
+        self.positions = positions
+        self.reachable = reachable
+
+    def name(self):
+        x, y, r = self.speed
+        return ("gait_" + self.gait.replace("-", "_") + "_x" + str(x) + "_y" + str(y) +
+                "_r" + str(int(round(r * 100)))).replace("-", "m")
+
+    def valid(self):
+        return bool(self.reachable.all())
+
+    def failures(self):
+        """ (step, servo ID) of every position outside ik_min/ik_max. """
+        return [(int(step), int(servo) + 1) for step, servo in numpy.argwhere(~self.reachable)]
+
+    def transitions(self):
+        """ The cycle as (positions, milliseconds) for a SequencePlayer. """
+        return [(row, self.tranTime) for row in self.positions.tolist()]
+
+    def writePython(self, f):
+        f.write(self.name().upper() + " = " + repr(self.positions.tolist()) + "\n")
+
+    def writeProgmem(self, f):
+        """ Steps, servos and tranTime, then every position, step by step. """
+        steps, servos = self.positions.shape
+        f.write("/* " + self.gait + " at X " + str(self.speed[0]) + ", Y " + str(self.speed[1]) +
+                ", R " + str(self.speed[2]) + (" */\n" if self.valid() else ", HAS UNREACHABLE FRAMES */\n"))
+        f.write("PROGMEM prog_uint16_t " + self.name() + "[] = {" + str(steps) + ", " + str(servos) + ", " +
+                str(self.tranTime) + ",\n")
+        f.write(",\n".join([", ".join([str(p) for p in row]) for row in self.positions.tolist()]) + "};\n\n")
+
+
+def stance(legs, x, y, z):
+    """ The endpoints setupIK() of nuke.cpp stands on. """
+    return [[x, y, z], [-x, y, z], [x, -y, z], [-x, -y, z], [0, y, z], [0, -y, z]][:legs]
+
+
+def parameters(gait, legs, stepsInCycle=None):
+    """ (smooth, gaitLegNo, pushSteps, stepsInCycle, tranTime) of a gait.
+    A different stepsInCycle spreads the lifts over it, keeping the steps
+    spent in the air. """
+    if gait not in GAITS or legs not in GAITS[gait][1]:
+        raise ValueError("no " + str(gait) + " gait for " + str(legs) + " legs")
+    smooth, table = GAITS[gait]
+    legNo, pushSteps, steps, tranTime = table[legs]
+    if stepsInCycle is not None and stepsInCycle != steps:
+        legNo = dict([(leg, n * stepsInCycle // steps) for leg, n in legNo.items()])
+        pushSteps = stepsInCycle - (steps - pushSteps)
+        steps = stepsInCycle
+    return smooth, legNo, pushSteps, steps, tranTime
+
+
+def compileGait(model, gait, speed, liftHeight, stepsInCycle=None, endpoints=None):
+    """ Run a whole cycle of gait, at speed (Xspeed, Yspeed, Rspeed), through
+    the IK of model, a LeggedModel, from the endpoints, by default the
+    stance the model holds. Returns a GaitTable. """
+    legs = [leg.name for leg in model.activeLegs()]
+    smooth, legNo, pushSteps, steps, tranTime = parameters(gait, model.legs, stepsInCycle)
+    gen = GaitGen(smooth, legNo, pushSteps, steps, tranTime, speed, liftHeight)
+    offsets = numpy.zeros((steps, len(legs), 4))
+    for cycle in range(WARMUP + 1):
+        for step in range(steps):
+            for i, leg in enumerate(legs):
+                offsets[step, i] = gen(leg, step)
+    if endpoints is None:
+        endpoints = [model[leg][0:3] for leg in legs]
+    endpoints = numpy.broadcast_to(numpy.asarray(endpoints, dtype=float), (steps, len(legs), 3))
+    positions, reachable = model.batchIK(endpoints, offsets)
+    return GaitTable(gait, tuple(speed), tranTime, offsets, positions, reachable)
+
+
+def compileGaits(model, gaits, speeds, liftHeight, stepsInCycle=None, endpoints=None):
+    """ A GaitTable for each of gaits at each of speeds, skipping gaits the
+    model hasn't the legs for. """
+    tables = list()
+    for gait in gaits:
+        if model.legs not in GAITS[gait][1]:
+            continue
+        for speed in speeds:
+            tables.append(compileGait(model, gait, speed, liftHeight, stepsInCycle, endpoints))
+    return tables
+
+
+def writePython(tables, filename):
+    with open(filename, "w") as f:
+        f.write("# Gaits compiled by PyPose\n")
+        for table in tables:
+            table.writePython(f)
+
+
+def writeProgmem(tables, filename):
+    with open(filename, "w") as f:
+        f.write("/* Gaits compiled by PyPose: each table is steps, servos, tranTime,\n")
+        f.write(" * then the position of every servo for each step. */\n")
+        f.write("#ifndef GAIT_TABLES_H\n#define GAIT_TABLES_H\n\n#include <avr/pgmspace.h>\n\n")
+        for table in tables:
+            table.writeProgmem(f)
+        f.write("#endif\n")
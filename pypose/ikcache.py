@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+
+"""
+  PyPose: memoization of IK solutions
+  Copyright (c) 2008-2010 Michael E. Ferguson.  All right reserved.
+
+  This program is free software; you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation; either version 2 of the License, or
+  (at your option) any later version.
+
+  This program is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+  GNU General Public License for more details.
+
+  You should have received a copy of the GNU General Public License
+  along with this program; if not, write to the Free Software Foundation,
+  Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+
+from collections import OrderedDict
+
+# solutions kept by default
+CACHE_SIZE = 4096
+
+
+class IKCache:
+    """ A bounded, least recently used, store of IK solutions.
+
+    Keys are built by the model from its inputs quantized to what a servo
+    can resolve, so endpoints that recur every gait cycle hit. """
+
+    def __init__(self, size=CACHE_SIZE):
+        self.size = size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """ The solution for key, None if there is none yet. """
+        value = self.entries.get(key)
+        if value is None:
+            self.misses = self.misses + 1
+        else:
+            self.entries.move_to_end(key)
+            self.hits = self.hits + 1
+        return value
+
+    def put(self, key, value):
+        self.entries[key] = value
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+            self.evictions = self.evictions + 1
+
+    def clear(self):
+        """ Forget every solution, e.g. when the dimensions change. """
+        self.entries.clear()
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "entries": len(self.entries), "size": self.size}
+
+    def __str__(self):
+        lookups = self.hits + self.misses
+        rate = 0.0
+        if lookups > 0:
+            rate = 100.0 * self.hits / lookups
+        return (str(self.hits) + " hits, " + str(self.misses) + " misses (%.1f%% hit rate), " % rate +
+                str(self.evictions) + " evicted, " + str(len(self.entries)) + "/" + str(self.size) + " entries")
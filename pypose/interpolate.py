@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+
+"""
+  PyPose: host-side pose interpolation, for boards that don't interpolate
+  Copyright (c) 2008-2010 Michael E. Ferguson.  All right reserved.
+
+  This program is free software; you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation; either version 2 of the License, or
+  (at your option) any later version.
+
+  This program is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+  GNU General Public License for more details.
+
+  You should have received a copy of the GNU General Public License
+  along with this program; if not, write to the Free Software Foundation,
+  Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+
+import time
+import threading
+import numpy
+from pypose import ax12
+from pypose.coalesce import FRAME_LENGTH
+
+
+def linear(s):
+    return s
+
+
+def cosine(s):
+    return (1 - numpy.cos(numpy.pi * s)) / 2
+
+
+def minimumJerk(s):
+    """ Zero speed and acceleration at both ends. """
+    return s * s * s * (10 - 15 * s + 6 * s * s)
+
+
+EASINGS = {"linear": linear, "cosine": cosine, "minimum-jerk": minimumJerk}
+
+
+def frames(start, goal, deltaT, period=FRAME_LENGTH, easing="linear"):
+    """ Positions for every frame of a move from start to goal over deltaT
+    milliseconds, one row per frame and one column per servo. The last row
+    is goal. """
+    start = numpy.asarray(start, dtype=float)
+    goal = numpy.asarray(goal, dtype=float)
+    count = max(1, int(round(deltaT / 1000.0 / period)))
+    s = EASINGS[easing](numpy.arange(1, count + 1) / float(count))
+    return numpy.rint(start + numpy.outer(s, goal - start)).astype(int)
+
+
+class Interpolator:
+    """ Moves servos to a pose smoothly, by streaming goal positions.
+
+    Frames are computed for all servos at once, then sent as one sync write
+    each, every period, on a schedule kept from the start of the move: a
+    late frame doesn't push back the ones after it, and frames that are
+    already overdue are skipped. A move starts from the present position of
+    the servos, or, if it replaces a move still playing, from the last
+    frame sent. """
+
+    def __init__(self, port, period=FRAME_LENGTH, regstart=ax12.P_GOAL_POSITION_L):
+        self.port = port
+        self.period = period
+        self.regstart = regstart
+        self.last = dict()          # id -> last goal position sent
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.move = None            # (ids, frames, start time, next frame) being played
+        self.thread = None
+        self.running = False
+        # statistics
+        self.sent = 0               # frames written
+        self.skipped = 0            # frames dropped to keep the schedule
+        self.late = 0.0             # worst lateness of a frame, seconds
+
+    def position(self, ids):
+        """ Where the servos are: what we last sent, else their present
+        position. None if a servo can't be read. """
+        missing = [index for index in ids if index not in self.last]
+        if len(missing) > 0:
+            values = self.port.readMany(missing, ax12.P_PRESENT_POSITION_L, 2)
+            for index in missing:
+                vals = values.get(index, -1)
+                if vals == -1:
+                    return None
+                self.last[index] = vals[0] + (vals[1] << 8)
+        return [self.last[index] for index in ids]
+
+    def moveTo(self, ids, goal, deltaT, easing="linear"):
+        """ Move servos ids to goal over deltaT milliseconds. """
+        ids = list(ids)
+        with self.lock:
+            if self.move is None:
+                # servos may have been moved by hand since, ask them
+                self.last = dict()
+            start = self.position(ids)
+            if start is None:
+                # we don't know where to start from, just go there
+                start = goal
+            self.move = (ids, frames(start, goal, deltaT, self.period, easing), time.monotonic(), 0)
+        self.start()
+        self.wake.set()
+
+    def start(self):
+        if self.thread is None:
+            self.running = True
+            self.thread = threading.Thread(target=self.run, name="pypose-interpolator", daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        """ Stop the stream thread, abandoning any move in progress. """
+        if self.thread is not None:
+            self.running = False
+            self.wake.set()
+            self.thread.join()
+            self.thread = None
+        self.move = None
+
+    def run(self):
+        while self.running:
+            self.wake.wait()
+            self.wake.clear()
+            while self.running:
+                with self.lock:
+                    if self.move is None:
+                        break
+                    ids, positions, start, frame = self.move
+                    # row k is where we want to be a period later, it goes out at start + k * period;
+                    # rows already overdue are skipped
+                    now = time.monotonic()
+                    due = min(int((now - start) / self.period), len(positions) - 1)
+                    if due > frame:
+                        self.skipped = self.skipped + due - frame
+                        frame = due
+                    self.late = max(self.late, now - (start + frame * self.period))
+                    values = positions[frame].tolist()
+                    for index, value in zip(ids, values):
+                        self.last[index] = value
+                    if frame == len(positions) - 1:
+                        self.move = None
+                    else:
+                        self.move = (ids, positions, start, frame + 1)
+                try:
+                    self.port.syncWriteWords(self.regstart, ids, values)
+                    self.sent = self.sent + 1
+                except Exception as e:
+                    print("Interpolation failed: " + str(e))
+                    self.move = None
+                    break
+                delay = start + (frame + 1) * self.period - time.monotonic()
+                if delay > 0 and self.wake.wait(delay):
+                    # a new move came in
+                    self.wake.clear()
+
+    def stats(self):
+        return {"sent": self.sent, "skipped": self.skipped, "late": self.late}
+
+    def __str__(self):
+        return (str(self.sent) + " frames sent, " + str(self.skipped) + " skipped, worst " +
+                str(int(self.late * 1000)) + "ms late")
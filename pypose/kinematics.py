@@ -0,0 +1,444 @@
+#!/usr/bin/env python3
+
+"""
+  PyPose: data-driven IK for legged models
+  Copyright (c) 2008-2010 Michael E. Ferguson.  All right reserved.
+
+  This program is free software; you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation; either version 2 of the License, or
+  (at your option) any later version.
+
+  This program is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+  GNU General Public License for more details.
+
+  You should have received a copy of the GNU General Public License
+  along with this program; if not, write to the Free Software Foundation,
+  Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+
+import numpy
+from math import cos, sin, atan2, sqrt, acos
+from pypose.ikcache import IKCache
+
+COXA = 0
+FEMUR = 1
+TIBIA = 2
+
+
+def sq(x):
+    return x * x
+
+
+def unitsPerRad(resolution=1024):
+    """Servo positions in a radian."""
+    if resolution == 4096:
+        return 651.8986469044033
+    else:
+        return 195.56959407132098
+
+
+def radToServo(rads, resolution=1024):
+    """Convert radians to servo position offset."""
+    return int(rads * unitsPerRad(resolution))
+
+
+def radToServos(rads, resolutions):
+    """radToServo over arrays, resolutions broadcast against rads."""
+    return numpy.trunc(rads * numpy.where(numpy.asarray(resolutions) == 4096, 651.8986469044033, 195.56959407132098))
+
+
+class Dim:
+    """ A body dimension: the attribute it sets, its label in the panel, its
+    default and the @ variable of the NUKE templates it fills, if any. """
+
+    def __init__(self, attr, label, default, param=None):
+        self.attr = attr
+        self.label = label
+        self.default = default
+        self.param = param
+
+
+class Leg:
+    """ A leg: its endpoint and gait keys, the prefix of its servo names,
+    where its first joint is mounted, as (sign, dimension) for X and Y
+    (dimension None for on the axis), and the signs taking the endpoint
+    from body to leg frame. """
+
+    def __init__(self, name, gait, prefix, mountX, mountY, signs=(1, 1)):
+        self.name = name
+        self.gait = gait
+        self.prefix = prefix
+        self.mountX = mountX
+        self.mountY = mountY
+        self.signs = signs
+
+    def dims(self):
+        return [d for s, d in (self.mountX, self.mountY) if d is not None]
+
+
+class Chain:
+    """ Describes a legged robot for LeggedModel.
+
+    joints are the servos of every leg, from the body out, and links the
+    dimensions holding the length of each. dims are the dimensions in the
+    panel, in groups of (label, attrs, image). rows lay the legs out in
+    the servo panel, as pairs of prefixes. options map each option, a
+    leg count, to the legs used. """
+
+    def __init__(self, joints, links, dims, groups, legs, rows, options, servos):
+        self.joints = joints
+        self.links = links
+        self.dims = dims
+        self.groups = groups
+        self.legs = legs
+        self.rows = rows
+        self.options = options
+        self.servos = servos        # default servo IDs, by name
+
+    def dim(self, attr):
+        return [d for d in self.dims if d.attr == attr][0]
+
+    def servoName(self, leg, joint):
+        return leg.prefix + " " + self.joints[joint]
+
+
+class LeggedModel(dict):
+    """ IK for any robot described by a Chain of legs with coxa, femur and
+    tibia joints: body IK moves each endpoint for the body pose, leg IK
+    turns it into servo positions, one leg after the other in the order
+    of the description. The endpoints and gait offsets are kept in the
+    model by leg name and gait key, as the NUKE editor expects. """
+
+    chain = None
+
+    bodyRotX = 0.0
+    bodyRotY = 0.0
+    bodyRotZ = 0.0
+
+    bodyPosX = 0.0
+    bodyPosY = 0.0
+
+    def __init__(self, opt=4, debug=False, gaitGen=None, cache=0):
+        self.legs = int(opt)    # option here corresponds to leg count
+        self.debug = debug      # do we print debug messages or not?
+        self.gaitGen = gaitGen  # any gait generation?
+        self.setCache(cache)
+        chain = self.chain
+        for d in chain.dims:
+            setattr(self, d.attr, d.default)
+
+        # Column 1 = Body Dimensions, need both specification of layout and data.
+        attrs = [d.attr for d in chain.dims]
+        self.vars_layout = [[label] + [attrs.index(a) for a in group] + [image] for label, group, image in chain.groups]
+        self.vars = dict([(i, [d.label, d.default]) for i, d in enumerate(chain.dims)])
+
+        # Column 3 = Servo Values, need both specification of layout and data.
+        self.servo_layout = list()
+        for row in chain.rows:
+            if len(self.servo_layout) > 0:
+                self.servo_layout = self.servo_layout + ["", ""]
+            for joint in chain.joints:
+                self.servo_layout = self.servo_layout + [prefix + " " + joint for prefix in row]
+        self.servos = dict(chain.servos)
+
+        # Used to generate servo values for IK
+        count = len(chain.joints) * self.legs + 1
+        self.mins = [512 for i in range(count)]
+        self.maxs = [512 for i in range(count)]
+        self.resolutions = [1024 for i in range(count)]
+        self.neutrals = [512 for i in range(count)]
+        self.nextPose = [512 for i in range(count)]
+        self.signs = [1 for i in range(count)]
+        self.step = 0
+
+    def setNextPose(self, servo, pos):
+        self.nextPose[servo] = pos
+
+    def activeLegs(self):
+        """ The legs the option in use drives, in solving order. """
+        names = self.chain.options[self.legs]
+        return [leg for leg in self.chain.legs if leg.name in names]
+
+    def config(self, opt, dims=None, servos=None, resolutions=None):
+        self.legs = int(opt)
+
+        # dims are in the order of the description
+        if dims is not None:
+            for d, value in zip(self.chain.dims, dims):
+                setattr(self, d.attr, value)
+
+        # servos are in the order of the servo panel
+        if servos is not None:
+            names = [name for name in self.servo_layout if name != ""]
+            for name, servo in zip(names, servos):
+                self.servos[name] = servo
+
+        # set resolution of each servo
+        if resolutions is not None:
+            self.resolutions = resolutions
+
+        # solutions for the old dimensions are no good
+        if self.cache is not None:
+            self.cache.clear()
+
+    def adjustPanel(self, panel):
+        """ Enable the dimensions and servos the legs in use need. """
+        used = set()
+        unused = set()
+        for leg in self.chain.legs:
+            if leg in self.activeLegs():
+                used.update(leg.dims())
+            else:
+                unused.update(leg.dims())
+        for d, var in zip(self.chain.dims, panel.vars):
+            if d.attr in unused and d.attr not in used:
+                var.Disable()
+            else:
+                var.Enable()
+        prefixes = [leg.prefix for leg in self.activeLegs()]
+        names = [name for name in self.servo_layout if name != ""]
+        for name, servo in zip(names, panel.servos):
+            if name.split(" ")[0] in prefixes:
+                servo.Enable()
+            else:
+                servo.Disable()
+
+    def exportParams(self):
+        """ The @VAL_ variables of the NUKE templates, and the servo ID of
+        every joint of the legs in use, by its #define name. """
+        params = dict()
+        for d in self.chain.dims:
+            if d.param is not None:
+                params[d.param] = str(getattr(self, d.attr))
+        servoMap = dict()
+        for leg in self.activeLegs():
+            for joint in range(len(self.chain.joints)):
+                name = self.chain.servoName(leg, joint)
+                servoMap[name.upper().replace(" ", "_")] = int(self.servos[name])
+        return params, servoMap
+
+    def mount(self, leg):
+        """ (Xdisp, Ydisp) of the first joint of leg. """
+        return tuple([0 if d is None else s * getattr(self, d) for s, d in (leg.mountX, leg.mountY)])
+
+    def setCache(self, size):
+        """ Memoize bodyIK and legIK in an LRU cache of size solutions, 0 for none. """
+        self.cache = None
+        if size > 0:
+            self.cache = IKCache(size)
+
+    def quanta(self, resolution):
+        """ Key scales for the servos: a key step in millimeters is what one
+        servo position moves the tip of the femur, in angle it is one
+        servo position. """
+        return unitsPerRad(resolution) / getattr(self, self.chain.links[FEMUR]), unitsPerRad(resolution)
+
+    def bodyIK(self, X, Y, Z, Xdisp, Ydisp, Zrot):
+        """ Compute offsets based on Body positions, from the cache if any. """
+        if self.cache is None:
+            return self.solveBody(X, Y, Z, Xdisp, Ydisp, Zrot)
+        mm, rad = self.quanta(max(self.resolutions))
+        key = (round(X * mm), round(Y * mm), round(Z * mm), round(Xdisp * mm), round(Ydisp * mm),
+               round(Zrot * rad), round(self.bodyRotX * rad), round(self.bodyRotY * rad),
+               round(self.bodyRotZ * rad), round(self.bodyPosX * mm), round(self.bodyPosY * mm))
+        ans = self.cache.get(key)
+        if ans is None:
+            ans = self.solveBody(X, Y, Z, Xdisp, Ydisp, Zrot)
+            self.cache.put(key, ans)
+        return list(ans)
+
+    def solveBody(self, X, Y, Z, Xdisp, Ydisp, Zrot):
+        """ Compute offsets based on Body positions.
+          BodyIK based on the work of Xan """
+        ans = [0, 0, 0]   # (X,Y,Z)
+
+        cosB = cos(self.bodyRotX)
+        sinB = sin(self.bodyRotX)
+        cosG = cos(self.bodyRotY)
+        sinG = sin(self.bodyRotY)
+        cosA = cos(self.bodyRotZ + Zrot)
+        sinA = sin(self.bodyRotZ + Zrot)
+
+        totalX = int(X + Xdisp + self.bodyPosX)
+        totalY = int(Y + Ydisp + self.bodyPosY)
+
+        ans[0] = int(totalX - int(totalX * cosG * cosA + totalY * sinB * sinG * cosA +
+                                  Z * cosB * sinG * cosA - totalY * cosB * sinA + Z * sinB * sinA)) + self.bodyPosX
+        ans[1] = int(totalY - int(totalX * cosG * sinA + totalY * sinB * sinG * sinA +
+                                  Z * cosB * sinG * sinA + totalY * cosB * cosA - Z * sinB * cosA)) + self.bodyPosY
+        ans[2] = int(Z - int(-totalX * sinG + totalY *
+                             sinB * cosG + Z * cosB * cosG))
+
+        if self.debug:
+            print("BodyIK:", ans)
+        return ans
+
+    def legIK(self, X, Y, Z, resolution):
+        """ Compute leg servo positions, from the cache if any. """
+        if self.cache is None:
+            return self.solveLeg(X, Y, Z, resolution)
+        mm, rad = self.quanta(resolution)
+        key = (round(X * mm), round(Y * mm), round(Z * mm), resolution)
+        ans = self.cache.get(key)
+        if ans is None:
+            ans = self.solveLeg(X, Y, Z, resolution)
+            self.cache.put(key, ans)
+        return list(ans)
+
+    def solveLeg(self, X, Y, Z, resolution):
+        """ Compute leg servo positions. """
+        ans = [0, 0, 0, 0]    # (coxa, femur, tibia)
+        lCoxa, lFemur, lTibia = [getattr(self, link) for link in self.chain.links]
+
+        try:
+            # first, make this a 2DOF problem... by solving coxa
+            ans[0] = radToServo(atan2(X, Y), resolution)
+            trueX = int(sqrt(sq(X) + sq(Y))) - lCoxa
+            im = int(sqrt(sq(trueX) + sq(Z)))  # length of imaginary leg
+
+            # get femur angle above horizon...
+            q1 = -atan2(Z, trueX)
+            d1 = sq(lFemur) - sq(lTibia) + sq(im)
+            d2 = 2 * lFemur * im
+            q2 = acos(d1 / float(d2))
+            ans[1] = radToServo(q1 + q2, resolution)
+
+            # and tibia angle from femur...
+            d1 = sq(lFemur) - sq(im) + sq(lTibia)
+            d2 = 2 * lTibia * lFemur
+            ans[2] = radToServo(acos(d1 / float(d2)) - 1.57, resolution)
+        except:
+            if self.debug:
+                print("LegIK FAILED")
+            return [1024, 1024, 1024, 0]
+
+        if self.debug:
+            print("LegIK:", ans)
+        return ans
+
+    def doIK(self):
+        fail = 0
+        gait = [0, 0, 0, 0]    # [x,y,z,r]
+
+        for leg in self.activeLegs():
+            if self.gaitGen is not None:
+                gait = self.gaitGen(leg.gait)
+            end = self[leg.name]
+            if self.debug:
+                print(leg.name + ": ", [end[i] + gait[i] for i in range(3)])
+            Xdisp, Ydisp = self.mount(leg)
+            sx, sy = leg.signs
+            req = self.bodyIK(end[0] + gait[0], end[1] + gait[1], end[2] + gait[2], Xdisp, Ydisp, gait[3])
+            servo = self.servos[self.chain.servoName(leg, COXA)]
+            sol = self.legIK(sx * (end[0] + req[0] + gait[0]), sy * (end[1] + req[1] + gait[1]),
+                             end[2] + req[2] + gait[2], self.resolutions[servo])
+            for joint in range(len(self.chain.joints)):
+                name = self.chain.servoName(leg, joint)
+                servo = self.servos[name]
+                output = self.neutrals[servo] + self.signs[servo] * sol[joint]
+                if output < self.maxs[servo] and output > self.mins[servo]:
+                    self.setNextPose(servo, output)
+                else:
+                    if self.debug:
+                        print(name.upper().replace(" ", "_") + " FAIL:", output)
+                    fail = fail + 1
+
+        self.step = self.step + 1
+        if self.step > 7:
+            self.step = 0  # gaitStep = (gaitStep+1)%stepsInGait
+        return fail
+
+    def batchBodyIK(self, X, Y, Z, Xdisp, Ydisp, Zrot):
+        """ bodyIK over arrays, truncating where it does. """
+        cosB = cos(self.bodyRotX)
+        sinB = sin(self.bodyRotX)
+        cosG = cos(self.bodyRotY)
+        sinG = sin(self.bodyRotY)
+        cosA = numpy.cos(self.bodyRotZ + Zrot)
+        sinA = numpy.sin(self.bodyRotZ + Zrot)
+
+        totalX = numpy.trunc(X + Xdisp + self.bodyPosX)
+        totalY = numpy.trunc(Y + Ydisp + self.bodyPosY)
+
+        ansX = totalX - numpy.trunc(totalX * cosG * cosA + totalY * sinB * sinG * cosA +
+                                    Z * cosB * sinG * cosA - totalY * cosB * sinA + Z * sinB * sinA) + self.bodyPosX
+        ansY = totalY - numpy.trunc(totalX * cosG * sinA + totalY * sinB * sinG * sinA +
+                                    Z * cosB * sinG * sinA + totalY * cosB * cosA - Z * sinB * cosA) + self.bodyPosY
+        ansZ = numpy.trunc(Z - numpy.trunc(-totalX * sinG + totalY * sinB * cosG + Z * cosB * cosG))
+        return ansX, ansY, ansZ
+
+    def batchLegIK(self, X, Y, Z, resolutions):
+        """ legIK over arrays: (coxa, femur, tibia, solved), where legIK
+        would have failed each of coxa, femur and tibia is 1024. """
+        lCoxa, lFemur, lTibia = [getattr(self, link) for link in self.chain.links]
+        coxa = radToServos(numpy.arctan2(X, Y), resolutions)
+        trueX = numpy.trunc(numpy.sqrt(X * X + Y * Y)) - lCoxa
+        im = numpy.trunc(numpy.sqrt(trueX * trueX + Z * Z))
+
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            q1 = -numpy.arctan2(Z, trueX)
+            d1 = sq(lFemur) - sq(lTibia) + im * im
+            d2 = 2 * lFemur * im
+            q2 = numpy.arccos(d1 / d2)
+            femur = radToServos(q1 + q2, resolutions)
+
+            d1 = sq(lFemur) - im * im + sq(lTibia)
+            d2 = 2 * lTibia * lFemur
+            tibia = radToServos(numpy.arccos(d1 / float(d2)) - 1.57, resolutions)
+
+        solved = numpy.isfinite(femur) & numpy.isfinite(tibia)
+        coxa = numpy.where(solved, coxa, 1024)
+        femur = numpy.where(solved, femur, 1024)
+        tibia = numpy.where(solved, tibia, 1024)
+        return coxa, femur, tibia, solved
+
+    def batchIK(self, endpoints=None, gaits=None):
+        """ doIK for many steps at once, without touching nextPose.
+
+        endpoints are the feet, (steps x legs x 3) or (legs x 3) in the
+        order of the legs in use, by default where they are now. gaits are
+        offsets to them, (x, y, z, rotation) per leg and step, like gaitGen
+        gives. Returns (positions, reachable), both (steps x servos) for
+        servo IDs 1 and up: reachable is False where doIK would have failed
+        and kept the last position. """
+        legs = self.activeLegs()
+        if endpoints is None:
+            endpoints = [self[leg.name][0:3] for leg in legs]
+        endpoints = numpy.asarray(endpoints, dtype=float)
+        if endpoints.ndim == 2:
+            endpoints = endpoints[numpy.newaxis]
+        steps = len(endpoints)
+        if gaits is None:
+            gaits = numpy.zeros((steps, len(legs), 4))
+        gaits = numpy.broadcast_to(numpy.asarray(gaits, dtype=float), (steps, len(legs), 4))
+
+        # first joint mounts, and the signs going into legIK
+        mounts = numpy.array([self.mount(leg) for leg in legs], dtype=float)
+        signs = numpy.array([leg.signs for leg in legs], dtype=float)
+        ids = numpy.array([[self.servos[self.chain.servoName(leg, joint)] for joint in range(len(self.chain.joints))]
+                           for leg in legs])
+
+        X = endpoints[:, :, 0] + gaits[:, :, 0]
+        Y = endpoints[:, :, 1] + gaits[:, :, 1]
+        Z = endpoints[:, :, 2] + gaits[:, :, 2]
+        reqX, reqY, reqZ = self.batchBodyIK(X, Y, Z, mounts[:, 0], mounts[:, 1], gaits[:, :, 3])
+        resolutions = numpy.array(self.resolutions)[ids[:, COXA]]
+        sol = self.batchLegIK(signs[:, 0] * (endpoints[:, :, 0] + reqX + gaits[:, :, 0]),
+                              signs[:, 1] * (endpoints[:, :, 1] + reqY + gaits[:, :, 1]),
+                              endpoints[:, :, 2] + reqZ + gaits[:, :, 2], resolutions)
+
+        neutrals = numpy.array(self.neutrals)
+        mins = numpy.array(self.mins)
+        maxs = numpy.array(self.maxs)
+        servoSigns = numpy.array(self.signs)
+        positions = numpy.tile(neutrals[1:], (steps, 1))
+        reachable = numpy.ones(positions.shape, dtype=bool)
+        for joint in range(len(self.chain.joints)):
+            servo = ids[:, joint]
+            output = (neutrals[servo] + servoSigns[servo] * sol[joint]).astype(int)
+            positions[:, servo - 1] = output
+            reachable[:, servo - 1] = (output < maxs[servo]) & (output > mins[servo])
+        return positions, reachable
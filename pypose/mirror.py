@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+
+"""
+  PyPose: host-side mirror of the AX-12 control tables
+  Copyright (c) 2008-2010 Michael E. Ferguson.  All right reserved.
+
+  This program is free software; you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation; either version 2 of the License, or
+  (at your option) any later version.
+
+  This program is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+  GNU General Public License for more details.
+
+  You should have received a copy of the GNU General Public License
+  along with this program; if not, write to the Free Software Foundation,
+  Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+
+import time
+from pypose import ax12
+
+# the control table, EEPROM first then RAM
+TABLE_SIZE = ax12.P_PUNCH_H + 1
+EEPROM_END = ax12.P_TORQUE_ENABLE
+# how long a RAM register read is good for, in seconds
+RAM_TTL = 0.05
+
+
+class ServoTable:
+    """ The mirrored control table of one servo. """
+
+    def __init__(self):
+        self.values = bytearray(TABLE_SIZE)
+        self.fetched = [None] * TABLE_SIZE     # monotonic time of each byte, None if unknown
+
+
+class RegisterMirror:
+    """ Caches the control table of every servo we talk to.
+
+    EEPROM registers only change when we write them, so once read they are
+    served from the mirror for good. RAM registers are served for ttl
+    seconds after they were read or written. Writes go through to the
+    mirror; a reset, or a change of ID or baud rate, drops the servo. """
+
+    def __init__(self, ttl=RAM_TTL):
+        self.ttl = ttl
+        self.servos = dict()        # id -> ServoTable
+        # statistics
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, index, regstart, rlength):
+        """ The mirrored values as a list, or None if any of them is stale. """
+        table = self.servos.get(index)
+        end = regstart + rlength
+        if table is None or end > TABLE_SIZE:
+            self.misses = self.misses + 1
+            return None
+        oldest = time.monotonic() - self.ttl
+        for reg in range(regstart, end):
+            fetched = table.fetched[reg]
+            if fetched is None or (reg >= EEPROM_END and fetched < oldest):
+                self.misses = self.misses + 1
+                return None
+        self.hits = self.hits + 1
+        return list(table.values[regstart:end])
+
+    def store(self, index, regstart, values):
+        """ Record values read from, or written to, servo index. """
+        if index == 0xFE:
+            # broadcast, we don't know who heard it
+            self.invalidate()
+            return
+        end = min(regstart + len(values), TABLE_SIZE)
+        if end <= regstart:
+            return
+        table = self.servos.get(index)
+        if table is None:
+            table = self.servos[index] = ServoTable()
+        now = time.monotonic()
+        table.values[regstart:end] = bytes(values[:end - regstart])
+        for reg in range(regstart, end):
+            table.fetched[reg] = now
+
+    def written(self, index, regstart, values):
+        """ A write to servo index went through. """
+        end = regstart + len(values)
+        if regstart <= ax12.P_ID < end:
+            # the servo now answers to another ID, nothing is known about that one
+            self.invalidate(index)
+            self.invalidate(values[ax12.P_ID - regstart])
+        elif regstart <= ax12.P_BAUD_RATE < end:
+            # and now it talks at another speed
+            self.invalidate(index)
+        else:
+            self.store(index, regstart, values)
+
+    def invalidate(self, index=None, regstart=0, rlength=TABLE_SIZE):
+        """ Forget registers of index (or every servo, also on broadcast). """
+        if index is None or index == 0xFE:
+            indices = list(self.servos.keys())
+        else:
+            indices = [index]
+        for index in indices:
+            if index not in self.servos:
+                continue
+            if regstart == 0 and rlength >= TABLE_SIZE:
+                del self.servos[index]
+                continue
+            table = self.servos[index]
+            for reg in range(regstart, min(regstart + rlength, TABLE_SIZE)):
+                table.fetched[reg] = None
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "servos": len(self.servos)}
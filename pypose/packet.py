@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+
+"""
+  PyPose: packet encoding for AX-12 and arbotiX instructions
+  Copyright (c) 2008-2010 Michael E. Ferguson.  All right reserved.
+
+  This program is free software; you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation; either version 2 of the License, or
+  (at your option) any later version.
+
+  This program is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+  GNU General Public License for more details.
+
+  You should have received a copy of the GNU General Public License
+  along with this program; if not, write to the Free Software Foundation,
+  Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+
+import struct
+from pypose import ax12
+
+# a packet is FF FF ID LENGTH INS PARAM .. CHECKSUM, LENGTH is one byte
+MAX_PACKET = 4 + 255
+
+
+class PacketBuilder:
+    """ Encodes instruction packets into one preallocated buffer.
+
+    Every method returns a memoryview of the buffer holding the finished
+    packet(s). The view is only valid until the next call, so write it out
+    (or copy it) straight away. """
+
+    def __init__(self, size=MAX_PACKET):
+        self.buf = bytearray(size)
+        self.view = memoryview(self.buf)
+        self.structs = dict()   # format -> struct.Struct
+
+    def reserve(self, size):
+        """ Make sure the buffer can hold size bytes. """
+        if len(self.buf) < size:
+            # views handed out earlier pin the old buffer, so swap in a new one
+            self.buf = bytearray(max(size, 2 * len(self.buf)))
+            self.view = memoryview(self.buf)
+
+    def struct(self, fmt):
+        """ Cached struct.Struct for fmt. """
+        s = self.structs.get(fmt)
+        if s is None:
+            s = self.structs[fmt] = struct.Struct(fmt)
+        return s
+
+    def header(self, offset, index, length, ins):
+        buf = self.buf
+        buf[offset] = 0xFF
+        buf[offset + 1] = 0xFF
+        buf[offset + 2] = index
+        buf[offset + 3] = length
+        buf[offset + 4] = ins
+
+    def checksum(self, offset, end):
+        """ Write the checksum for the packet in buf[offset:end], return its end. """
+        self.buf[end] = 255 - (sum(self.view[offset + 2:end]) % 256)
+        return end + 1
+
+    def instruction(self, index, ins, params):
+        """ A packet with arbitrary parameters. """
+        n = len(params)
+        self.header(0, index, n + 2, ins)
+        self.buf[5:5 + n] = bytes(params)
+        return self.view[:self.checksum(0, 5 + n)]
+
+    def reads(self, ids, regstart, rlength):
+        """ Back-to-back READ_DATA packets, one for each id. """
+        self.reserve(8 * len(ids))
+        offset = 0
+        for index in ids:
+            self.header(offset, index, 4, ax12.AX_READ_DATA)
+            self.buf[offset + 5] = regstart
+            self.buf[offset + 6] = rlength
+            offset = self.checksum(offset, offset + 7)
+        return self.view[:offset]
+
+    def syncWrite(self, regstart, vals):
+        """ A SYNC_WRITE packet, vals is ((id1, val1, val2), (id2, val1, val2)) """
+        per = len(vals[0])
+        n = 2 + per * len(vals)
+        self.header(0, 0xFE, n + 2, ax12.AX_SYNC_WRITE)
+        buf = self.buf
+        buf[5] = regstart
+        buf[6] = per - 1
+        offset = 7
+        for servo in vals:
+            buf[offset:offset + per] = bytes(servo)
+            offset = offset + per
+        return self.view[:self.checksum(0, offset)]
+
+    def syncWords(self, regstart, ids, words):
+        """ A SYNC_WRITE packet setting one 16-bit register on each id. """
+        count = len(ids)
+        self.header(0, 0xFE, 3 * count + 4, ax12.AX_SYNC_WRITE)
+        self.buf[5] = regstart
+        self.buf[6] = 2
+        args = list()
+        for index, word in zip(ids, words):
+            args.append(index)
+            args.append(word)
+        self.struct("<" + "BH" * count).pack_into(self.buf, 7, *args)
+        return self.view[:self.checksum(0, 7 + 3 * count)]
+
+    def pose(self, slot, pose):
+        """ An ARB_LOAD_POSE packet: slot then every position as a word. """
+        count = len(pose)
+        self.header(0, ax12.ARB_ID, 2 * count + 3, ax12.ARB_LOAD_POSE)
+        self.struct("<B%dH" % count).pack_into(self.buf, 5, slot, *pose)
+        return self.view[:self.checksum(0, 6 + 2 * count)]
+
+    def sequence(self, transitions):
+        """ An ARB_LOAD_SEQ packet from (pose slot, time) pairs, with the stop mark. """
+        count = len(transitions) + 1
+        self.header(0, ax12.ARB_ID, 3 * count + 2, ax12.ARB_LOAD_SEQ)
+        args = list()
+        for slot, time in transitions:
+            args.append(slot)
+            args.append(time)
+        args.append(255)    # notice to stop
+        args.append(0)      # time is irrelevant on stop
+        self.struct("<" + "BH" * count).pack_into(self.buf, 5, *args)
+        return self.view[:self.checksum(0, 5 + 3 * count)]
+
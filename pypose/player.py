@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+
+"""
+  PyPose: host-side sequence player
+  Copyright (c) 2008-2010 Michael E. Ferguson.  All right reserved.
+
+  This program is free software; you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation; either version 2 of the License, or
+  (at your option) any later version.
+
+  This program is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+  GNU General Public License for more details.
+
+  You should have received a copy of the GNU General Public License
+  along with this program; if not, write to the Free Software Foundation,
+  Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+
+import time
+import threading
+from collections import deque
+import numpy
+from pypose import ax12
+from pypose.coalesce import FRAME_LENGTH
+from pypose.interpolate import EASINGS
+
+# frames kept for jitter(), about a minute at 30Hz
+LATENESS_HISTORY = 2048
+
+
+def transitions(project, name):
+    """ The (positions, milliseconds) transitions of a sequence of project. """
+    result = list()
+    for t in project.sequences[name]:
+        pose = t[0:t.find("|")]
+        dt = int(t[t.find("|") + 1:])
+        result.append((list(project.poses[pose]), dt))
+    return result
+
+
+class SequencePlayer:
+    """ Plays a sequence by streaming interpolated frames, like the arbotiX does.
+
+    The first transition starts from where the servos are. Every frame goes
+    out as one sync write at start + k * period, on the monotonic clock; the
+    position sent is computed from the time the frame is due, so a late
+    frame neither slows down nor shifts the sequence. Frames more than a
+    period late are skipped and counted as overruns. speed scales sequence
+    time and can be changed while playing. """
+
+    def __init__(self, port, ids, period=FRAME_LENGTH, easing="linear"):
+        self.port = port
+        self.ids = list(ids)
+        self.period = period
+        self.easing = EASINGS[easing]
+        self.speed = 1.0
+        self.thread = None
+        self.running = False
+        self.loop = False
+        self.halted = threading.Event()
+        self.resetStats()
+
+    def resetStats(self):
+        self.frames = 0             # frames sent
+        self.overruns = 0           # frames skipped, the host fell behind
+        self.lateness = deque(maxlen=LATENESS_HISTORY)  # seconds the last frames went out after they were due
+
+    def play(self, transitions, loop=False):
+        """ Play (positions, milliseconds) transitions, once or looping. """
+        self.halt()
+        if len(transitions) == 0:
+            return
+        values = self.port.readMany(self.ids, ax12.P_PRESENT_POSITION_L, 2)
+        start = list()
+        for servo, index in enumerate(self.ids):
+            vals = values.get(index, -1)
+            if vals == -1:
+                # we don't know, start from the first pose
+                start.append(transitions[0][0][servo])
+            else:
+                start.append(vals[0] + (vals[1] << 8))
+        self.poses = numpy.array([start] + [positions[:len(self.ids)] for positions, dt in transitions], dtype=float)
+        self.times = numpy.cumsum([0] + [dt / 1000.0 for positions, dt in transitions])
+        self.loop = loop
+        self.resetStats()
+        self.halted.clear()
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name="pypose-player", daemon=True)
+        self.thread.start()
+
+    def halt(self):
+        """ Stop playing, the servos hold the last frame. """
+        if self.thread is not None:
+            self.running = False
+            self.halted.set()
+            if threading.current_thread() is not self.thread:
+                self.thread.join()
+            self.thread = None
+
+    def playing(self):
+        return self.thread is not None and self.running
+
+    def setSpeed(self, speed):
+        """ Scale sequence time: 2.0 plays twice as fast. """
+        self.speed = max(0.01, float(speed))
+
+    def positions(self, t):
+        """ Where the servos should be t seconds into the sequence. """
+        total = self.times[-1]
+        if t >= total:
+            return self.poses[-1]
+        i = int(numpy.searchsorted(self.times, t, side="right")) - 1
+        duration = self.times[i + 1] - self.times[i]
+        s = 1.0
+        if duration > 0:
+            s = self.easing((t - self.times[i]) / duration)
+        return self.poses[i] + s * (self.poses[i + 1] - self.poses[i])
+
+    def run(self):
+        start = time.monotonic()
+        frame = 0
+        seqTime = 0.0       # sequence time of the last frame
+        while self.running:
+            due = start + frame * self.period
+            now = time.monotonic()
+            if now - due > self.period:
+                # fell behind, skip to the frame due now
+                skip = int((now - due) / self.period)
+                self.overruns = self.overruns + skip
+                frame = frame + skip
+                seqTime = seqTime + skip * self.period * self.speed
+                due = start + frame * self.period
+            elif due > now:
+                if self.halted.wait(due - now):
+                    break
+                now = time.monotonic()
+            self.lateness.append(now - due)
+            seqTime = seqTime + self.period * self.speed
+            total = self.times[-1]
+            if self.loop and seqTime > total and total > 0:
+                # every lap after the first starts from the last pose
+                seqTime = seqTime % total
+                self.poses[0] = self.poses[-1]
+            goal = numpy.rint(self.positions(seqTime)).astype(int).tolist()
+            try:
+                self.port.syncWriteWords(ax12.P_GOAL_POSITION_L, self.ids, goal)
+            except Exception as e:
+                print("Sequence failed: " + str(e))
+                break
+            self.frames = self.frames + 1
+            frame = frame + 1
+            if not self.loop and seqTime >= total:
+                break
+        self.running = False
+
+    def jitter(self):
+        """ Frame timing: how late the last LATENESS_HISTORY frames were, in
+        milliseconds, and overruns. """
+        if len(self.lateness) == 0:
+            return {"frames": 0, "overruns": self.overruns}
+        late = numpy.array(self.lateness) * 1000.0
+        return {"frames": self.frames, "overruns": self.overruns, "rate": 1.0 / self.period,
+                "mean": float(late.mean()), "std": float(late.std()),
+                "p99": float(numpy.percentile(late, 99)), "max": float(late.max())}
+
+    def __str__(self):
+        j = self.jitter()
+        if j["frames"] == 0:
+            return "no frames sent"
+        return (str(j["frames"]) + " frames at " + str(int(j["rate"])) + "Hz, " + str(j["overruns"]) +
+                " overruns, late by %.2fms mean, %.2fms std, %.2fms p99, %.2fms max" %
+                (j["mean"], j["std"], j["p99"], j["max"]))
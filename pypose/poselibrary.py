@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+
+"""
+  PyPose: pose library, every pose of a project in one array
+  Copyright (c) 2008-2010 Michael E. Ferguson.  All right reserved.
+
+  This program is free software; you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation; either version 2 of the License, or
+  (at your option) any later version.
+
+  This program is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+  GNU General Public License for more details.
+
+  You should have received a copy of the GNU General Public License
+  along with this program; if not, write to the Free Software Foundation,
+  Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+
+from collections.abc import MutableMapping
+import numpy
+
+# degrees spanned by the full range of a servo, by resolution:
+# AX-12 (1024) cover 300 degrees, MX (4096) a whole turn
+DEGREES = {1024: 300.0, 4096: 360.0}
+# rows allocated when the library is empty
+ROWS = 64
+
+
+def span(resolution):
+    """ Degrees covered by the resolution units of a servo. """
+    if resolution not in DEGREES:
+        raise ValueError("unknown servo resolution " + str(resolution))
+    return DEGREES[resolution]
+
+
+class PoseView:
+    """ One pose of a PoseLibrary, used like a Pose: indexing, slices, len,
+    iteration, str and [512, ] + pose all work, and writes go straight to
+    the library. A view is only good while its pose is in the library. """
+
+    def __init__(self, library, row):
+        self.library = library
+        self.row = row
+
+    @property
+    def array(self):
+        """ The positions, as a numpy view of the library row. """
+        return self.library.data[self.row]
+
+    def tolist(self):
+        return self.array.tolist()
+
+    def __len__(self):
+        return self.library.width
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return self.array[i].tolist()
+        return int(self.array[i])
+
+    def __setitem__(self, i, value):
+        self.array[i] = value
+
+    def __iter__(self):
+        return iter(self.tolist())
+
+    def __eq__(self, other):
+        try:
+            return self.tolist() == list(other)
+        except TypeError:
+            return NotImplemented
+
+    def __add__(self, other):
+        return self.tolist() + list(other)
+
+    def __radd__(self, other):
+        return list(other) + self.tolist()
+
+    def __str__(self):
+        return ", ".join([str(p) for p in self.tolist()])
+
+    def __repr__(self):
+        return "PoseView(" + repr(self.tolist()) + ")"
+
+
+class PoseLibrary(MutableMapping):
+    """ The poses of a project, by name, stored as the rows of one 2-D array
+    so edits over many poses are single numpy operations.
+
+    library[name] gives a PoseView of the row; assigning any sequence of
+    positions copies them in, padded with 512 or cut to width, as a Pose
+    is. Names keep their insertion order, like the dict they replace.
+    Operations over poses take names, by default every pose but the ik_
+    ones, and poses can be given by name or as positions. """
+
+    def __init__(self, width=18):
+        self.width = width
+        self.data = numpy.full((0, width), 512, dtype=numpy.int32)
+        self.rows = dict()          # name -> row
+        self.free = list()          # rows of deleted poses
+
+    # mapping
+
+    def __getitem__(self, name):
+        return PoseView(self, self.rows[name])
+
+    def __setitem__(self, name, positions):
+        positions = list(positions)[:self.width]
+        if name not in self.rows:
+            self.rows[name] = self.allocate()
+        row = self.data[self.rows[name]]
+        row[:len(positions)] = positions
+        row[len(positions):] = 512
+
+    def __delitem__(self, name):
+        self.free.append(self.rows.pop(name))
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, name):
+        return name in self.rows
+
+    def allocate(self):
+        """ A row for a new pose, growing the array by doubling. """
+        if len(self.free) > 0:
+            return self.free.pop()
+        used = len(self.rows)
+        if used == len(self.data):
+            grown = numpy.full((max(ROWS, 2 * used), self.width), 512, dtype=numpy.int32)
+            grown[:used] = self.data
+            self.data = grown
+        return used
+
+    # selection
+
+    def select(self, names=None):
+        """ Rows of names, every pose but the ik_ ones by default. """
+        if names is None:
+            names = [name for name in self.rows if not name.startswith("ik_")]
+        elif isinstance(names, str):
+            names = [names]
+        return numpy.array([self.rows[name] for name in names], dtype=numpy.intp)
+
+    def positions(self, pose):
+        """ A pose given by name, view or positions, as an array. """
+        if isinstance(pose, str):
+            return self.data[self.rows[pose]]
+        if isinstance(pose, PoseView):
+            return pose.array
+        return numpy.asarray(pose)
+
+    def array(self, names=None):
+        """ Positions of names as a (poses x servos) array, a copy. """
+        return self.data[self.select(names)]
+
+    # operations
+
+    def clamp(self, lower="ik_min", upper="ik_max", names=None):
+        """ Limit poses to lower and upper, returns how many positions moved. """
+        rows = self.select(names)
+        before = self.data[rows]
+        after = numpy.clip(before, self.positions(lower), self.positions(upper))
+        self.data[rows] = after
+        return int(numpy.count_nonzero(before != after))
+
+    def offset(self, delta, names=None):
+        """ Add delta, a pose or positions, to poses; a minus sign is
+        welcome: library.offset(-library.positions("ik_neutral")). """
+        rows = self.select(names)
+        self.data[rows] = self.data[rows] + self.positions(delta)
+
+    def diff(self, a, b=None, names=None):
+        """ b - a for two poses, or, without b, every pose in names minus a. """
+        if b is None:
+            return self.array(names) - self.positions(a)
+        return self.positions(b) - self.positions(a)
+
+    def blend(self, a, b, t, name=None):
+        """ Positions t of the way from pose a to pose b; t may be one value
+        or one per servo. Stored as name if given. """
+        a = self.positions(a)
+        b = self.positions(b)
+        positions = numpy.rint(a + numpy.asarray(t, dtype=float) * (b - a)).astype(numpy.int32)
+        if name is not None:
+            self[name] = positions.tolist()
+        return positions
+
+    def mirror(self, pairs, neutral="ik_neutral", names=None, reflect=True):
+        """ Swap left and right: pairs are (left, right) servo ids, counted
+        from 1. Each position is moved over to its partner servo, reflected
+        about the neutral positions when the two are mounted mirror image.
+        neutral is a pose, or positions: [512] * servos centers AX-12s. """
+        rows = self.select(names)
+        neutral = self.positions(neutral)
+        left = numpy.array([l - 1 for l, r in pairs], dtype=numpy.intp)
+        right = numpy.array([r - 1 for l, r in pairs], dtype=numpy.intp)
+        before = self.data[rows]
+        after = before.copy()
+        if reflect:
+            after[:, right] = neutral[right] - (before[:, left] - neutral[left])
+            after[:, left] = neutral[left] - (before[:, right] - neutral[right])
+        else:
+            after[:, right] = before[:, left]
+            after[:, left] = before[:, right]
+        self.data[rows] = after
+
+    def convert(self, source, target, names=None):
+        """ Change poses from source to target resolution, one value for all
+        servos or one per servo, keeping angles. Positions past the range of
+        the target are held at its end; returns how many were. """
+        width = self.width
+        source = numpy.broadcast_to(numpy.asarray(source), (width,))
+        target = numpy.broadcast_to(numpy.asarray(target), (width,))
+        # units per degree and centers, per servo
+        scale = (numpy.array([r / span(r) for r in target.tolist()]) /
+                 numpy.array([r / span(r) for r in source.tolist()]))
+        rows = self.select(names)
+        units = self.data[rows] - source // 2
+        positions = numpy.rint(target // 2 + units * scale)
+        clipped = numpy.clip(positions, 0, target - 1)
+        self.data[rows] = clipped
+        return int(numpy.count_nonzero(clipped != positions))
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+
+"""
+  PyPose: binary project files (.ppb)
+  Copyright (c) 2008-2010 Michael E. Ferguson.  All right reserved.
+
+  This program is free software; you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation; either version 2 of the License, or
+  (at your option) any later version.
+
+  This program is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+  GNU General Public License for more details.
+
+  You should have received a copy of the GNU General Public License
+  along with this program; if not, write to the Free Software Foundation,
+  Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+
+import struct
+import numpy
+
+EXTENSION = ".ppb"
+MAGIC = b"PPB1"
+# magic, servo count, poses, sequences, transitions, strings, bytes of text
+HEADER = struct.Struct("<4sIIIIII")
+# a transition whose text isn't "pose|time" is kept whole, with this time
+RAW = -0x80000000
+
+# A .ppb file is the header, then these sections, each padded to 4 bytes:
+#   resolution      uint16[servos]
+#   poses           uint16[poses][servos], in the order of the pose names
+#   transitions     int32[transitions][2], string index of the pose and time
+#   sequences       uint32[sequences + 1], first transition of each sequence
+#   strings         uint32[strings + 1], offset of each string in the text
+#   text            utf-8
+# Strings are the project name, the NUKE settings, pose names, sequence
+# names, then any other pose names used by transitions.
+
+
+def padded(n):
+    return (n + 3) & ~3
+
+
+def save(project, filename):
+    """ Write project to filename as a .ppb file. """
+    names = list(project.poses.keys())
+    seqnames = list(project.sequences.keys())
+    strings = [project.name, project.nuke] + names + seqnames
+    index = dict([(name, 2 + i) for i, name in enumerate(names)])
+    transitions = list()
+    starts = [0]
+    for s in seqnames:
+        for t in project.sequences[s]:
+            pose, time = t[0:t.find("|")], t[t.find("|") + 1:]
+            try:
+                if t.find("|") < 0 or str(int(time)) != time:
+                    raise ValueError
+                time = int(time)
+            except ValueError:
+                pose, time = t, RAW
+            if pose not in index:
+                index[pose] = len(strings)
+                strings.append(pose)
+            transitions.append((index[pose], time))
+        starts.append(len(transitions))
+
+    count = project.count
+    poses = numpy.full((len(names), count), 512, dtype="<u2")
+    for i, name in enumerate(names):
+        pose = list(project.poses[name])[:count]
+        for servo, value in enumerate(pose):
+            if not 0 <= value <= 0xffff:
+                raise ValueError("pose " + name + " has " + str(value) + " for servo " + str(servo + 1) +
+                                 ", which doesn't fit in 16 bits")
+        poses[i, :len(pose)] = pose
+    resolution = numpy.full(count, 1024, dtype="<u2")
+    resolution[:len(project.resolution[:count])] = project.resolution[:count]
+    text = [s.encode("utf-8") for s in strings]
+    offsets = numpy.cumsum([0] + [len(s) for s in text]).astype("<u4")
+    text = b"".join(text)
+
+    sections = [resolution.tobytes(), poses.tobytes(),
+                numpy.array(transitions, dtype="<i4").reshape(-1, 2).tobytes(),
+                numpy.array(starts, dtype="<u4").tobytes(), offsets.tobytes(), text]
+    with open(filename, "wb") as f:
+        f.write(HEADER.pack(MAGIC, count, len(names), len(seqnames), len(transitions), len(strings), len(text)))
+        for section in sections:
+            f.write(section)
+            f.write(bytes(padded(len(section)) - len(section)))
+
+
+def read(filename):
+    """ Read a .ppb file, returns (name, nuke, count, resolution, poses, sequences),
+    poses as name -> list of positions and sequences as name -> list of
+    "pose|time". The file is read in one go, every table is a view of it. """
+    data = numpy.fromfile(filename, dtype=numpy.uint8)
+    magic, count, nposes, nseqs, ntrans, nstrings, ntext = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError(filename + " is not a PyPose binary project")
+    offset = HEADER.size
+
+    def section(dtype, n):
+        nonlocal offset
+        view = numpy.frombuffer(data, dtype=dtype, count=n, offset=offset)
+        offset = offset + padded(n * numpy.dtype(dtype).itemsize)
+        return view
+    resolution = section("<u2", count)
+    poses = section("<u2", nposes * count).reshape(nposes, count)
+    transitions = section("<i4", ntrans * 2).reshape(ntrans, 2)
+    starts = section("<u4", nseqs + 1)
+    offsets = section("<u4", nstrings + 1)
+    text = section(numpy.uint8, ntext).tobytes()
+    strings = [text[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(nstrings)]
+
+    poses = dict(zip(strings[2:2 + nposes], poses.tolist()))
+    sequences = dict()
+    transitions = transitions.tolist()
+    for i in range(nseqs):
+        sequence = list()
+        for pose, time in transitions[starts[i]:starts[i + 1]]:
+            if time == RAW:
+                sequence.append(strings[pose])
+            else:
+                sequence.append(strings[pose] + "|" + str(time))
+        sequences[strings[2 + nposes + i]] = sequence
+    return (strings[0], strings[1], count, resolution.tolist(), poses, sequences)
@@ -19,22 +19,151 @@
   Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
 """
 
+import struct
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from pypose import ppb
+from pypose import exporter
+from pypose.poselibrary import PoseLibrary
+
+# with workers, files with more lines than this are parsed in parallel, in
+# chunks; only where workers can be forked, a spawned one would import the
+# GUI again
+PARALLEL_LINES = 20000
+CHUNK_LINES = 5000
+# problems printed by Project.load, the rest are only counted
+SHOW_PROBLEMS = 10
+
+
+class ParseError(ValueError):
+    """ A problem in a project file, at line and col (counted from 1). """
+
+    def __init__(self, message, line=0, col=0):
+        ValueError.__init__(self, message, line, col)
+        self.message = message
+        self.line = line
+        self.col = col
+
+    def __str__(self):
+        return "line " + str(self.line) + ", col " + str(self.col) + ": " + self.message
+
+
+def problem(message, strict, problems, line, col):
+    """ Raise the problem when strict, else note it in problems (if any). """
+    if strict:
+        raise ParseError(message, line, col)
+    if problems is not None:
+        problems.append(ParseError(message, line, col))
+
+
+def poseValues(text, length, strict=False, problems=None, line=0, col=1):
+    """ The positions in the comma separated text of a pose, in one pass.
+
+    As a pose always was read: a position that isn't an integer ends it,
+    missing positions are 512 and extra ones are ignored. text starts at
+    col of line, for reporting. """
+    fields = text.split(",", length)
+    if len(fields) == length:
+        # the common case, exactly length positions
+        try:
+            return list(map(int, fields))
+        except ValueError:
+            pass
+    values = list()
+    start = 0
+    end = 0
+    while len(values) < length:
+        end = text.find(",", start)
+        field = text[start:] if end < 0 else text[start:end]
+        try:
+            values.append(int(field))
+        except ValueError:
+            problem("'" + field.strip() + "' is not a position", strict, problems, line, col + start)
+            break
+        if end < 0:
+            break
+        start = end + 1
+    if len(values) < length:
+        problem(str(length - len(values)) + " positions missing, set to 512", strict, problems, line, col + len(text))
+        values.extend([512] * (length - len(values)))
+    elif end >= 0 and text[start:].strip() != "":
+        problem("more than " + str(length) + " positions", strict, problems, line, col + start)
+    return values
+
+
+def sequenceValues(text, strict=False, problems=None, line=0, col=1):
+    """ The pose|time transitions in the comma separated text of a sequence,
+    in one pass, as a sequence always was read. text starts at col of line,
+    for reporting. """
+    values = list()
+    start = 0
+    while True:
+        end = text.find(",", start)
+        if end > start:
+            field = text[start:end].strip()
+        elif start < len(text):
+            # an empty field takes the rest of the line, as it always did
+            field = text[start:].strip()
+        else:
+            break
+        values.append(field)
+        bar = field.find("|")
+        if bar <= 0:
+            problem("'" + field + "' is not a pose|time transition", strict, problems, line, col + start)
+        else:
+            try:
+                int(field[bar + 1:])
+            except ValueError:
+                problem("'" + field[bar + 1:] + "' is not a time", strict, problems, line, col + start)
+        if end < 0:
+            break
+        start = end + 1
+    return values
+
+
+def parseLines(lines, first, count, strict=False):
+    """ Parse the pose, sequence and NUKE lines of a project file, lines[0]
+    being line number first. Returns the entries, as (kind, name, values),
+    and the problems found. """
+    entries = list()
+    problems = list()
+    for n, line in enumerate(lines):
+        n = n + first
+        line = line.rstrip()
+        if line == "":
+            continue
+        if line[0:5] == "Nuke=":
+            entries.append(("nuke", "", line[5:]))
+            continue
+        if line[0:5] == "Pose=":
+            kind, skip = "pose", 5
+        elif line[0:4] == "Seq=":
+            kind, skip = "seq", 4
+        else:
+            # these lines can be removed later, once everyone is moved to Ver 0.91
+            kind, skip = "pose", 0
+        colon = line.find(":", skip)
+        if colon < 0:
+            problem("expected name:values", strict, problems, n, skip + 1)
+            continue
+        if kind == "pose":
+            values = poseValues(line[colon + 1:], count, strict, problems, n, colon + 2)
+        else:
+            values = sequenceValues(line[colon + 1:], strict, problems, n, colon + 2)
+        entries.append((kind, line[skip:colon], values))
+    return entries, problems
+
+
+def parseChunk(args):
+    """ parseLines for a worker process. """
+    return parseLines(*args)
+
 
 class Pose(list):
     """Class to hold a pose."""
     def __init__(self, line, length):
         # now load the name, positions for this pose
-        try:
-            for servo in range(length):
-                if line.find(",") > 0:
-                    self.append(int(line[0:line.index(",")]))
-                else:
-                    self.append(int(line[0:]))
-                line = line[line.index(",") + 1:]
-        # we may not have enough data, so dump it
-        except BaseException:
-            for i in range(length - len(self)):
-                self.append(512)
+        self.extend(poseValues(line, length))
 
     def __str__(self):
         return ", ".join([str(p) for p in self])
@@ -48,17 +177,8 @@ class Sequence(list):
     """
     def __init__(self, line=None):
         # load the name, (pose,time) pairs for this sequence
-        try:
-            if line is None:
-                return
-            while True:
-                if line.find(",") > 0:
-                    self.append(line[0:line.index(",")].strip().rstrip())
-                elif line != "":
-                    self.append(line.strip().rstrip())
-                line = line[line.index(",") + 1:]
-        except BaseException:
-            pass
+        if line is not None:
+            self.extend(sequenceValues(line))
 
     def __str__(self):
         return ", ".join([str(t) for t in self])
@@ -70,39 +190,83 @@ class Project:
         self.name = ""
         self.count = 18
         self.resolution = [1024 for i in range(self.count)]
-        self.poses = dict()
+        self.poses = PoseLibrary(self.count)
         self.sequences = dict()
         self.nuke = ""
         self.save = False
 
-    def load(self, filename):
-        self.poses = dict()
+    def load(self, filename, strict=False, workers=1):
+        """ Load a project, .ppb or .ppr text. Problems in a text file are
+        printed and kept in self.problems; with strict, the first one raises
+        a ParseError instead. Big text files may be parsed by workers
+        processes, see PARALLEL_LINES. """
+        self.problems = list()
+        if filename.endswith(ppb.EXTENSION):
+            self.name, self.nuke, self.count, self.resolution, poses, sequences = ppb.read(filename)
+        else:
+            self.nuke = ""
+            poses, sequences = self.parse(filename, strict, workers)
+        self.poses = PoseLibrary(self.count)
+        for name, positions in poses.items():
+            self.poses[name] = positions
         self.sequences = dict()
-        prjFile = open(filename, "r").readlines()
+        for name, transitions in sequences.items():
+            self.sequences[name] = Sequence()
+            self.sequences[name].extend(transitions)
+        for p in self.problems[:SHOW_PROBLEMS]:
+            print(filename + ": " + str(p))
+        if len(self.problems) > SHOW_PROBLEMS:
+            print(filename + ": " + str(len(self.problems) - SHOW_PROBLEMS) + " more problems")
+        self.save = False
+
+    def parse(self, filename, strict=False, workers=1):
+        """ Read a .ppr file, returns the poses and sequences as lists. """
+        with open(filename, "r") as prjFile:
+            lines = prjFile.read().split("\n")
         # load robot name and servo count
-        self.name = prjFile[0].split(":")[0]
-        self.count = int(prjFile[0].split(":")[1])
+        header = lines[0].rstrip().split(":")
+        self.name = header[0]
+        try:
+            self.count = int(header[1])
+        except (IndexError, ValueError):
+            raise ParseError("expected name:servo count:resolutions", 1, len(header[0]) + 2)
         # load resolution of each servo in count
-        self.resolution = [int(x) for x in prjFile[0].split(":")[2:]]
+        try:
+            self.resolution = [int(x) for x in header[2:]]
+        except ValueError:
+            problem("resolutions should be integers", strict, self.problems, 1, len(header[0]) + len(header[1]) + 3)
+            self.resolution = list()
         if len(self.resolution) != self.count:
+            if len(self.resolution) > 0:
+                problem(str(len(self.resolution)) + " resolutions for " + str(self.count) + " servos",
+                        strict, self.problems, 1, 1)
             self.resolution = [1024 for x in range(self.count)]
         # load poses and sequences
-        for line in prjFile[1:]:
-            if line[0:5] == "Pose=":
-                self.poses[line[5:line.index(":")]] = Pose(
-                    line[line.index(":") + 1:].rstrip(), self.count)
-            elif line[0:4] == "Seq=":
-                self.sequences[line[4:line.index(":")]] = (
-                    Sequence(line[line.index(":") + 1:].rstrip()))
-            elif line[0:5] == "Nuke=":
-                self.nuke = line[5:].rstrip()
-            # these next two lines can be removed later, once everyone is moved to Ver 0.91
-            else:
-                self.poses[line[0:line.index(":")]] = Pose(
-                    line[line.index(":") + 1:].rstrip(), self.count)
-        self.save = False
+        lines = lines[1:]
+        if len(lines) > PARALLEL_LINES and workers > 1 and "fork" in multiprocessing.get_all_start_methods():
+            chunks = [(lines[i:i + CHUNK_LINES], i + 2, self.count, strict) for i in range(0, len(lines), CHUNK_LINES)]
+            with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("fork")) as pool:
+                results = list(pool.map(parseChunk, chunks))
+        else:
+            results = [parseLines(lines, 2, self.count, strict)]
+        poses = dict()
+        sequences = dict()
+        for entries, problems in results:
+            self.problems.extend(problems)
+            for kind, name, values in entries:
+                if kind == "nuke":
+                    self.nuke = values
+                elif kind == "pose":
+                    poses[name] = values
+                else:
+                    sequences[name] = values
+        return poses, sequences
 
     def saveFile(self, filename):
+        if filename.endswith(ppb.EXTENSION):
+            ppb.save(self, filename)
+            self.save = False
+            return
         with open(filename, "w") as prjFile:
             prjFile.write(self.name + ":" + str(self.count) + ":" + ":".join([str(x) for x in self.resolution]) + '\n')
             for p in self.poses.keys():
@@ -114,7 +278,7 @@ class Project:
         self.save = False
 
     def new(self, nName, nCount, nResolution):
-        self.poses = dict()
+        self.poses = PoseLibrary(nCount)
         self.sequences = dict()
         self.filename = ""
         self.count = nCount
@@ -122,34 +286,12 @@ class Project:
         self.resolution = [nResolution for i in range(self.count)]
         self.save = True
 
-    def export(self, filename):
-        """ Export a pose file for use with Sanguino Library. """
-        poses = ""
-        poses += "#ifndef " + self.name.upper() + "_POSES" + '\n'
-        poses += "#define " + self.name.upper() + "_POSES" + '\n\n'
-        poses += "#include <avr/pgmspace.h>\n\n"
-        for p in self.poses.keys():
-            if p.startswith("ik_"):
-                continue
-            poses += "PROGMEM prog_uint16_t " + p + "[] = {" + str(self.count) + ",\n"
-            p = self.poses[p]
-            for x in p[0:-1]:
-                poses += str(x) + ",\n"
-            poses += str(p[-1]) + "};\n\n"
-        for s in self.sequences.keys():
-            poses += "PROGMEM transition_t " + s + "[] = {{0," + str(len(self.sequences[s])) + "}\n"
-            s = self.sequences[s]
-            for t in s:
-                poses += ",{" + t[0:t.find("|")] + "," + t[t.find("|") + 1:] + "}\n"
-            poses += "};\n\n"
-        poses += "#endif\n"
-        with open(filename, "w") as posefile:
-            posefile.write(poses)
+    def export(self, filename, target="progmem", sequences=None):
+        """ Export a pose file for use with Sanguino Library, or for another
+        of the exporter.TARGETS, optionally only what sequences reach. """
+        return exporter.export(self, filename, target, sequences)
 
 
 def extract(li):
     """ extract x%256,x>>8 for every x in li """
-    out = list()
-    for i in li:
-        out = out + [i % 256, i >> 8]
-    return out
+    return list(struct.pack("<%dH" % len(li), *li))
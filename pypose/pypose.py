@@ -27,7 +27,10 @@ from serial.tools import list_ports
 
 from pypose import ax12
 from pypose.tools import panels
-from pypose.driver import Driver
+from pypose.asyncdriver import AsyncDriver
+from pypose.telemetry import TelemetryPoller
+from pypose.simulator import VirtualBus, SIM_PORT
+from pypose import exporter
 from pypose.project import Project
 
 
@@ -64,6 +67,7 @@ class Editor(wx.Frame):
         self.saveReq = False
         self.panel = None
         self.port = None
+        self.telemetry = None   # background TelemetryPoller, if running
         self.filename = ""
         self.dirname = ""
         self.columns = 2        # column count for pose editor
@@ -188,7 +192,7 @@ class Editor(wx.Frame):
     def openFile(self, e):
         """Loads a robot file into the GUI."""
         dlg = wx.FileDialog(self, "Choose a file",
-                            self.dirname, "", "*.ppr", wx.FD_OPEN)
+                            self.dirname, "", "*.ppr;*.ppb", wx.FD_OPEN)
         if dlg.ShowModal() == wx.ID_OK:
             self.filename = dlg.GetPath()
             self.dirname = dlg.GetDirectory()
@@ -200,19 +204,27 @@ class Editor(wx.Frame):
             self.sb.SetStatusText('opened ' + self.filename)
 
     def saveFile(self, e=None):
-        """Save a robot file from the GUI."""
+        """Save a robot file from the GUI, returns True if it was saved."""
         if self.filename == "":
-            dlg = wx.FileDialog(self, "Choose a file", self.dirname, "", "*.ppr", wx.FD_SAVE)
+            dlg = wx.FileDialog(self, "Choose a file", self.dirname, "",
+                                "Text project (*.ppr)|*.ppr|Binary project (*.ppb)|*.ppb", wx.FD_SAVE)
             if dlg.ShowModal() == wx.ID_OK:
                 self.filename = dlg.GetPath()
                 self.dirname = dlg.GetDirectory()
                 dlg.Destroy()
             else:
-                return
-        if self.filename[-4:] != ".ppr":
+                return False
+        if self.filename[-4:] not in (".ppr", ".ppb"):
             self.filename = self.filename + ".ppr"
-        self.project.saveFile(self.filename)
+        try:
+            self.project.saveFile(self.filename)
+        except ValueError as err:
+            self.sb.SetBackgroundColour('RED')
+            self.sb.SetStatusText("save failed: " + str(err), 0)
+            self.timer.Start(20)
+            return False
         self.sb.SetStatusText('saved ' + self.filename)
+        return True
 
     def saveFileAs(self, e):
         self.filename = ""
@@ -225,11 +237,17 @@ class Editor(wx.Frame):
             self.sb.SetStatusText('please create a project')
             self.timer.Start(20)
             return
-        dlg = wx.FileDialog(self, "Choose a file",
-                            self.dirname, "", "*.h", wx.FD_SAVE)
+        dlg = wx.FileDialog(self, "Choose a file", self.dirname, "",
+                            "PROGMEM header (*.h)|*.h|Delta encoded header (*.h)|*.h|SD card blob (*.bin)|*.bin",
+                            wx.FD_SAVE)
         if dlg.ShowModal() == wx.ID_OK:
-            self.project.export(dlg.GetPath())
-            self.sb.SetStatusText("exported " + dlg.GetPath(), 0)
+            try:
+                self.project.export(dlg.GetPath(), exporter.TARGETS[dlg.GetFilterIndex()])
+                self.sb.SetStatusText("exported " + dlg.GetPath(), 0)
+            except ValueError as err:
+                self.sb.SetBackgroundColour('RED')
+                self.sb.SetStatusText("export failed: " + str(err), 0)
+                self.timer.Start(20)
             dlg.Destroy()
 
     def findPorts(self):
@@ -242,6 +260,8 @@ class Editor(wx.Frame):
                 self.ports.append(p.device)
             except OSError:
                 pass
+        # a bus of virtual servos, to try things out without a robot
+        self.ports.append(SIM_PORT)
 
     def doPort(self, e=None):
         """ open a serial port """
@@ -252,7 +272,8 @@ class Editor(wx.Frame):
         # dlg = PortDialog(self,'Select Communications Port',self.ports)
         if dlg.ShowModal() == wx.ID_OK:
             if self.port is not None:
-                self.port.ser.close()
+                self.stopTelemetry()
+                self.port.close()
             print("Opening port: " + self.ports[dlg.GetSelection()])
             self.openPort(self.ports[dlg.GetSelection()])
             dlg.Destroy()
@@ -260,7 +281,10 @@ class Editor(wx.Frame):
     def openPort(self, port, baud=115200, interpolate=True):
         try:
             # TODO: add ability to select type of driver
-            self.port = Driver(port, baud, interpolate)
+            if port == SIM_PORT:
+                self.port = AsyncDriver(port, baud, interpolate, ser=VirtualBus(self.project.count))
+            else:
+                self.port = AsyncDriver(port, baud, interpolate)
             self.panel.port = self.port
             self.panel.portUpdated()
             self.sb.SetStatusText(port + '@' + str(baud), 1)
@@ -272,16 +296,29 @@ class Editor(wx.Frame):
             self.timer.Start(20)
         return self.port
 
+    def startTelemetry(self, rate=20.0):
+        """ Poll the state of every servo in the project in the background. """
+        self.stopTelemetry()
+        self.telemetry = TelemetryPoller(self.port, range(1, self.project.count + 1), rate)
+        self.telemetry.start()
+        return self.telemetry
+
+    def stopTelemetry(self):
+        if self.telemetry is not None:
+            self.telemetry.stop()
+            self.telemetry = None
+
     def doTest(self, e=None):
         if self.port is not None:
-            self.port.execute(253, 25, list())
+            self.port.execute(ax12.ARB_ID, ax12.ARB_TEST, list())
 
     def doRelax(self, e=None):
         """ Relax servos so you can pose them. """
         if self.port is not None:
             print("PyPose: relaxing servos...")
-            for servo in range(self.project.count):
-                self.port.setReg(servo + 1, ax12.P_TORQUE_ENABLE, [0, ])
+            self.port.syncWrite(ax12.P_TORQUE_ENABLE, [(servo + 1, 0) for servo in range(self.project.count)])
+            # poses are about to be captured by hand, upload them again after
+            self.port.forgetBoard()
         else:
             self.sb.SetBackgroundColour('RED')
             self.sb.SetStatusText("No Port Open", 0)
@@ -325,8 +362,13 @@ class Editor(wx.Frame):
                 e.Veto()
                 return
             elif r == wx.ID_YES:
-                self.saveFile()
-                pass
+                if not self.saveFile():
+                    e.Veto()
+                    return
+        self.stopTelemetry()
+        if self.port is not None:
+            # finishes queued requests and writes out a bus log being recorded
+            self.port.close()
         self.Destroy()
 
     def OnTimer(self, e=None):
@@ -356,6 +398,9 @@ class Editor(wx.Frame):
     def setLiveUpdate(self, e=None):
         if isinstance(self.panel, panels[0]):
             self.panel.live = self.live.IsChecked()
+            if not self.panel.live and self.panel.writer is not None:
+                self.sb.SetStatusText(str(self.panel.writer.dropped) + " live updates dropped by coalescing", 0)
+                self.panel.stopWriter()
 
 
 class NewProjectDialog(wx.Dialog):
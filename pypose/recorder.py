@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+
+"""
+  PyPose: recording and replay of bus traffic
+  Copyright (c) 2008-2010 Michael E. Ferguson.  All right reserved.
+
+  This program is free software; you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation; either version 2 of the License, or
+  (at your option) any later version.
+
+  This program is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+  GNU General Public License for more details.
+
+  You should have received a copy of the GNU General Public License
+  along with this program; if not, write to the Free Software Foundation,
+  Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+
+import os
+import time
+import struct
+import threading
+from collections import deque
+
+# a log is MAGIC, then records of RECORD_SIZE bytes:
+#   monotonic time (double), direction and flags, bytes used, payload
+MAGIC = b"PPRL\x01"
+RECORD = struct.Struct("<dBB")
+RECORD_SIZE = 64
+PAYLOAD = RECORD_SIZE - RECORD.size
+# direction, low bit of the flags
+SENT = 0
+RECEIVED = 1
+# set on the records carrying the rest of a frame that didn't fit in one
+CONTINUED = 0x80
+# records held in memory before a flush
+BLOCK = 1024
+# seconds a partial block may wait before it is flushed anyway
+FLUSH_INTERVAL = 1.0
+
+
+class Recorder:
+    """ Appends the bytes going over the port to a log file.
+
+    Records are packed into a preallocated block; a full block is handed to
+    a background thread to write out, and recording goes on in a second
+    one, so the bus thread never waits for the disk. A block that hasn't
+    filled up in FLUSH_INTERVAL seconds is written out as it is. """
+
+    def __init__(self, path, block=BLOCK):
+        new = not os.path.exists(path) or os.path.getsize(path) == 0
+        self.file = open(path, "ab")
+        if new:
+            self.file.write(MAGIC)
+        self.blocks = [bytearray(block * RECORD_SIZE), bytearray(block * RECORD_SIZE)]
+        self.current = 0            # block being filled
+        self.offset = 0             # bytes used in it
+        self.full = threading.Event()
+        self.free = threading.Event()
+        self.free.set()
+        self.lock = threading.Lock()    # the block being filled, between bus and writer
+        self.records = 0
+        self.thread = threading.Thread(target=self.run, name="pypose-recorder", daemon=True)
+        self.thread.start()
+
+    def sent(self, data):
+        self.append(SENT, data)
+
+    def received(self, data):
+        self.append(RECEIVED, data)
+
+    def append(self, direction, data):
+        """ Record data, split over as many records as it takes. """
+        now = time.monotonic()
+        flags = direction
+        with self.lock:
+            for i in range(0, max(len(data), 1), PAYLOAD):
+                chunk = data[i:i + PAYLOAD]
+                block = self.blocks[self.current]
+                RECORD.pack_into(block, self.offset, now, flags, len(chunk))
+                start = self.offset + RECORD.size
+                block[start:start + len(chunk)] = chunk
+                self.offset = self.offset + RECORD_SIZE
+                self.records = self.records + 1
+                flags = direction | CONTINUED
+                if self.offset == len(block):
+                    self.swap()
+
+    def swap(self, last=False):
+        """ Hand the full block to the writer, carry on in the other one. """
+        self.free.wait()    # only if the disk is a whole block behind
+        self.free.clear()
+        self.pending = (self.current, self.offset, last)
+        self.current = 1 - self.current
+        self.offset = 0
+        self.full.set()
+
+    def run(self):
+        while True:
+            if not self.full.wait(FLUSH_INTERVAL):
+                # nothing filled up for a while, write out what there is;
+                # if the bus is appending, it is waiting on us, try later
+                if self.lock.acquire(blocking=False):
+                    if self.offset > 0 and self.free.is_set():
+                        self.swap()
+                    self.lock.release()
+                continue
+            self.full.clear()
+            index, length, last = self.pending
+            self.file.write(memoryview(self.blocks[index])[:length])
+            self.file.flush()
+            self.free.set()
+            if last:
+                return
+
+    def close(self):
+        """ Write out what is left and close the log. """
+        with self.lock:
+            self.swap(True)
+        self.thread.join()
+        self.file.close()
+
+
+def records(path):
+    """ Yield (time, direction, bytes) for every frame in a log. """
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(path + " is not a PyPose bus log")
+        frame = None
+        while True:
+            record = f.read(RECORD_SIZE)
+            if len(record) < RECORD_SIZE:
+                break
+            t, flags, length = RECORD.unpack_from(record)
+            payload = record[RECORD.size:RECORD.size + length]
+            if flags & CONTINUED and frame is not None:
+                frame[2] += payload
+                continue
+            if frame is not None:
+                yield (frame[0], frame[1], bytes(frame[2]))
+            frame = [t, flags & 1, bytearray(payload)]
+        if frame is not None:
+            yield (frame[0], frame[1], bytes(frame[2]))
+
+
+class ReplayPort:
+    """ Plays a log back in place of the serial port, e.g. Driver(ser=ReplayPort(path)).
+
+    Each write is matched against the next bytes sent in the log; the bytes
+    that were received after it then come back from read(), as long after
+    the write as they were recorded, divided by speed (0 for no waiting at
+    all). Writes that differ from the recording are counted in mismatches;
+    for an exact replay, give the driver the register mirror ttl it was
+    recorded with (0 is the safe choice for both). """
+
+    def __init__(self, path, speed=1.0):
+        self.log = deque(records(path))
+        self.speed = speed
+        self.timeout = None
+        self.baudrate = None
+        self.port = path
+        self.is_open = True
+        self.rx = deque()           # [time due, bytes]
+        self.mismatches = 0
+        self.frames = 0
+
+    def write(self, data):
+        data = bytes(data)
+        # drop whatever was received before this write, the driver flushed it
+        while len(self.log) > 0 and self.log[0][1] == RECEIVED:
+            self.log.popleft()
+        now = time.monotonic()
+        sent = b""
+        written = None      # log time of the write
+        while len(sent) < len(data) and len(self.log) > 0 and self.log[0][1] == SENT:
+            written, direction, frame = self.log.popleft()
+            sent = sent + frame
+        if sent != data:
+            self.mismatches = self.mismatches + 1
+        self.frames = self.frames + 1
+        # queue the replies up to the next write
+        while len(self.log) > 0 and self.log[0][1] == RECEIVED:
+            t, direction, frame = self.log.popleft()
+            due = now
+            if self.speed > 0 and written is not None:
+                due = now + (t - written) / self.speed
+            self.rx.append([due, frame])
+        return len(data)
+
+    def available(self, now):
+        count = 0
+        for due, data in self.rx:
+            if due > now:
+                break
+            count = count + len(data)
+        return count
+
+    def read(self, size=1):
+        deadline = None
+        if self.timeout is not None:
+            deadline = time.monotonic() + self.timeout
+        while True:
+            now = time.monotonic()
+            # nothing left to come before the next write, don't sit out the timeout
+            if self.available(now) >= size or len(self.rx) == 0 or (deadline is not None and now >= deadline):
+                break
+            wait = 0.001
+            for due, data in self.rx:
+                if due > now:
+                    wait = due - now
+                    break
+            if deadline is not None:
+                wait = min(wait, deadline - now)
+            time.sleep(max(wait, 0.0001))
+        out = bytearray()
+        now = time.monotonic()
+        while len(out) < size and len(self.rx) > 0 and self.rx[0][0] <= now:
+            due, data = self.rx[0]
+            n = min(size - len(out), len(data))
+            out += data[:n]
+            if n == len(data):
+                self.rx.popleft()
+            else:
+                self.rx[0] = [due, data[n:]]
+        return bytes(out)
+
+    def inWaiting(self):
+        return self.available(time.monotonic())
+
+    def flushInput(self):
+        self.read(self.inWaiting())
+
+    def close(self):
+        self.is_open = False
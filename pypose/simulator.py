@@ -0,0 +1,477 @@
+#!/usr/bin/env python3
+
+"""
+  PyPose: a simulated AX-12 bus behind a serial port interface
+  Copyright (c) 2008-2010 Michael E. Ferguson.  All right reserved.
+
+  This program is free software; you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation; either version 2 of the License, or
+  (at your option) any later version.
+
+  This program is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+  GNU General Public License for more details.
+
+  You should have received a copy of the GNU General Public License
+  along with this program; if not, write to the Free Software Foundation,
+  Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+
+import time
+import random
+import threading
+from collections import deque
+from pypose import ax12
+
+# port name that opens a simulated bus instead of a serial port
+SIM_PORT = "sim"
+# bits on the line for each byte: start, 8 data, stop
+BITS_PER_BYTE = 10
+# AX-12 at no load: 0.111s per 60 degrees, in position units per second
+MAX_SPEED = 60 / 0.111 * 1024 / 300
+# speed of one unit of P_GOAL_SPEED, position units per second
+SPEED_UNIT = 0.111 * 360 / 60 * 1024 / 300
+# AX-12 error bits
+ERR_RANGE = 8
+ERR_CHECKSUM = 16
+ERR_INSTRUCTION = 64
+# the control table at power up, as shipped (the ID is set per servo)
+FACTORY = {ax12.P_MODEL_NUMBER_L: 12, ax12.P_VERSION: 24, ax12.P_ID: 1, ax12.P_BAUD_RATE: 1,
+           ax12.P_RETURN_DELAY_TIME: 250, ax12.P_CCW_ANGLE_LIMIT_L: 255, ax12.P_CCW_ANGLE_LIMIT_H: 3,
+           ax12.P_LIMIT_TEMPERATURE: 70, ax12.P_DOWN_LIMIT_VOLTAGE: 60, ax12.P_UP_LIMIT_VOLTAGE: 190,
+           ax12.P_MAX_TORQUE_L: 255, ax12.P_MAX_TORQUE_H: 3, ax12.P_RETURN_LEVEL: ax12.AX_RETURN_ALL,
+           ax12.P_ALARM_LED: 36, ax12.P_ALARM_SHUTDOWN: 36,
+           ax12.P_CW_COMPLIANCE_MARGIN: 1, ax12.P_CCW_COMPLIANCE_MARGIN: 1,
+           ax12.P_CW_COMPLIANCE_SLOPE: 32, ax12.P_CCW_COMPLIANCE_SLOPE: 32,
+           ax12.P_GOAL_POSITION_L: 0, ax12.P_GOAL_POSITION_H: 2,
+           ax12.P_TORQUE_LIMIT_L: 255, ax12.P_TORQUE_LIMIT_H: 3,
+           ax12.P_PRESENT_POSITION_L: 0, ax12.P_PRESENT_POSITION_H: 2,
+           ax12.P_PRESENT_VOLTAGE: 120, ax12.P_PRESENT_TEMPERATURE: 35, ax12.P_PUNCH_L: 32}
+TABLE_SIZE = ax12.P_PUNCH_H + 1
+
+
+def word(table, reg):
+    return table[reg] + (table[reg + 1] << 8)
+
+
+def packet(index, error, params):
+    """ An encoded status packet. """
+    body = [index, len(params) + 2, error] + list(params)
+    return bytes([0xFF, 0xFF] + body + [255 - (sum(body) % 256)])
+
+
+class VirtualServo:
+    """ One AX-12: its control table, and a shaft that moves to the goal. """
+
+    def __init__(self, index, position=512):
+        self.table = bytearray(TABLE_SIZE)
+        for reg, value in FACTORY.items():
+            self.table[reg] = value
+        self.table[ax12.P_ID] = index
+        self.setWord(ax12.P_GOAL_POSITION_L, position)
+        self.setWord(ax12.P_PRESENT_POSITION_L, position)
+        self.position = float(position)
+        self.registered = None      # (regstart, values) from REG_WRITE
+        self.updated = time.monotonic()
+
+    @property
+    def id(self):
+        return self.table[ax12.P_ID]
+
+    def setWord(self, reg, value):
+        self.table[reg] = value % 256
+        self.table[reg + 1] = (value >> 8) % 256
+
+    def update(self, now):
+        """ Move the shaft towards the goal for the time since the last update. """
+        dt = now - self.updated
+        self.updated = now
+        goal = word(self.table, ax12.P_GOAL_POSITION_L)
+        speed = word(self.table, ax12.P_GOAL_SPEED_L) * SPEED_UNIT
+        if speed == 0 or speed > MAX_SPEED:
+            speed = MAX_SPEED
+        if not self.table[ax12.P_TORQUE_ENABLE] or goal == int(self.position):
+            self.table[ax12.P_MOVING] = 0
+            self.setWord(ax12.P_PRESENT_SPEED_L, 0)
+            return
+        step = speed * dt
+        if abs(goal - self.position) <= step:
+            self.position = float(goal)
+        elif goal > self.position:
+            self.position = self.position + step
+        else:
+            self.position = self.position - step
+        self.table[ax12.P_MOVING] = 1
+        self.setWord(ax12.P_PRESENT_POSITION_L, int(self.position))
+        self.setWord(ax12.P_PRESENT_SPEED_L, int(speed / SPEED_UNIT))
+
+    def write(self, regstart, values):
+        """ Write registers, returns the error bits. """
+        if regstart + len(values) > TABLE_SIZE or regstart < ax12.P_ID:
+            return ERR_RANGE
+        self.table[regstart:regstart + len(values)] = bytes(values)
+        if regstart <= ax12.P_GOAL_POSITION_H and regstart + len(values) > ax12.P_GOAL_POSITION_L:
+            # goals past the angle limits are clamped
+            goal = word(self.table, ax12.P_GOAL_POSITION_L)
+            goal = max(word(self.table, ax12.P_CW_ANGLE_LIMIT_L), min(word(self.table, ax12.P_CCW_ANGLE_LIMIT_L), goal))
+            self.setWord(ax12.P_GOAL_POSITION_L, goal)
+            self.table[ax12.P_TORQUE_ENABLE] = 1
+        return 0
+
+    def instruction(self, ins, params, now):
+        """ Carry out an instruction, returns (error, reply params) or None for no reply. """
+        self.update(now)
+        level = self.table[ax12.P_RETURN_LEVEL]
+        if ins == ax12.AX_PING:
+            return (0, b"")
+        if ins == ax12.AX_READ_DATA:
+            if len(params) != 2 or params[0] + params[1] > TABLE_SIZE:
+                return (ERR_INSTRUCTION, b"")
+            if level == ax12.AX_RETURN_NONE:
+                return None
+            return (0, bytes(self.table[params[0]:params[0] + params[1]]))
+        if ins == ax12.AX_WRITE_DATA:
+            error = self.write(params[0], params[1:])
+        elif ins == ax12.AX_REG_WRITE:
+            self.registered = (params[0], params[1:])
+            self.table[ax12.P_REGISTERED_INSTRUCTION] = 1
+            error = 0
+        elif ins == ax12.AX_ACTION:
+            error = 0
+            if self.registered is not None:
+                error = self.write(*self.registered)
+                self.registered = None
+                self.table[ax12.P_REGISTERED_INSTRUCTION] = 0
+        elif ins == ax12.AX_RESET:
+            self.__init__(1, int(self.position))
+            error = 0
+        else:
+            error = ERR_INSTRUCTION
+        if level == ax12.AX_RETURN_ALL:
+            return (error, b"")
+        return None
+
+
+class VirtualBus:
+    """ A bus of virtual AX-12s behind the pieces of serial.Serial that Driver uses.
+
+    Bytes take BITS_PER_BYTE bit times at baudrate to cross the line, both
+    ways, and a servo starts answering its return delay after the request
+    ends. Replies can be dropped, or have a byte corrupted, at random.
+
+    With arbotix set, ID 253 answers the arbotiX instructions: poses and
+    sequences are kept, and played by interpolating the goal positions of
+    servos 1 to the pose size, as the board does every frame. """
+
+    BAUDRATES = tuple(sorted(ax12.BAUD_RATES.values()))
+
+    def __init__(self, servos=18, baudrate=1000000, returnDelay=None, noise=0.0, drop=0.0,
+                 arbotix=True, syncRead=False, seed=None):
+        if isinstance(servos, int):
+            servos = range(1, servos + 1)
+        self.servos = [VirtualServo(index) for index in servos]
+        if returnDelay is not None:
+            # in microseconds, the register counts 2us steps
+            for servo in self.servos:
+                servo.table[ax12.P_RETURN_DELAY_TIME] = min(254, returnDelay // 2)
+        self.baudrate = baudrate
+        self.timeout = None
+        self.port = SIM_PORT
+        self.noise = noise          # chance of one corrupted byte in a reply
+        self.drop = drop            # chance of a reply never being sent
+        self.arbotix = arbotix
+        self.syncRead = syncRead
+        self.random = random.Random(seed)
+        self.is_open = True
+        self.lock = threading.Lock()
+        self.txbuf = bytearray()    # written bytes not yet framed
+        self.rx = deque()           # [time the first byte arrives, bytes] for each reply
+        self.lineFree = 0.0         # when the line is done with what we've sent
+        # arbotiX interpolation engine
+        self.poseSize = 0
+        self.poses = dict()         # slot -> positions
+        self.sequence = list()      # (slot, milliseconds)
+        self.playing = None         # (start time, starting positions, loop)
+        # statistics
+        self.packets = 0
+        self.replies = 0
+        self.dropped = 0
+        self.corrupted = 0
+
+    def byteTime(self):
+        return BITS_PER_BYTE / float(self.baudrate)
+
+    def servo(self, index):
+        for servo in self.servos:
+            if servo.id == index:
+                return servo
+        return None
+
+    ###########################################################################
+    # serial.Serial
+
+    def open(self):
+        self.is_open = True
+
+    def isOpen(self):
+        return self.is_open
+
+    def close(self):
+        self.is_open = False
+
+    def write(self, data):
+        now = time.monotonic()
+        with self.lock:
+            start = max(now, self.lineFree)
+            # bytes of a packet started by an earlier write are already across
+            start = start - len(self.txbuf) * self.byteTime()
+            self.txbuf += bytes(data)
+            sent = start + len(self.txbuf) * self.byteTime()
+            # each packet is handled when its last byte has crossed the line
+            for end, ins in self.frame():
+                self.handle(ins, start + end * self.byteTime())
+            self.lineFree = max(self.lineFree, sent)
+        return len(data)
+
+    def read(self, size=1):
+        deadline = None
+        if self.timeout is not None:
+            deadline = time.monotonic() + self.timeout
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if self.available(now) >= size or (deadline is not None and now >= deadline):
+                    return self.take(size, now)
+                wait = self.nextByte(now)
+            if deadline is not None:
+                wait = min(wait, deadline - now)
+            time.sleep(max(wait, 0.0001))
+
+    def inWaiting(self):
+        with self.lock:
+            return self.available(time.monotonic())
+
+    @property
+    def in_waiting(self):
+        return self.inWaiting()
+
+    def flushInput(self):
+        with self.lock:
+            self.take(self.available(time.monotonic()), time.monotonic())
+
+    reset_input_buffer = flushInput
+
+    ###########################################################################
+    # receive side
+
+    def available(self, now):
+        """ Bytes that have arrived by now. """
+        count = 0
+        bt = self.byteTime()
+        for start, data in self.rx:
+            if now < start:
+                break
+            arrived = min(len(data), int((now - start) / bt) + 1)
+            count = count + arrived
+            if arrived < len(data):
+                break
+        return count
+
+    def nextByte(self, now):
+        """ Seconds until another byte arrives. """
+        bt = self.byteTime()
+        for start, data in self.rx:
+            if now < start:
+                return start - now
+            if int((now - start) / bt) + 1 < len(data):
+                return bt
+        return bt * 10
+
+    def take(self, size, now):
+        out = bytearray()
+        size = min(size, self.available(now))
+        while size > 0:
+            start, data = self.rx[0]
+            n = min(size, len(data))
+            out += data[:n]
+            size = size - n
+            if n == len(data):
+                self.rx.popleft()
+            else:
+                self.rx[0] = [start + n * self.byteTime(), data[n:]]
+        return bytes(out)
+
+    def reply(self, at, index, error, params, delay):
+        """ Queue a status packet, its first byte arrives delay after at. """
+        self.replies = self.replies + 1
+        if self.random.random() < self.drop:
+            self.dropped = self.dropped + 1
+            return
+        data = bytearray(packet(index, error, params))
+        if self.random.random() < self.noise:
+            self.corrupted = self.corrupted + 1
+            i = self.random.randrange(2, len(data))
+            data[i] = data[i] ^ (1 << self.random.randrange(8))
+        start = at + delay
+        if len(self.rx) > 0:
+            # a half-duplex line carries one reply at a time
+            last, pending = self.rx[-1]
+            start = max(start, last + len(pending) * self.byteTime())
+        self.rx.append([start, bytes(data)])
+        self.lineFree = max(self.lineFree, start + len(data) * self.byteTime())
+
+    ###########################################################################
+    # transmit side
+
+    def frame(self):
+        """ Take complete packets out of txbuf, yields (end offset, (id, ins, params, ok)). """
+        offset = 0
+        buf = self.txbuf
+        while len(buf) > 0:
+            if buf[0] != 0xFF:
+                if self.arbotix and buf[0] == ord("H"):
+                    # halt, a raw byte outside any packet
+                    offset = offset + 1
+                    del buf[:1]
+                    yield offset, None
+                    continue
+                offset = offset + 1
+                del buf[:1]
+                continue
+            if len(buf) < 4:
+                return
+            if buf[1] != 0xFF:
+                offset = offset + 1
+                del buf[:1]
+                continue
+            total = buf[3] + 4
+            if len(buf) < total:
+                return
+            ok = (255 - sum(buf[2:total - 1]) % 256) == buf[total - 1]
+            ins = (buf[2], buf[4], bytes(buf[5:total - 1]), ok)
+            offset = offset + total
+            del buf[:total]
+            self.packets = self.packets + 1
+            yield offset, ins
+
+    def handle(self, ins, at):
+        """ Carry out one instruction packet that finished arriving at time at. """
+        if ins is None:
+            self.playing = None
+            return
+        index, instruction, params, ok = ins
+        if self.arbotix:
+            self.interpolate(at)
+        if self.arbotix and index == ax12.ARB_ID:
+            self.board(instruction, params, ok, at)
+            return
+        if index == 0xFE:
+            if not ok:
+                return
+            if instruction == ax12.AX_SYNC_WRITE:
+                regstart, per = params[0], params[1] + 1
+                for i in range(2, len(params) - per + 1, per):
+                    servo = self.servo(params[i])
+                    if servo is not None:
+                        servo.update(at)
+                        servo.write(regstart, params[i + 1:i + per])
+            elif instruction == ax12.AX_SYNC_READ and self.syncRead:
+                self.board(instruction, params, ok, at)
+            else:
+                for servo in self.servos:
+                    servo.instruction(instruction, params, at)
+            return
+        servo = self.servo(index)
+        if servo is None:
+            return
+        delay = 2e-6 * servo.table[ax12.P_RETURN_DELAY_TIME]
+        if not ok:
+            self.reply(at, servo.id, ERR_CHECKSUM, b"", delay)
+            return
+        answer = servo.instruction(instruction, params, at)
+        if answer is not None:
+            self.reply(at, servo.id, answer[0], answer[1], delay)
+
+    ###########################################################################
+    # arbotiX
+
+    def board(self, instruction, params, ok, at):
+        if not ok:
+            self.reply(at, ax12.ARB_ID, ERR_CHECKSUM, b"", 0)
+            return
+        error = 0
+        answer = b""
+        if instruction == ax12.ARB_SIZE_POSE:
+            self.poseSize = params[0]
+        elif instruction == ax12.ARB_LOAD_POSE:
+            self.poses[params[0]] = [params[i] + (params[i + 1] << 8) for i in range(1, len(params) - 1, 2)]
+        elif instruction == ax12.ARB_LOAD_SEQ:
+            self.sequence = list()
+            for i in range(0, len(params) - 2, 3):
+                if params[i] == 255:
+                    break
+                self.sequence.append((params[i], params[i + 1] + (params[i + 2] << 8)))
+        elif instruction in (ax12.ARB_PLAY_SEQ, ax12.ARB_LOOP_SEQ):
+            start = [word(self.servoOrDefault(i + 1), ax12.P_GOAL_POSITION_L) for i in range(self.poseSize)]
+            self.playing = (at, start, instruction == ax12.ARB_LOOP_SEQ)
+        elif instruction == ax12.ARB_TEST:
+            pass
+        elif instruction == ax12.AX_SYNC_READ:
+            regstart, rlength = params[0], params[1]
+            answer = bytearray()
+            for index in params[2:]:
+                servo = self.servo(index)
+                if servo is None:
+                    error = ERR_RANGE
+                    answer += bytes(rlength)
+                else:
+                    servo.update(at)
+                    answer += servo.table[regstart:regstart + rlength]
+        else:
+            error = ERR_INSTRUCTION
+        self.reply(at, ax12.ARB_ID, error, answer, 0)
+
+    def servoOrDefault(self, index):
+        servo = self.servo(index)
+        if servo is None:
+            return FACTORY
+        return servo.table
+
+    def interpolate(self, now):
+        """ Set goal positions along the playing sequence, as of now. """
+        if self.playing is None or len(self.sequence) == 0:
+            return
+        start, previous, loop = self.playing
+        t = (now - start) * 1000.0
+        total = sum([ms for slot, ms in self.sequence])
+        if loop and total > 0 and t >= total:
+            # every lap after the first starts from the last pose
+            last = self.poses.get(self.sequence[-1][0], previous)
+            laps = int(t // total)
+            self.playing = (start + laps * total / 1000.0, last, loop)
+            start, previous, loop = self.playing
+            t = t - laps * total
+        goals = previous
+        for slot, ms in self.sequence:
+            pose = self.poses.get(slot, previous)
+            if t < ms:
+                f = t / float(ms)
+                goals = [int(a + (b - a) * f) for a, b in zip(previous, pose)]
+                break
+            t = t - ms
+            previous = pose
+            goals = pose
+        else:
+            if not loop:
+                self.playing = None
+        for i, goal in enumerate(goals[:self.poseSize]):
+            servo = self.servo(i + 1)
+            if servo is not None:
+                servo.update(now)
+                servo.write(ax12.P_GOAL_POSITION_L, [goal % 256, goal >> 8])
+
+    def stats(self):
+        return {"packets": self.packets, "replies": self.replies,
+                "dropped": self.dropped, "corrupted": self.corrupted}
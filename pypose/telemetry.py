@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+
+"""
+  PyPose: background telemetry of the servos on the bus
+  Copyright (c) 2008-2010 Michael E. Ferguson.  All right reserved.
+
+  This program is free software; you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation; either version 2 of the License, or
+  (at your option) any later version.
+
+  This program is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+  GNU General Public License for more details.
+
+  You should have received a copy of the GNU General Public License
+  along with this program; if not, write to the Free Software Foundation,
+  Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+
+import time
+import threading
+import numpy
+from pypose import ax12
+from pypose.driver import BACKGROUND
+
+# columns of a sample
+FIELDS = ("time", "position", "speed", "load", "voltage", "temperature")
+# one read covers present position, speed, load, voltage and temperature
+SAMPLE_START = ax12.P_PRESENT_POSITION_L
+SAMPLE_LENGTH = ax12.P_PRESENT_TEMPERATURE - ax12.P_PRESENT_POSITION_L + 1
+# samples kept for each servo
+HISTORY = 4096
+
+
+def signed(value):
+    """ Speed and load are 10 bits of magnitude, bit 10 is the direction. """
+    if value & 0x400:
+        return -(value & 0x3FF)
+    return value & 0x3FF
+
+
+class RingBuffer:
+    """ The last size samples of one servo, oldest overwritten first. """
+
+    def __init__(self, size=HISTORY):
+        self.data = numpy.zeros((size, len(FIELDS)))
+        self.count = 0      # samples ever appended
+
+    def append(self, sample):
+        self.data[self.count % len(self.data)] = sample
+        self.count = self.count + 1
+
+    def samples(self):
+        """ Every sample held, oldest first. """
+        size = len(self.data)
+        if self.count <= size:
+            return self.data[:self.count].copy()
+        head = self.count % size
+        return numpy.concatenate((self.data[head:], self.data[:head]))
+
+    def since(self, t):
+        """ Samples taken at or after monotonic time t, oldest first. """
+        samples = self.samples()
+        return samples[numpy.searchsorted(samples[:, 0], t):]
+
+
+class TelemetryPoller:
+    """ Reads the present state of every servo, round-robin, in the background.
+
+    Every tick reads the next batch of servos (SAMPLE_LENGTH registers from
+    P_PRESENT_POSITION) at BACKGROUND priority, so anything the GUI asks
+    for goes on the bus first. The rate adapts like TCP congestion control:
+    when foreground requests are waiting for the bus, the rate is halved;
+    otherwise it climbs back towards rate by a fixed step each tick.
+
+    With a plain Driver the poller must be the only user of the port. """
+
+    def __init__(self, port, ids, rate=20.0, batch=4, history=HISTORY, minimum=0.5, step=1.0):
+        self.port = port
+        self.ids = list(ids)
+        self.rate = rate            # target reads per second, each of batch servos
+        self.batch = batch
+        self.minimum = minimum      # never poll slower than this
+        self.step = step            # additive increase, reads per second
+        self.current = rate         # the rate we're actually polling at
+        self.buffers = dict([(index, RingBuffer(history)) for index in self.ids])
+        self.next = 0               # round-robin position in ids
+        self.running = False
+        self.thread = None
+        self.wake = threading.Event()
+        # statistics
+        self.reads = 0
+        self.failures = 0
+        self.backoffs = 0
+
+    def start(self):
+        if self.thread is None:
+            self.running = True
+            self.wake.clear()
+            self.thread = threading.Thread(target=self.run, name="pypose-telemetry", daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        if self.thread is not None:
+            self.running = False
+            self.wake.set()
+            self.thread.join()
+            self.thread = None
+
+    def run(self):
+        while self.running:
+            start = time.monotonic()
+            self.adapt()
+            try:
+                self.poll()
+            except Exception as e:
+                print("Telemetry read failed: " + str(e))
+            delay = 1.0 / self.current - (time.monotonic() - start)
+            if delay > 0:
+                self.wake.wait(delay)
+
+    def adapt(self):
+        """ Additive increase, multiplicative decrease of the poll rate. """
+        if self.port.pending() > 0:
+            self.current = max(self.minimum, self.current / 2)
+            self.backoffs = self.backoffs + 1
+        else:
+            self.current = min(self.rate, self.current + self.step)
+
+    def poll(self):
+        """ Read the next batch of servos and record the samples. """
+        if len(self.ids) == 0:
+            return
+        ids = [self.ids[(self.next + i) % len(self.ids)] for i in range(min(self.batch, len(self.ids)))]
+        self.next = (self.next + len(ids)) % len(self.ids)
+        future = self.port.submit("readMany", ids, SAMPLE_START, SAMPLE_LENGTH, None, 0, priority=BACKGROUND)
+        values = future.result()
+        now = time.monotonic()
+        for index in ids:
+            self.reads = self.reads + 1
+            vals = values.get(index, -1)
+            if vals == -1:
+                self.failures = self.failures + 1
+                continue
+            self.buffers[index].append(self.decode(now, vals))
+
+    def decode(self, now, vals):
+        return (now,
+                vals[0] + (vals[1] << 8),
+                signed(vals[2] + (vals[3] << 8)),
+                signed(vals[4] + (vals[5] << 8)),
+                vals[6] / 10.0,
+                vals[7])
+
+    ###########################################################################
+    # queries
+
+    def history(self, index, seconds=None):
+        """ Samples of servo index over the last seconds (or all held), one row
+        per sample with the columns in FIELDS, oldest first. """
+        if seconds is None:
+            return self.buffers[index].samples()
+        return self.buffers[index].since(time.monotonic() - seconds)
+
+    def field(self, index, name, seconds=None):
+        """ One column of history(), e.g. field(1, "temperature", 60). """
+        return self.history(index, seconds)[:, FIELDS.index(name)]
+
+    def latest(self, index):
+        """ The last sample of servo index, as a dict, or None. """
+        buf = self.buffers[index]
+        if buf.count == 0:
+            return None
+        return dict(zip(FIELDS, buf.data[(buf.count - 1) % len(buf.data)].tolist()))
+
+    def stats(self):
+        return {"reads": self.reads, "failures": self.failures,
+                "backoffs": self.backoffs, "rate": self.current}
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+
+"""
+  PyPose: per-servo timeout and retry policy for the bus
+  Copyright (c) 2008-2010 Michael E. Ferguson.  All right reserved.
+
+  This program is free software; you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation; either version 2 of the License, or
+  (at your option) any later version.
+
+  This program is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+  GNU General Public License for more details.
+
+  You should have received a copy of the GNU General Public License
+  along with this program; if not, write to the Free Software Foundation,
+  Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+
+import time
+
+
+class ServoTiming:
+    """ What we know about the round trip to one servo. """
+
+    def __init__(self):
+        self.srtt = None        # smoothed round trip, seconds
+        self.rttvar = 0.0       # smoothed deviation of the round trip
+        self.failures = 0       # failed transactions in a row
+        self.deadUntil = 0.0    # monotonic time until which we skip it
+
+
+class TimeoutPolicy:
+    """ Sizes timeouts from the observed round trip of each servo.
+
+    Round trips are tracked with an EWMA of the mean and the deviation,
+    the same way TCP sizes its retransmit timer; the timeout is the mean
+    plus four deviations, kept within [minimum, maximum]. A failed request
+    is retried with a growing timeout. A servo that fails deadAfter
+    transactions in a row is skipped for holdOff seconds, then probed
+    once without retries. Only a servo going dead, or answering again,
+    is printed; the driver counts the timeouts. """
+
+    def __init__(self, initial=0.1, minimum=0.01, maximum=2.0, retries=2, backoff=2.0,
+                 deadAfter=2, holdOff=10.0, alpha=0.125, beta=0.25):
+        self.initial = initial      # timeout for a servo we never heard from
+        self.minimum = minimum
+        self.maximum = maximum
+        self.retries = retries
+        self.backoff = backoff
+        self.deadAfter = deadAfter
+        self.holdOff = holdOff
+        self.alpha = alpha
+        self.beta = beta
+        self.servos = dict()        # id -> ServoTiming
+
+    def get(self, index):
+        timing = self.servos.get(index)
+        if timing is None:
+            timing = self.servos[index] = ServoTiming()
+        return timing
+
+    def timeout(self, index, attempt=0):
+        """ How long to wait for a reply from index, on this attempt. """
+        timing = self.get(index)
+        if timing.srtt is None:
+            t = self.initial
+        else:
+            t = timing.srtt + 4 * timing.rttvar
+        t = t * (self.backoff ** attempt)
+        # round up to whole milliseconds, so the port isn't reconfigured for noise
+        return min(self.maximum, max(self.minimum, int(t * 1000 + 1) / 1000.0))
+
+    def attempts(self, index):
+        """ How many times to send a request to index. """
+        timing = self.get(index)
+        if timing.failures >= self.deadAfter:
+            return 1    # we're only probing
+        return 1 + self.retries
+
+    def available(self, index):
+        """ False while index is being skipped for failing too often. """
+        return time.monotonic() >= self.get(index).deadUntil
+
+    def success(self, index, rtt):
+        timing = self.get(index)
+        if timing.srtt is None:
+            timing.srtt = rtt
+            timing.rttvar = rtt / 2
+        else:
+            timing.rttvar = (1 - self.beta) * timing.rttvar + self.beta * abs(timing.srtt - rtt)
+            timing.srtt = (1 - self.alpha) * timing.srtt + self.alpha * rtt
+        if timing.failures >= self.deadAfter:
+            print("Servo ID = " + str(index) + " answering again")
+        timing.failures = 0
+        timing.deadUntil = 0.0
+
+    def failure(self, index):
+        """ A transaction to index failed, every attempt included. """
+        timing = self.get(index)
+        timing.failures = timing.failures + 1
+        if timing.failures >= self.deadAfter:
+            timing.deadUntil = time.monotonic() + self.holdOff
+            if timing.failures == self.deadAfter:
+                print("Servo ID = " + str(index) + " not answering, skipping it for " + str(self.holdOff) + "s at a time")
+
+    def forget(self, index=None):
+        """ Drop what we know about index (or every servo). """
+        if index is None:
+            self.servos = dict()
+        elif index in self.servos:
+            del self.servos[index]
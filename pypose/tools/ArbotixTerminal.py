@@ -21,6 +21,8 @@
 
 import wx
 from pypose import ax12
+from pypose import discovery
+from pypose.telemetry import FIELDS
 from .ToolPane import ToolPane
 
 # help phrases
@@ -32,6 +34,11 @@ help = ["\rPyPose Terminal V2",
         "\rset param id val - set parameter on servo ID=id to val",
         "\rget param id - get a parameter value from a servo",
         "\rbaud b - set baud rate of bus to b",
+        "\rls all - list the servos found at any baud rate (direct connection only)",
+        "\rinfo - model, firmware and return delay of the servos found by ls",
+        "\rtelem on [rate] / telem off - poll servo state in the background",
+        "\rtelem id - latest state of a servo, and its range over the last minute",
+        "\rrecord file / record off - log all bus traffic to a file",
         "\r",
         "\rvalid parameters",
         "\rpos - current position of a servo, 0-1023",
@@ -91,28 +98,49 @@ class shell(wx.TextCtrl):
                 elif l[0] == "serial":
                     # open a serial port
                     if self.parent.parent.port is not None:
-                        self.parent.parent.port.ser.close()
+                        self.parent.parent.stopTelemetry()
+                        self.parent.parent.port.close()
                     print("Opening port: " + l[1])
                     self.port = self.parent.parent.openPort(str(l[1]))
                 elif self.parent.parent.port is None:
                     self.write("\rNo port open!")
                 elif l[0] == "ls":      # list servos
-                    to = self.parent.parent.port.ser.timeout
-                    self.parent.parent.port.ser.timeout = 0.25
-                    # baud = 1000000
-                    # if len(l) > 1:       # we have a baud too!
-                    #    baud = int(l[1])
-                    k = 0                # how many id's have we printed...
-                    self.write("\r")
-                    for i in range(18):
-                        if self.parent.parent.port.getReg(i + 1, ax12.P_PRESENT_POSITION_L, 1) != -1:
-                            if k > 8:    # limit the width of each printout
-                                k = 0
-                                self.write("\r")
-                            self.write(repr(i + 1).rjust(4))
-                            k = k + 1
-                            wx.SafeYield()
-                    self.parent.parent.port.ser.timeout = to
+                    bauds = None
+                    if len(l) > 1 and l[1] == "all":    # sweep every baud rate, direct bus only
+                        bauds = sorted(ax12.BAUD_RATES.values(), reverse=True)
+                    self.parent.parent.port.submit(discovery.scan, self.parent.parent.port, discovery.ALL_IDS, bauds,
+                                                   callback=self.listed)
+                    return
+                elif l[0] == "info":    # details of the servos found
+                    self.parent.parent.port.submit(discovery.inventory, self.parent.parent.port, callback=self.showInfo)
+                    return
+                elif l[0] == "telem":   # background telemetry
+                    telemetry = self.parent.parent.telemetry
+                    if len(l) < 2:
+                        self.write("\rUsage: telem on [rate] | telem off | telem <id>")
+                    elif l[1] == "on":
+                        rate = 20.0
+                        if len(l) > 2 and self.isNumber(l[2], float):
+                            rate = float(l[2])
+                        elif len(l) > 2:
+                            self.write("\rERROR : rate must be a number, using 20Hz")
+                        self.parent.parent.startTelemetry(rate)
+                    elif l[1] == "off":
+                        self.parent.parent.stopTelemetry()
+                    elif telemetry is None:
+                        self.write("\rTelemetry is off, use telem on")
+                    elif not self.isNumber(l[1], int) or int(l[1]) not in telemetry.ids:
+                        self.write("\rServo " + l[1] + " isn't polled")
+                    else:
+                        self.showTelemetry(telemetry, int(l[1]))
+                elif l[0] == "record":  # bus traffic log
+                    if len(l) < 2:
+                        self.write("\rUsage: record file | record off")
+                    elif l[1] == "off":
+                        self.parent.parent.port.stopRecording()
+                    else:
+                        self.parent.parent.port.record(l[1])
+                        self.write("\rRecording to " + l[1])
                 elif l[0] == "mv":      # rename a servo
                     if self.parent.parent.port.setReg(int(l[1]), ax12.P_ID, [int(l[2])]) == 0:
                         self.write("\rOK")
@@ -128,9 +156,16 @@ class shell(wx.TextCtrl):
                         self.write("\r" + str(self.parent.parent.port.setReg(int(l[2]), ax12.P_PRESENT_POSITION, 2)))
                 elif l[0] == "get":
                     if l[1] == "temp":
-                        self.write("\r" + str(self.parent.parent.port.getReg(int(l[2]), ax12.P_PRESENT_TEMPERATURE, 2)))
+                        self.write("\r" + str(self.parent.parent.port.getReg(int(l[2]), ax12.P_PRESENT_TEMPERATURE, 1)))
                     elif l[1] == "pos":
-                        self.write("\r" + str(self.parent.parent.port.getReg(int(l[2]), ax12.P_PRESENT_POSITION, 2)))
+                        v = self.parent.parent.port.getReg(int(l[2]), ax12.P_PRESENT_POSITION_L, 2)
+                        if v != -1:
+                            v = v[0] + (v[1] << 8)
+                        self.write("\r" + str(v))
+                    elif l[1] == "baud":
+                        # EEPROM, only goes on the bus the first time
+                        v = self.parent.parent.port.getReg(int(l[2]), ax12.P_BAUD_RATE, 1)
+                        self.write("\r" + str(ax12.BAUD_RATES.get(v, v)))
             except ZeroDivisionError:
                 self.write("\rERROR : Unrecognized command!")
             # new line!
@@ -142,6 +177,48 @@ class shell(wx.TextCtrl):
         else:
             self.write(chr(keycode))
 
+    def listed(self, found):
+        """ Print the servos found by ls, then a new prompt. """
+        if not self:
+            return
+        k = 0                # how many id's have we printed...
+        self.write("\r")
+        for servo in found:
+            if k > 8:    # limit the width of each printout
+                k = 0
+                self.write("\r")
+            self.write(repr(servo.id).rjust(4))
+            k = k + 1
+        self.write("\r>> ")
+
+    def showInfo(self, found):
+        """ Print what we know about each servo, then a new prompt. """
+        if not self:
+            return
+        for servo in found:
+            self.write("\r" + str(servo))
+        self.write("\r>> ")
+
+    def showTelemetry(self, telemetry, index):
+        """ Print the last sample of a servo, and the range of each field over a minute. """
+        latest = telemetry.latest(index)
+        if latest is None:
+            self.write("\rNo samples yet for servo " + str(index))
+            return
+        recent = telemetry.history(index, 60)
+        for i, name in enumerate(FIELDS[1:]):
+            column = recent[:, i + 1]
+            self.write("\r" + name.rjust(12) + ": " + str(latest[name]).rjust(6) +
+                       "   (" + str(column.min()) + " to " + str(column.max()) + ")")
+
+    def isNumber(self, text, kind):
+        """ True if text converts with kind, int or float. """
+        try:
+            kind(text)
+        except ValueError:
+            return False
+        return True
+
     def convertBaud(self, b):
         if b == 500000:
             return 3
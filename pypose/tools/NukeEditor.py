@@ -21,15 +21,26 @@
 """
 
 import wx
-import sys
 import os
 from pypose import ax12
 from pypose import project
+from pypose import gaits
 from pypose.tools.ToolPane import ToolPane
 from pypose.tools.commander import Commander
 
 # Which IK models to load?
-from pypose.tools.models.manifest import iKmodels
+from pypose.tools.models.registry import registry
+
+# images of the models, path -> wx.Bitmap, decoded once
+bitmaps = dict()
+
+
+def modelBitmap(name, filename):
+    """ An image of IK model name, from the registry. """
+    path = registry.path(registry[name].folder, filename)
+    if path not in bitmaps:
+        bitmaps[path] = wx.Bitmap(path, wx.BITMAP_TYPE_ANY)
+    return bitmaps[path]
 
 ###############################################################################
 # nuke editor window
@@ -67,7 +78,7 @@ class NukeEditor(ToolPane):
         configSizer.Add(wx.StaticText(self, -1, "IK Type:"), (0, 0),
                         wx.GBSpan(1, 1), wx.ALIGN_CENTER_VERTICAL | wx.TOP, 10)
         self.ikType = wx.ComboBox(
-            self, self.ID_IKTYPE, choices=[*iKmodels])
+            self, self.ID_IKTYPE, choices=registry.names())
         configSizer.Add(self.ikType, (0, 1), wx.GBSpan(1, 1), wx.TOP, 10)
 
         # IK Option (typical # of legs or # of DOF)
@@ -139,14 +150,8 @@ class NukeEditor(ToolPane):
     # draw buttons, etc.
 
     def getModel(self):
-        modelClassName = iKmodels[self.ikChoice].folder
-        if "tools/models/" + modelClassName not in sys.path:
-            sys.path.append("tools/models/" + modelClassName)
-        modelModule = __import__(modelClassName, globals(), locals(), [modelClassName])
-        modelClass = getattr(modelModule, modelClassName)
-        # make instance
         # dofORlegs/debug/GaitGen
-        self.model = modelClass(int(self.optChoice), True)
+        self.model = registry.modelClass(self.ikChoice)(int(self.optChoice), True)
         return self.model
 
     def makePanel(self):
@@ -184,8 +189,7 @@ class NukeEditor(ToolPane):
                 index = index + 1
                 count = count + 1
             if group[-1] != "":
-                picture = wx.StaticBitmap(self, bitmap=wx.Bitmap(
-                    "tools/models/" + iKmodels[self.ikChoice].folder + "/" + group[-1]))
+                picture = wx.StaticBitmap(self, bitmap=modelBitmap(self.ikChoice, group[-1]))
                 bodySizer.Add(picture, (index - count, 2), wx.GBSpan(count, 1))
         self.bodyBox.Add(bodySizer)
         self.sizer.Add(self.bodyBox, (0, 0), wx.GBSpan(2, 1), wx.EXPAND)
@@ -288,7 +292,7 @@ class NukeEditor(ToolPane):
                 self.ikOpt.Disable()
             else:
                 self.ikOpt.SetItems(
-                    [str(c) for c in iKmodels[self.ikType.GetValue()].options])
+                    [str(c) for c in registry[self.ikType.GetValue()].options])
                 self.ikOpt.Enable()
             if self.ikType.GetValue() == "" or self.ikOpt.GetValue() == "":
                 # Disable it all
@@ -318,15 +322,8 @@ class NukeEditor(ToolPane):
 
     def configModel(self):
         """ Load the model for our IK solution. """
-        modelClassName = iKmodels[self.ikChoice].folder
-        if "tools/models/" + modelClassName not in sys.path:
-            sys.path.append("tools/models/" + modelClassName)
-        modelModule = __import__(
-            modelClassName, globals(), locals(), [modelClassName])
-        modelClass = getattr(modelModule, modelClassName)
-        # make instance
         # dofORlegs/debug/GaitGen
-        model = modelClass(int(self.optChoice), True)
+        model = registry.create(self.ikChoice, self.optChoice, True)
         model.config(self.optChoice, [int(v.GetValue()) for v in self.vars], [int(
             s.GetValue()) for s in self.servos], [1024, ] + self.parent.project.resolution)
         model.mins = [512, ] + self.parent.project.poses["ik_min"]
@@ -339,17 +336,19 @@ class NukeEditor(ToolPane):
     # holla back -- the simple callbacks
     def writePose(self, pose, dt):
         # set pose size -- IMPORTANT!
-        self.port.execute(253, 7, [self.parent.project.count])
+        self.port.setPoseSize(self.parent.project.count)
         # download the pose
-        self.port.execute(253, 8, [0] + project.extract(pose))
-        self.port.execute(253, 9, [0, dt % 256, dt >> 8, 255, 0, 0])
-        self.port.execute(253, 10, list())
+        self.port.loadPose(0, pose)
+        self.port.loadSequence([(0, dt)])
+        self.port.playSequence()
 
     def doSignTest(self, e=None):
         """ Do the sign test, let's hope we pass. This is handled by the model. """
         if self.doChecks(["project", "port", "ik"]) > 0:
             self.configModel()
             self.signs = self.model.doSignTest(self)
+            if getattr(self.model, "cache", None) is not None:
+                print("IK cache:", self.model.cache)
             self.save()
 
     def doWalkTest(self, e=None):
@@ -362,8 +361,8 @@ class NukeEditor(ToolPane):
     def doIKType(self, e=None):
         """ Set IKType, make leg box visible """
         self.ikChoice = self.ikType.GetValue()
-        self.optLabel.SetLabel(iKmodels[self.ikChoice].optiondesc)
-        self.ikOpt.SetItems([str(c) for c in iKmodels[self.ikChoice].options])
+        self.optLabel.SetLabel(registry[self.ikChoice].optiondesc)
+        self.ikOpt.SetItems([str(c) for c in registry[self.ikChoice].options])
         self.ikOpt.Enable()
         self.optChoice = "4"
         self.makePanel()
@@ -460,23 +459,29 @@ class NukeEditor(ToolPane):
             self.parent.doRelax()
             print("Capturing neutral...")
             # show dialog with what neutral should like for this bot
-            modelClassName = iKmodels[self.ikType.GetValue()].folder
             dlg = NeutralDialog(self.parent, 'Capture Neutral Position',
-                                "tools/models/" + modelClassName + "/neutral.jpg")
+                                modelBitmap(self.ikType.GetValue(), "neutral.jpg"))
             # dlg = wx.MessageDialog(self.parent, 'Click OK when ready!', 'Capture Neutral Position', wx.OK | wx.CANCEL)
             if dlg.ShowModal() == wx.ID_OK:
                 self.parent.project.poses["ik_neutral"] = project.Pose(
                     "", self.parent.project.count)
-                errors = "could not read servos: "
-                for servo in range(self.parent.project.count):
-                    pos = self.port.getReg(servo + 1, ax12.P_PRESENT_POSITION_L, 2)
-                    if pos != -1:
-                        self.parent.project.poses["ik_neutral"][servo] = pos[0] + (
-                            pos[1] << 8)
-                    else:
-                        errors = errors + str(servo + 1) + ", "
-                if errors != "could not read servos: ":
-                    self.parent.sb.SetStatusText(errors[0:-2], 0)
+                self.port.submit("readMany", range(1, self.parent.project.count + 1), ax12.P_PRESENT_POSITION_L, 2,
+                                 callback=self.capturedNeutral)
+
+    def capturedNeutral(self, positions):
+        """ Store the neutral pose once it has come back from the bus. """
+        if not self:
+            return
+        errors = "could not read servos: "
+        for servo in range(self.parent.project.count):
+            pos = positions[servo + 1]
+            if pos != -1:
+                self.parent.project.poses["ik_neutral"][servo] = pos[0] + (
+                    pos[1] << 8)
+            else:
+                errors = errors + str(servo + 1) + ", "
+        if errors != "could not read servos: ":
+            self.parent.sb.SetStatusText(errors[0:-2], 0)
 
     ###########################################################################
     # export
@@ -492,39 +497,15 @@ class NukeEditor(ToolPane):
                 return
             print("Writing a NUKE sketch to:", skDir)
 
-            # map servo name to ID
-            servoMap = dict()
-            layout = [x for x in self.model.servo_layout if x != ""]
-            servoMap["LF_COXA"] = int(self.servos[layout.index("LF Coxa")].GetValue())
-            servoMap["LF_FEMUR"] = int(self.servos[layout.index("LF Femur")].GetValue())
-            servoMap["LF_TIBIA"] = int(self.servos[layout.index("LF Tibia")].GetValue())
-            servoMap["RF_COXA"] = int(self.servos[layout.index("RF Coxa")].GetValue())
-            servoMap["RF_FEMUR"] = int(self.servos[layout.index("RF Femur")].GetValue())
-            servoMap["RF_TIBIA"] = int(self.servos[layout.index("RF Tibia")].GetValue())
-            if str(self.ikOpt.GetValue()) == "6":
-                servoMap["LM_COXA"] = int(self.servos[layout.index("LM Coxa")].GetValue())
-                servoMap["LM_FEMUR"] = int(self.servos[layout.index("LM Femur")].GetValue())
-                servoMap["LM_TIBIA"] = int(self.servos[layout.index("LM Tibia")].GetValue())
-                servoMap["RM_COXA"] = int(self.servos[layout.index("RM Coxa")].GetValue())
-                servoMap["RM_FEMUR"] = int(self.servos[layout.index("RM Femur")].GetValue())
-                servoMap["RM_TIBIA"] = int(self.servos[layout.index("RM Tibia")].GetValue())
-            servoMap["LR_COXA"] = int(self.servos[layout.index("LR Coxa")].GetValue())
-            servoMap["LR_FEMUR"] = int(self.servos[layout.index("LR Femur")].GetValue())
-            servoMap["LR_TIBIA"] = int(self.servos[layout.index("LR Tibia")].GetValue())
-            servoMap["RR_COXA"] = int(self.servos[layout.index("RR Coxa")].GetValue())
-            servoMap["RR_FEMUR"] = int(self.servos[layout.index("RR Femur")].GetValue())
-            servoMap["RR_TIBIA"] = int(self.servos[layout.index("RR Tibia")].GetValue())
+            # map servo name to ID, and the dimensions, from the model description
+            self.configModel()
+            vals, servoMap = self.model.exportParams()
 
             # setup model parameters
             params = dict()
             params["legs"] = str(self.ikOpt.GetValue())
             params["dof"] = str(self.ikOpt.GetValue())
-            params["@VAL_LCOXA"] = str(self.vars[0].GetValue())
-            params["@VAL_LFEMUR"] = str(self.vars[1].GetValue())
-            params["@VAL_LTIBIA"] = str(self.vars[2].GetValue())
-            params["@VAL_XCOXA"] = str(self.vars[3].GetValue())
-            params["@VAL_YCOXA"] = str(self.vars[4].GetValue())
-            params["@VAL_MCOXA"] = str(self.vars[5].GetValue())
+            params.update(vals)
             params["@SERVO_COUNT"] = str(self.parent.project.count)
             params["@SERVO_INDEXES"] = ""
             for k, v in servoMap.items():
@@ -546,45 +527,16 @@ class NukeEditor(ToolPane):
             elif self.parent.project.resolution[0] == 4096:
                 params["@RAD_TO_SERVO_RESOLUTION"] = "651.89864690440f"
 
-            # load general parameters
-            template = open("tools/models/core/template.ik").readlines()
-            code = dict()
-            current = ""
-            for line in template:
-                if line.find("@") == 0 and current == "":
-                    current = line.strip().rstrip()
-                elif line.find("@END_SECTION") > -1:
-                    current = ""
-                else:
-                    try:
-                        code[current] = code[current] + line
-                    except:
-                        code[current] = line
-            # load the parameters for our particular model
-            modelDir = iKmodels[self.ikType.GetValue()].folder
-            template = open("tools/models/" + modelDir +
-                            "/template.ik").readlines()
-            current = ""
-            for line in template:
-                if line.find("@") == 0 and current == "":
-                    current = line.strip().rstrip()
-                elif line.find("@END_SECTION") > -1:
-                    current = ""
-                else:
-                    try:
-                        code[current] = code[current] + line
-                    except:
-                        code[current] = line
-            code.pop("")
+            # code sections, general then for our particular model
+            code = registry.sections(self.ikType.GetValue())
 
             templates = dict()
             # load default templates
-            templates["gaits.h"] = open("tools/models/core/gaits.h").read()
-            templates["nuke.h"] = open("tools/models/core/nuke.h").read()
-            templates["nuke.cpp"] = open("tools/models/core/nuke.cpp").read()
+            templates["gaits.h"] = registry.text("core", "gaits.h")
+            templates["nuke.h"] = registry.text("core", "nuke.h")
+            templates["nuke.cpp"] = registry.text("core", "nuke.cpp")
             sketch = os.path.split(skDir)[1]
-            templates[sketch +
-                      ".ino"] = open("tools/models/core/default.pde").read()
+            templates[sketch + ".ino"] = registry.text("core", "default.pde")
             # for each file
             for fileName in templates.keys():
                 # insert code blocks
@@ -642,6 +594,16 @@ class NukeEditor(ToolPane):
                     i = i + 1
                 out.close()
 
+            # gait tables, every cycle solved ahead of time
+            endpoints = gaits.stance(self.model.legs, int(params["@X_STANCE"]), int(params["@Y_STANCE"]),
+                                     int(params["@Z_STANCE"]))
+            tables = gaits.compileGaits(self.model, gaits.GAITS.keys(), gaits.EXPORT_SPEEDS,
+                                        int(params["@LIFT_HEIGHT"]), endpoints=endpoints)
+            gaits.writeProgmem(tables, skDir + "/gaittables.h")
+            for table in tables:
+                if not table.valid():
+                    print("Gait", table.name(), "can't reach", len(table.failures()), "positions")
+
 
 ###########################################################################
 # A message box, with backup ability
@@ -675,12 +637,12 @@ class NukeDialog(wx.Dialog):
 
 class NeutralDialog(wx.Dialog):
     # TODO: This crap was generated by wxGlade, should probably be cleaned up...
-    def __init__(self, parent, title, image):
+    def __init__(self, parent, title, bitmap):
         # def __init__(self, *args, **kwds):
         # kwds["style"] = wx.DEFAULT_DIALOG_STYLE
         wx.Dialog.__init__(self, parent, 0, title, style=wx.DEFAULT_DIALOG_STYLE)  # *args, **kwds)
         self.label_3 = wx.StaticText(self, -1, "Click OK when you've positioned the robot as shown:")
-        self.bitmap_1 = wx.StaticBitmap(self, -1, wx.Bitmap(image, wx.BITMAP_TYPE_ANY))
+        self.bitmap_1 = wx.StaticBitmap(self, -1, bitmap)
         self.button_1 = wx.Button(self, wx.ID_CANCEL, "Cancel")
         self.button_2 = wx.Button(self, wx.ID_OK, "OK")
 
@@ -22,6 +22,8 @@
 import wx
 from pypose import ax12
 from pypose import project
+from pypose.coalesce import CoalescingWriter
+from pypose.interpolate import Interpolator, EASINGS
 from .ToolPane import ToolPane
 
 
@@ -46,6 +48,8 @@ class PoseEditor(ToolPane):
         self.curpose = ""
         self.saveReq = False
         self.live = self.parent.live.IsChecked()
+        self.writer = None      # coalesces live updates, started on first use
+        self.interpolator = None  # tweens setPose when the board can't
 
         sizer = wx.GridBagSizer(10, 10)
 
@@ -99,8 +103,15 @@ class PoseEditor(ToolPane):
         self.deltaTButton.Disable()
         toolbarsizer.Add(self.deltaTButton, 1)
         self.deltaT = 500
-        if port is not None and port.hasInterpolation:
+        if port is not None:
             self.deltaTButton.Enable()
+        #  easing for host-side interpolation
+        self.easing = wx.Choice(toolbar, -1, choices=list(EASINGS.keys()))
+        self.easing.SetSelection(0)
+        self.easing.Disable()
+        toolbarsizer.Add(self.easing, 1)
+        if port is not None and not port.hasInterpolation:
+            self.easing.Enable()
         toolbarsizer.Add(wx.Button(toolbar, self.BT_RELAX, 'relax'), 1)
         toolbarsizer.Add(wx.Button(toolbar, self.BT_CAPTURE, 'capture'), 1)
         toolbarsizer.Add(wx.Button(toolbar, self.BT_SET, 'set'), 1)
@@ -139,9 +150,10 @@ class PoseEditor(ToolPane):
             self.parent.project.save = True
             # live update
             if self.live and self.servos[e.GetId()].enable.IsChecked():
-                pos = e.GetInt()
-                self.port.setReg(
-                    e.GetId() + 1, ax12.P_GOAL_POSITION_L, [pos % 256, pos >> 8])
+                if self.writer is None:
+                    self.writer = CoalescingWriter(self.port)
+                    self.writer.start()
+                self.writer.set(e.GetId() + 1, e.GetInt())
 
     def relaxServo(self, e=None):
         """ Relax or enable a servo. """
@@ -173,35 +185,10 @@ class PoseEditor(ToolPane):
         if self.port is not None:
             if self.curpose != "":
                 print("Capturing pose...")
-                errors = "could not read servos: "
-                errCount = 0.0
-                dlg = wx.ProgressDialog(
-                    "capturing pose", "this may take a few seconds, please wait...", self.parent.project.count + 1)
-                dlg.Update(1)
-                for servo in range(self.parent.project.count):
-                    pos = self.port.getReg(servo + 1, ax12.P_PRESENT_POSITION_L, 2)
-                    if pos != -1 and len(pos) > 1:
-                        self.servos[servo].position.SetValue(
-                            pos[0] + (pos[1] << 8))
-                    else:
-                        errors = errors + str(servo + 1) + ", "
-                        errCount = errCount + 1.0
-                    if self.curpose != "":
-                        self.parent.project.poses[self.curpose][servo] = self.servos[servo].position.GetValue(
-                        )
-                    val = servo + 2
-                    dlg.Update(val)
-                if errors != "could not read servos: ":
-                    self.parent.sb.SetStatusText(errors[0:-2], 0)
-                    # if we are failing a lot, raise the timeout
-                    if errCount / self.parent.project.count > 0.1 and self.parent.port.ser.timeout < 10:
-                        self.parent.port.ser.timeout = self.parent.port.ser.timeout * 2.0
-                        print("Raised timeout threshold to ",
-                              self.parent.port.ser.timeout)
-                else:
-                    self.parent.sb.SetStatusText("captured pose!", 0)
-                dlg.Destroy()
-                self.parent.project.save = True
+                self.parent.sb.SetStatusText("capturing pose...", 0)
+                posename = self.curpose
+                self.port.submit("readMany", range(1, self.parent.project.count + 1), ax12.P_PRESENT_POSITION_L, 2,
+                                 callback=lambda positions: self.capturedPose(posename, positions))
             else:
                 self.parent.sb.SetBackgroundColour('RED')
                 self.parent.sb.SetStatusText("Please Select a Pose", 0)
@@ -211,6 +198,26 @@ class PoseEditor(ToolPane):
             self.parent.sb.SetStatusText("No Port Open", 0)
             self.parent.timer.Start(20)
 
+    def capturedPose(self, posename, positions):
+        """ Fill in a pose once the capture has come back from the bus. """
+        if not self or posename not in self.parent.project.poses:
+            return
+        errors = "could not read servos: "
+        for servo in range(self.parent.project.count):
+            pos = positions[servo + 1]
+            if pos != -1 and len(pos) > 1:
+                self.parent.project.poses[posename][servo] = pos[0] + (pos[1] << 8)
+                if self.curpose == posename:
+                    self.servos[servo].position.SetValue(pos[0] + (pos[1] << 8))
+            else:
+                errors = errors + str(servo + 1) + ", "
+        if errors != "could not read servos: ":
+            # timeouts adapt per servo in the driver's policy
+            self.parent.sb.SetStatusText(errors[0:-2], 0)
+        else:
+            self.parent.sb.SetStatusText("captured pose!", 0)
+        self.parent.project.save = True
+
     def setPose(self, e=None):
         """ Write a pose out to the robot. """
         if self.port is not None:
@@ -223,25 +230,18 @@ class PoseEditor(ToolPane):
                 if self.port.hasInterpolation:  # lets do this smoothly!
                     # set pose size -- IMPORTANT!
                     print("Setting pose size at", self.parent.project.count)
-                    self.port.execute(253, 7, [self.parent.project.count])
+                    self.port.setPoseSize(self.parent.project.count)
                     # download the pose
-                    self.port.execute(
-                        253, 8, [0] + project.extract(self.parent.project.poses[self.curpose]))
-                    self.port.execute(
-                        253, 9, [0, self.deltaT % 256, self.deltaT >> 8, 255, 0, 0])
-                    self.port.execute(253, 10, list())
+                    self.port.loadPose(0, self.parent.project.poses[self.curpose])
+                    self.port.loadSequence([(0, self.deltaT)])
+                    self.port.playSequence()
                 else:
-                    # aww shucks...
-                    # curPose = list() TODO: should we use a syncWrite here?
-                    for servo in range(self.parent.project.count):
-                        pos = self.servos[servo].position.GetValue()
-                        self.port.setReg(
-                            servo + 1, ax12.P_GOAL_POSITION_L, [pos % 256, pos >> 8])
-                        self.parent.project.poses[self.curpose][servo] = self.servos[servo].position.GetValue(
-                        )
-                    #    pos = self.servos[servo].position.get()
-                    #    curPose.append( (servo+1, pos%256, pos>>8) )
-                    # self.pose.syncWrite(P_GOAL_POSITION_L, curPose)
+                    # no interpolation on the board, stream the frames ourselves
+                    if self.interpolator is None:
+                        self.interpolator = Interpolator(self.port)
+                    self.interpolator.moveTo(range(1, self.parent.project.count + 1),
+                                             list(self.parent.project.poses[self.curpose]),
+                                             self.deltaT, self.easing.GetStringSelection())
             else:
                 self.parent.sb.SetBackgroundColour('RED')
                 self.parent.sb.SetStatusText("Please Select a Pose", 0)
@@ -328,9 +328,29 @@ class PoseEditor(ToolPane):
             self.deltaT = int(dlg.GetValue())
             dlg.Destroy()
 
+    def stopWriter(self):
+        """ Flush and stop live updates and interpolation, report how they did. """
+        if self.writer is not None:
+            self.writer.stop()
+            print("Live update: " + str(self.writer))
+            self.writer = None
+        if self.interpolator is not None:
+            self.interpolator.stop()
+            print("Interpolation: " + str(self.interpolator))
+            self.interpolator = None
+
+    def save(self):
+        # we're about to be closed, nothing should be left queued
+        self.stopWriter()
+
     def portUpdated(self):
         """ Adjust delta-T button """
-        if self.port is not None and self.port.hasInterpolation:
+        self.stopWriter()
+        if self.port is not None:
             self.deltaTButton.Enable()
         else:
             self.deltaTButton.Disable()
+        if self.port is not None and not self.port.hasInterpolation:
+            self.easing.Enable()
+        else:
+            self.easing.Disable()
@@ -21,6 +21,7 @@ Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
 
 import wx
 from pypose import project
+from pypose.player import SequencePlayer, transitions
 from .ToolPane import ToolPane
 
 
@@ -41,6 +42,7 @@ class SeqEditor(ToolPane):
     ID_TRAN_BOX = wx.NewIdRef()
     ID_TRAN_POSE = wx.NewIdRef()
     ID_TRAN_TIME = wx.NewIdRef()
+    ID_SPEED = wx.NewIdRef()
 
     NAME = "Sequence editor"
     STATUS = "please create or select a sequence to edit..."
@@ -49,6 +51,7 @@ class SeqEditor(ToolPane):
         ToolPane.__init__(self, parent, port)
         self.curseq = ""
         self.curtran = -1
+        self.player = None      # plays sequences when the board can't
 
         sizer = wx.GridBagSizer(10, 10)
 
@@ -105,6 +108,9 @@ class SeqEditor(ToolPane):
         toolbarsizer.Add(wx.Button(toolbar, self.BT_RUN, 'run'), 1)
         toolbarsizer.Add(wx.Button(toolbar, self.BT_LOOP, 'loop'), 1)
         toolbarsizer.Add(wx.Button(toolbar, self.BT_HALT, 'halt'), 1)
+        #  playback speed, in percent, for sequences played from here
+        self.speed = wx.SpinCtrl(toolbar, self.ID_SPEED, '100', min=10, max=400)
+        toolbarsizer.Add(self.speed, 1)
         toolbar.SetSizer(toolbarsizer)
         sizer.Add(toolbar, (1, 0), wx.GBSpan(1, 1), wx.ALIGN_CENTER)
 
@@ -124,8 +130,13 @@ class SeqEditor(ToolPane):
         self.Bind(wx.EVT_LISTBOX, self.doTran, self.ID_TRAN_BOX)
         self.Bind(wx.EVT_COMBOBOX, self.updateTran, self.ID_TRAN_POSE)
         self.Bind(wx.EVT_SPINCTRL, self.updateTran, self.ID_TRAN_TIME)
+        self.Bind(wx.EVT_SPINCTRL, self.doSpeed, self.ID_SPEED)
 
     def save(self):
+        self.stopPlayer()
+        self.saveSeq()
+
+    def saveSeq(self):
         if self.curseq != "":
             self.parent.project.sequences[self.curseq] = project.Sequence()
             for i in range(self.tranbox.GetCount()):
@@ -136,7 +147,7 @@ class SeqEditor(ToolPane):
     def doSeq(self, e=None):
         """Save previous sequence changes, load a sequence into the editor."""
         if e.IsSelection():
-            self.save()
+            self.saveSeq()
             self.curseq = str(e.GetString())
             self.curtran = -1
             for i in range(self.tranbox.GetCount()):
@@ -241,43 +252,46 @@ class SeqEditor(ToolPane):
 
     def runSeq(self, e=None):
         """ download poses, seqeunce, and send. """
-        self.save()  # save sequence
+        self.saveSeq()  # save sequence
         if self.port is not None:
-            if self.curseq != "":
+            if self.curseq != "" and not self.port.hasInterpolation:
+                # play it from here, streaming the frames
+                print("Run sequence...")
+                if self.player is None:
+                    self.player = SequencePlayer(self.port, range(1, self.parent.project.count + 1))
+                self.player.setSpeed(self.speed.GetValue() / 100.0)
+                self.player.play(transitions(self.parent.project, self.curseq), e.GetId() == self.BT_LOOP)
+                self.parent.sb.SetStatusText('Playing Sequence: ' + self.curseq)
+            elif self.curseq != "":
                 print("Run sequence...")
                 # key = pose name, val = index, download them after we build a transition list
                 poseDL = dict()
-                tranDL = list()     # list of bytes to download
+                tranDL = list()     # (pose index, delta-T) to download
                 for t in self.parent.project.sequences[self.curseq]:
                     p = t[0:t.find("|")]                    # pose name
                     dt = int(t[t.find("|") + 1:])             # delta-T
                     if p not in poseDL.keys():
                         poseDL[p] = len(poseDL.keys())      # get ix for pose
-                    # create transition values to download
-                    tranDL.append(poseDL[p])                # ix of pose
-                    # time is an int (16-bytes)
-                    tranDL.append(dt % 256)
-                    tranDL.append(dt >> 8)
-                tranDL.append(255)      # notice to stop
-                tranDL.append(0)        # time is irrelevant on stop
-                tranDL.append(0)
+                    tranDL.append((poseDL[p], dt))
+                # queue it all up for the bus, requests go out in order
                 # set pose size -- IMPORTANT!
                 print("Setting pose size at " + str(self.parent.project.count))
-                self.port.execute(253, 7, [self.parent.project.count])
+                self.port.submit("setPoseSize", self.parent.project.count)
                 # send poses
                 for p in poseDL.keys():
                     print("Sending pose " + str(p) + " to position " + str(poseDL[p]))
-                    self.port.execute(
-                        253, 8, [poseDL[p]] + project.extract(self.parent.project.poses[p]))
+                    self.port.submit("loadPose", poseDL[p], list(self.parent.project.poses[p]))
                 print("Sending sequence: " + str(tranDL))
                 # send sequence and play
-                self.port.execute(253, 9, tranDL)
+                self.port.submit("loadSequence", tranDL)
                 # run or loop?
+                seqname = self.curseq
                 if e.GetId() == self.BT_LOOP:
-                    self.port.execute(253, 11, list())
+                    play = "loopSequence"
                 else:
-                    self.port.execute(253, 10, list())
-                self.parent.sb.SetStatusText('Playing Sequence: ' + self.curseq)
+                    play = "playSequence"
+                self.parent.sb.SetStatusText('Sending Sequence: ' + seqname)
+                self.port.submit(play, callback=lambda r: self.parent.sb.SetStatusText('Playing Sequence: ' + seqname))
             else:
                 self.parent.sb.SetBackgroundColour('RED')
                 self.parent.sb.SetStatusText("Select a Sequence", 0)
@@ -291,8 +305,25 @@ class SeqEditor(ToolPane):
         """ send halt message ("H") """
         if self.port is not None:
             print("Halt sequence...")
-            self.port.ser.write(b"H")
+            if self.player is not None and self.player.playing():
+                self.player.halt()
+                print("Sequence: " + str(self.player))
+            else:
+                self.port.haltSequence()
         else:
             self.parent.sb.SetBackgroundColour('RED')
             self.parent.sb.SetStatusText("No Port Open", 0)
             self.parent.timer.Start(20)
+
+    def doSpeed(self, e=None):
+        """ Change the speed of the sequence playing, if we play it. """
+        if self.player is not None:
+            self.player.setSpeed(self.speed.GetValue() / 100.0)
+
+    def stopPlayer(self):
+        if self.player is not None:
+            self.player.halt()
+            self.player = None
+
+    def portUpdated(self):
+        self.stopPlayer()
@@ -1,9 +1,18 @@
 #!/usr/bin/env python3
 
+import importlib
 
-from .SeqEditor import SeqEditor
-from .PoseEditor import PoseEditor
-from .ArbotixTerminal import ArbotixTerminal
+# the editor panels need wx, so they are imported the first time they are
+# asked for; pypose.tools.models can then be used without a GUI
+PANELS = ["PoseEditor", "SeqEditor", "ArbotixTerminal"]
 
 
-panels = [PoseEditor, SeqEditor, ArbotixTerminal]
+def __getattr__(name):
+    if name in PANELS:
+        # the class, not the module of the same name the import binds here
+        globals()[name] = getattr(importlib.import_module("." + name, __name__), name)
+        return globals()[name]
+    if name == "panels":
+        globals()[name] = [__getattr__(n) for n in PANELS]
+        return globals()[name]
+    raise AttributeError("module " + __name__ + " has no attribute " + name)
@@ -20,62 +20,43 @@
 """
 
 import wx
-from math import cos, sin, atan2, sqrt, acos
-
-# Some preliminaries
-
-
-def sq(x):
-    return x * x
-
-
-def radToServo(rads, resolution=1024):
-    """Convert radians to servo position offset."""
-    if resolution == 4096:
-        return int(rads * 651.8986469044033)
-    else:
-        return int(rads * 195.56959407132098)
-
-
-COXA = 0
-FEMUR = 1
-TIBIA = 2
-
-
-class lizard3(dict):
-    X_COXA = 50     # MM between front and back legs /2
-    Y_COXA = 50     # MM between front/back legs /2
-
-    L_COXA = 50     # MM distance from coxa servo to femur servo
-    L_FEMUR = 50    # MM distance from femur servo to tibia servo
-    L_TIBIA = 50    # MM distance from tibia servo to foot
-
-    bodyRotX = 0.0
-    bodyRotY = 0.0
-    bodyRotZ = 0.0
-
-    bodyPosX = 0.0
-    bodyPosY = 0.0
-
-    def setNextPose(self, servo, pos):
-        self.nextPose[servo] = pos
-
-    def __init__(self, opt=4, debug=False, gaitGen=None):
-        self.legs = int(opt)    # option here corresponds to leg count
-        self.debug = debug      # do we print debug messages or not?
-        self.gaitGen = gaitGen  # any gait generation?
-
-        # Column 1 = Body Dimensions, need both specification of layout and data.
-        self.vars_layout = [["Leg", 0, 1, 2, "leg.jpg"], [
-            "Offsets", 3, 4, 5, "body.jpg"], ["COG Offsets", 6, 7, ""]]
-        self.vars = {0: ["Coxa(mm)", 50], 1: ["Femur(mm)", 50], 2: ["Tibia(mm)", 50], 3: [
-            "X(mm)", 50], 4: ["Y(mm)", 50], 5: ["Mid-Y(mm)", 50], 6: ["X(mm)", 0], 7: ["Y(mm)", 0]}
-
-        # Column 3 = Servo Values, need both specification of layout and data.
-        self.servo_layout = ["LF Coxa", "RF Coxa", "LF Femur", "RF Femur", "LF Tibia", "RF Tibia", "", "", "LM Coxa", "RM Coxa",
-                             "LM Femur", "RM Femur", "LM Tibia", "RM Tibia", "", "", "LR Coxa", "RR Coxa", "LR Femur", "RR Femur", "LR Tibia", "RR Tibia"]
-        self.servos = {"RF Coxa": 1, "RF Femur": 3, "RF Tibia": 5, "LF Coxa": 2, "LF Femur": 4, "LF Tibia": 6, "RR Coxa": 7, "RR Femur": 9, "RR Tibia": 11,
-                       "LR Coxa": 8, "LR Femur": 10, "LR Tibia": 12, "RM Coxa": 13, "RM Femur": 15, "RM Tibia": 17, "LM Coxa": 14, "LM Femur": 16, "LM Tibia": 18}
+from pypose.kinematics import Chain, Dim, Leg, LeggedModel
+
+# Four or six legs, each with a coxa, femur and tibia. Corner legs are
+# mounted on the corners of an X_COXA x Y_COXA box, middle legs Y_MID out.
+LIZARD3 = Chain(
+    joints=["Coxa", "Femur", "Tibia"],
+    links=["L_COXA", "L_FEMUR", "L_TIBIA"],
+    dims=[Dim("L_COXA", "Coxa(mm)", 50, "@VAL_LCOXA"),     # MM distance from coxa servo to femur servo
+          Dim("L_FEMUR", "Femur(mm)", 50, "@VAL_LFEMUR"),  # MM distance from femur servo to tibia servo
+          Dim("L_TIBIA", "Tibia(mm)", 50, "@VAL_LTIBIA"),  # MM distance from tibia servo to foot
+          Dim("X_COXA", "X(mm)", 50, "@VAL_XCOXA"),        # MM between front and back legs /2
+          Dim("Y_COXA", "Y(mm)", 50, "@VAL_YCOXA"),        # MM between front/back legs /2
+          Dim("Y_MID", "Mid-Y(mm)", 50, "@VAL_MCOXA"),     # MM between two middle legs /2
+          Dim("X_COG", "X(mm)", 0),
+          Dim("Y_COG", "Y(mm)", 0)],
+    groups=[("Leg", ["L_COXA", "L_FEMUR", "L_TIBIA"], "leg.jpg"),
+            ("Offsets", ["X_COXA", "Y_COXA", "Y_MID"], "body.jpg"),
+            ("COG Offsets", ["X_COG", "Y_COG"], "")],
+    legs=[Leg("RIGHT_FRONT", "RF_GAIT", "RF", (1, "X_COXA"), (1, "Y_COXA"), (1, 1)),
+          Leg("RIGHT_REAR", "RR_GAIT", "RR", (-1, "X_COXA"), (1, "Y_COXA"), (-1, 1)),
+          Leg("LEFT_FRONT", "LF_GAIT", "LF", (1, "X_COXA"), (-1, "Y_COXA"), (1, -1)),
+          Leg("LEFT_REAR", "LR_GAIT", "LR", (-1, "X_COXA"), (-1, "Y_COXA"), (-1, -1)),
+          Leg("RIGHT_MIDDLE", "RM_GAIT", "RM", (0, None), (1, "Y_MID"), (1, 1)),
+          Leg("LEFT_MIDDLE", "LM_GAIT", "LM", (0, None), (-1, "Y_MID"), (1, -1))],
+    rows=[("LF", "RF"), ("LM", "RM"), ("LR", "RR")],
+    options={4: ["RIGHT_FRONT", "RIGHT_REAR", "LEFT_FRONT", "LEFT_REAR"],
+             6: ["RIGHT_FRONT", "RIGHT_REAR", "LEFT_FRONT", "LEFT_REAR", "RIGHT_MIDDLE", "LEFT_MIDDLE"]},
+    servos={"RF Coxa": 1, "RF Femur": 3, "RF Tibia": 5, "LF Coxa": 2, "LF Femur": 4, "LF Tibia": 6, "RR Coxa": 7,
+            "RR Femur": 9, "RR Tibia": 11, "LR Coxa": 8, "LR Femur": 10, "LR Tibia": 12, "RM Coxa": 13,
+            "RM Femur": 15, "RM Tibia": 17, "LM Coxa": 14, "LM Femur": 16, "LM Tibia": 18})
+
+
+class lizard3(LeggedModel):
+    chain = LIZARD3
+
+    def __init__(self, opt=4, debug=False, gaitGen=None, cache=0):
+        LeggedModel.__init__(self, opt, debug, gaitGen, cache)
 
         # Used for gait generation.
         self["RIGHT_FRONT"] = [60, 90, 100]
@@ -92,340 +73,6 @@ class lizard3(dict):
         self["LM_GAIT"] = [0, 0, 0, 0]
         self.order = {"RF_GAIT": 0, "LR_GAIT": 2, "LF_GAIT": 4, "RR_GAIT": 6}
 
-        # Used to generate servo values for IK
-        self.mins = [512 for i in range(3 * self.legs + 1)]
-        self.maxs = [512 for i in range(3 * self.legs + 1)]
-        self.resolutions = [1024 for i in range(3 * self.legs + 1)]
-        self.neutrals = [512 for i in range(3 * self.legs + 1)]
-        self.nextPose = [512 for i in range(3 * self.legs + 1)]
-        self.signs = [1 for i in range(3 * self.legs + 1)]
-        self.step = 0
-
-    def config(self, opt, dims=None, servos=None, resolutions=None):
-        self.legs = int(opt)
-
-        # VARS = coxaLen, femurLen, tibiaLen, xBody, yBody, midyBody, xCOG, yCOG
-        if dims is not None:
-            self.L_COXA = dims[0]
-            self.L_FEMUR = dims[1]
-            self.L_TIBIA = dims[2]
-            self.X_COXA = dims[3]
-            self.Y_COXA = dims[4]
-            self.Y_MID = dims[5]
-            # cogs?
-
-        # SERVOS = Coxa, Femur, Tibia (LF, RF, LM, RM, LR, RR)
-        if servos is not None:
-            self.servos["LF Coxa"] = servos[0]
-            self.servos["RF Coxa"] = servos[1]
-            self.servos["LF Femur"] = servos[2]
-            self.servos["RF Femur"] = servos[3]
-            self.servos["LF Tibia"] = servos[4]
-            self.servos["RF Tibia"] = servos[5]
-
-            self.servos["LM Coxa"] = servos[6]
-            self.servos["RM Coxa"] = servos[7]
-            self.servos["LM Femur"] = servos[8]
-            self.servos["RM Femur"] = servos[9]
-            self.servos["LM Tibia"] = servos[10]
-            self.servos["RM Tibia"] = servos[11]
-
-            self.servos["LR Coxa"] = servos[12]
-            self.servos["RR Coxa"] = servos[13]
-            self.servos["LR Femur"] = servos[14]
-            self.servos["RR Femur"] = servos[15]
-            self.servos["LR Tibia"] = servos[16]
-            self.servos["RR Tibia"] = servos[17]
-
-        # set resolution of each servo
-        if resolutions is not None:
-            self.resolutions = resolutions
-
-    def adjustPanel(self, panel):
-        for var in panel.vars:
-            var.Enable()
-        if self.legs > 4:
-            for servo in panel.servos:
-                servo.Enable()
-        else:
-            panel.vars[5].Disable()
-            for i in range(6):
-                panel.servos[i].Enable()
-                panel.servos[6 + i].Disable()
-                panel.servos[12 + i].Enable()
-
-    def bodyIK(self, X, Y, Z, Xdisp, Ydisp, Zrot):
-        """ Compute offsets based on Body positions.
-          BodyIK based on the work of Xan """
-        ans = [0, 0, 0]   # (X,Y,Z)
-
-        cosB = cos(self.bodyRotX)
-        sinB = sin(self.bodyRotX)
-        cosG = cos(self.bodyRotY)
-        sinG = sin(self.bodyRotY)
-        cosA = cos(self.bodyRotZ + Zrot)
-        sinA = sin(self.bodyRotZ + Zrot)
-
-        totalX = int(X + Xdisp + self.bodyPosX)
-        totalY = int(Y + Ydisp + self.bodyPosY)
-
-        ans[0] = int(totalX - int(totalX * cosG * cosA + totalY * sinB * sinG * cosA +
-                                  Z * cosB * sinG * cosA - totalY * cosB * sinA + Z * sinB * sinA)) + self.bodyPosX
-        ans[1] = int(totalY - int(totalX * cosG * sinA + totalY * sinB * sinG * sinA +
-                                  Z * cosB * sinG * sinA + totalY * cosB * cosA - Z * sinB * cosA)) + self.bodyPosY
-        ans[2] = int(Z - int(-totalX * sinG + totalY *
-                             sinB * cosG + Z * cosB * cosG))
-
-        if self.debug:
-            print("BodyIK:", ans)
-        return ans
-
-    def legIK(self, X, Y, Z, resolution):
-        """ Compute leg servo positions. """
-        ans = [0, 0, 0, 0]    # (coxa, femur, tibia)
-
-        try:
-            # first, make this a 2DOF problem... by solving coxa
-            ans[0] = radToServo(atan2(X, Y), resolution)
-            trueX = int(sqrt(sq(X) + sq(Y))) - self.L_COXA
-            im = int(sqrt(sq(trueX) + sq(Z)))  # length of imaginary leg
-
-            # get femur angle above horizon...
-            q1 = -atan2(Z, trueX)
-            d1 = sq(self.L_FEMUR) - sq(self.L_TIBIA) + sq(im)
-            d2 = 2 * self.L_FEMUR * im
-            q2 = acos(d1 / float(d2))
-            ans[1] = radToServo(q1 + q2, resolution)
-
-            # and tibia angle from femur...
-            d1 = sq(self.L_FEMUR) - sq(im) + sq(self.L_TIBIA)
-            d2 = 2 * self.L_TIBIA * self.L_FEMUR
-            ans[2] = radToServo(acos(d1 / float(d2)) - 1.57, resolution)
-        except:
-            if self.debug:
-                print("LegIK FAILED")
-            return [1024, 1024, 1024, 0]
-
-        if self.debug:
-            print("LegIK:", ans)
-        return ans
-
-    def doIK(self):
-        fail = 0
-        req = [0, 0, 0, 0]     # [x,y,z,r]
-        gait = [0, 0, 0, 0]    # [x,y,z,r]
-        sol = [0, 0, 0]       # [coxa,femur,tibia]
-
-        # right front leg
-        if self.gaitGen is not None:
-            gait = self.gaitGen("RF_GAIT")
-        if self.debug:
-            print("RIGHT_FRONT: ", [self["RIGHT_FRONT"][i] + gait[i] for i in range(3)])
-        servo = self.servos["RF Coxa"]
-        req = self.bodyIK(self["RIGHT_FRONT"][0] + gait[0], self["RIGHT_FRONT"][1] +
-                          gait[1], self["RIGHT_FRONT"][2] + gait[2], self.X_COXA, self.Y_COXA, gait[3])
-        sol = self.legIK(self["RIGHT_FRONT"][0] + req[0] + gait[0], self["RIGHT_FRONT"][1] +
-                         req[1] + gait[1], self["RIGHT_FRONT"][2] + req[2] + gait[2], self.resolutions[servo])
-        output = self.neutrals[servo] + self.signs[servo] * sol[COXA]
-        if output < self.maxs[servo] and output > self.mins[servo]:
-            self.setNextPose(servo, output)
-        else:
-            if self.debug:
-                print("RF_COXA FAIL: ", output)
-            fail = fail + 1
-        servo = self.servos["RF Femur"]
-        output = self.neutrals[servo] + self.signs[servo] * sol[FEMUR]
-        if output < self.maxs[servo] and output > self.mins[servo]:
-            self.setNextPose(servo, output)
-        else:
-            if self.debug:
-                print("RF_FEMUR FAIL: ", output)
-            fail = fail + 1
-        servo = self.servos["RF Tibia"]
-        output = self.neutrals[servo] + self.signs[servo] * sol[TIBIA]
-        if output < self.maxs[servo] and output > self.mins[servo]:
-            self.setNextPose(servo, output)
-        else:
-            if self.debug:
-                print("RF_TIBIA FAIL: ", output)
-            fail = fail + 1
-
-        # right rear leg
-        if self.gaitGen is not None:
-            gait = self.gaitGen("RR_GAIT")
-        if self.debug:
-            print("RIGHT_REAR: ", [self["RIGHT_REAR"][i] + gait[i] for i in range(3)])
-        servo = self.servos["RR Coxa"]
-        req = self.bodyIK(self["RIGHT_REAR"][0] + gait[0], self["RIGHT_REAR"][1] +
-                          gait[1], self["RIGHT_REAR"][2] + gait[2], -self.X_COXA, self.Y_COXA, gait[3])
-        sol = self.legIK(-self["RIGHT_REAR"][0] - req[0] - gait[0], self["RIGHT_REAR"][1] +
-                         req[1] + gait[1], self["RIGHT_REAR"][2] + req[2] + gait[2], self.resolutions[servo])
-        output = self.neutrals[servo] + self.signs[servo] * sol[COXA]
-        if output < self.maxs[servo] and output > self.mins[servo]:
-            self.setNextPose(servo, output)
-        else:
-            if self.debug:
-                print("RR_COXA FAIL: ", output)
-            fail = fail + 1
-        servo = self.servos["RR Femur"]
-        output = self.neutrals[servo] + self.signs[servo] * sol[FEMUR]
-        if output < self.maxs[servo] and output > self.mins[servo]:
-            self.setNextPose(servo, output)
-        else:
-            if self.debug:
-                print("RR_FEMUR FAIL:", output)
-            fail = fail + 1
-        servo = self.servos["RR Tibia"]
-        output = self.neutrals[servo] + self.signs[servo] * sol[TIBIA]
-        if output < self.maxs[servo] and output > self.mins[servo]:
-            self.setNextPose(servo, output)
-        else:
-            if self.debug:
-                print("RR_TIBIA FAIL:", output)
-            fail = fail + 1
-
-        # left front leg
-        if self.gaitGen is not None:
-            gait = self.gaitGen("LF_GAIT")
-        if self.debug:
-            print("LEFT_FRONT: ", [self["LEFT_FRONT"][i] + gait[i] for i in range(3)])
-        servo = self.servos["LF Coxa"]
-        req = self.bodyIK(self["LEFT_FRONT"][0] + gait[0], self["LEFT_FRONT"][1] +
-                          gait[1], self["LEFT_FRONT"][2] + gait[2], self.X_COXA, -self.Y_COXA, gait[3])
-        sol = self.legIK(self["LEFT_FRONT"][0] + req[0] + gait[0], -self["LEFT_FRONT"][1] -
-                         req[1] - gait[1], self["LEFT_FRONT"][2] + req[2] + gait[2], self.resolutions[servo])
-        output = self.neutrals[servo] + self.signs[servo] * sol[COXA]
-        if output < self.maxs[servo] and output > self.mins[servo]:
-            self.setNextPose(servo, output)
-        else:
-            if self.debug:
-                print("LF_COXA FAIL:", output)
-            fail = fail + 1
-        servo = self.servos["LF Femur"]
-        output = self.neutrals[servo] + self.signs[servo] * sol[FEMUR]
-        if output < self.maxs[servo] and output > self.mins[servo]:
-            self.setNextPose(servo, output)
-        else:
-            if self.debug:
-                print("LF_FEMUR FAIL:", output)
-            fail = fail + 1
-        servo = self.servos["LF Tibia"]
-        output = self.neutrals[servo] + self.signs[servo] * sol[TIBIA]
-        if output < self.maxs[servo] and output > self.mins[servo]:
-            self.setNextPose(servo, output)
-        else:
-            if self.debug:
-                print("LF_TIBIA FAIL:", output)
-            fail = fail + 1
-
-        # left rear leg
-        if self.gaitGen is not None:
-            gait = self.gaitGen("LR_GAIT")
-        if self.debug:
-            print("LEFT_REAR: ", [self["LEFT_REAR"][i] + gait[i] for i in range(3)])
-        servo = self.servos["LR Coxa"]
-        req = self.bodyIK(self["LEFT_REAR"][0] + gait[0], self["LEFT_REAR"][1] + gait[1],
-                          self["LEFT_REAR"][2] + gait[2], -self.X_COXA, -self.Y_COXA, gait[3])
-        sol = self.legIK(-self["LEFT_REAR"][0] - req[0] - gait[0], -self["LEFT_REAR"][1] -
-                         req[1] - gait[1], self["LEFT_REAR"][2] + req[2] + gait[2], self.resolutions[servo])
-        output = self.neutrals[servo] + self.signs[servo] * sol[COXA]
-        if output < self.maxs[servo] and output > self.mins[servo]:
-            self.setNextPose(servo, output)
-        else:
-            if self.debug:
-                print("LR_COXA FAIL:", output)
-            fail = fail + 1
-        servo = self.servos["LR Femur"]
-        output = self.neutrals[servo] + self.signs[servo] * sol[FEMUR]
-        if output < self.maxs[servo] and output > self.mins[servo]:
-            self.setNextPose(servo, output)
-        else:
-            if self.debug:
-                print("LR_FEMUR FAIL:", output)
-            fail = fail + 1
-        servo = self.servos["LR Tibia"]
-        output = self.neutrals[servo] + self.signs[servo] * sol[TIBIA]
-        if output < self.maxs[servo] and output > self.mins[servo]:
-            self.setNextPose(servo, output)
-        else:
-            if self.debug:
-                print("LR_TIBIA FAIL:", output)
-            fail = fail + 1
-
-        if self.legs > 4:
-            # right middle leg
-            if self.gaitGen is not None:
-                gait = self.gaitGen("RM_GAIT")
-            if self.debug:
-                print("RIGHT_MIDDLE: ", [self["RIGHT_MIDDLE"][i] + gait[i] for i in range(3)])
-            servo = self.servos["RM Coxa"]
-            req = self.bodyIK(self["RIGHT_MIDDLE"][0] + gait[0], self["RIGHT_MIDDLE"]
-                              [1] + gait[1], self["RIGHT_MIDDLE"][2] + gait[2], 0, self.Y_MID, gait[3])
-            sol = self.legIK(+self["RIGHT_MIDDLE"][0] + req[0] + gait[0], self["RIGHT_MIDDLE"][1] +
-                             req[1] + gait[1], self["RIGHT_MIDDLE"][2] + req[2] + gait[2], self.resolutions[servo])
-            output = self.neutrals[servo] + self.signs[servo] * sol[COXA]
-            if output < self.maxs[servo] and output > self.mins[servo]:
-                self.setNextPose(servo, output)
-            else:
-                if self.debug:
-                    print("RM_COXA FAIL:", output)
-                fail = fail + 1
-            servo = self.servos["RM Femur"]
-            output = self.neutrals[servo] + self.signs[servo] * sol[FEMUR]
-            if output < self.maxs[servo] and output > self.mins[servo]:
-                self.setNextPose(servo, output)
-            else:
-                if self.debug:
-                    print("RM_FEMUR FAIL:", output)
-                fail = fail + 1
-            servo = self.servos["RM Tibia"]
-            output = self.neutrals[servo] + self.signs[servo] * sol[TIBIA]
-            if output < self.maxs[servo] and output > self.mins[servo]:
-                self.setNextPose(servo, output)
-            else:
-                if self.debug:
-                    print("RM_TIBIA FAIL:", output)
-                fail = fail + 1
-
-            # left middle leg
-            if self.gaitGen is not None:
-                gait = self.gaitGen("LM_GAIT")
-            if self.debug:
-                print("LEFT_MIDDLE: ", [self["LEFT_MIDDLE"][i] + gait[i] for i in range(3)])
-            servo = self.servos["LM Coxa"]
-            req = self.bodyIK(self["LEFT_MIDDLE"][0] + gait[0], self["LEFT_MIDDLE"]
-                              [1] + gait[1], self["LEFT_MIDDLE"][2] + gait[2], 0, -self.Y_MID, gait[3])
-            sol = self.legIK(self["LEFT_MIDDLE"][0] + req[0] + gait[0], -self["LEFT_MIDDLE"][1] -
-                             req[1] - gait[1], self["LEFT_MIDDLE"][2] + req[2] + gait[2], self.resolutions[servo])
-            output = self.neutrals[servo] + self.signs[servo] * sol[COXA]
-            if output < self.maxs[servo] and output > self.mins[servo]:
-                self.setNextPose(servo, output)
-            else:
-                if self.debug:
-                    print("LM_COXA FAIL:", output)
-                fail = fail + 1
-            servo = self.servos["LM Femur"]
-            output = self.neutrals[servo] + self.signs[servo] * sol[FEMUR]
-            if output < self.maxs[servo] and output > self.mins[servo]:
-                self.setNextPose(servo, output)
-            else:
-                if self.debug:
-                    print("LM_FEMUR FAIL:", output)
-                fail = fail + 1
-            servo = self.servos["LM Tibia"]
-            output = self.neutrals[servo] + self.signs[servo] * sol[TIBIA]
-            if output < self.maxs[servo] and output > self.mins[servo]:
-                self.setNextPose(servo, output)
-            else:
-                if self.debug:
-                    print("LM_TIBIA FAIL:", output)
-                fail = fail + 1
-
-        self.step = self.step + 1
-        if self.step > 7:
-            self.step = 0  # gaitStep = (gaitStep+1)%stepsInGait
-        return fail
-
     def defaultGait(self, leg):
         # just walk forward for now
         travelX = 50
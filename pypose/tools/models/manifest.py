@@ -4,14 +4,15 @@
 
 
 class IkModel:
-    def __init__(self, folder, options=[4, 6], optiondesc="# of legs"):
+    def __init__(self, folder, options=[4, 6], optiondesc="# of legs", cache=0):
         self.folder = folder
         self.options = options
         self.optiondesc = optiondesc
+        self.cache = cache      # IK solutions memoized, 0 for none
 
 
 iKmodels = dict()
-iKmodels["Lizard 3DOF"] = IkModel("lizard3")
+iKmodels["Lizard 3DOF"] = IkModel("lizard3", cache=4096)
 # iKmodels["Mammal 3DOF"] = IkModel("mammal3")
 # iKmodels["Biped 4/5/6"] = IkModel("biped",[4,5,6], "# of DOF")
 # iKmodels["Linear-Lift + 2DOF"] = IkModel("linear2")
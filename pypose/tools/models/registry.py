@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+
+"""
+  PyPose: registry of IK models and their files
+  Copyright (c) 2008-2010 Michael E. Ferguson.  All right reserved.
+
+  This program is free software; you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation; either version 2 of the License, or
+  (at your option) any later version.
+
+  This program is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+  GNU General Public License for more details.
+
+  You should have received a copy of the GNU General Public License
+  along with this program; if not, write to the Free Software Foundation,
+  Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+
+import os
+import importlib
+from pypose.tools.models.manifest import iKmodels
+
+# the models, each in a folder of this package
+MODELS_DIR = os.path.dirname(os.path.abspath(__file__))
+PACKAGE = __name__.rsplit(".", 1)[0]
+# folder of the NUKE templates shared by all models
+CORE = "core"
+
+
+def parseSections(lines, code=None):
+    """ The @SECTION ... @END_SECTION blocks of a template.ik, by name, added
+    to those already in code. """
+    if code is None:
+        code = dict()
+    current = ""
+    for line in lines:
+        if line.find("@") == 0 and current == "":
+            current = line.strip().rstrip()
+        elif line.find("@END_SECTION") > -1:
+            current = ""
+        else:
+            code[current] = code.get(current, "") + line
+    code.pop("", None)
+    return code
+
+
+class ModelRegistry:
+    """ The IK models of the manifest, by name. Listing them imports
+    nothing; a model module is imported the first time it is used, and
+    its templates are read once, then served from memory.
+    Paths are relative to this package, not to the working directory. """
+
+    def __init__(self, manifest=iKmodels):
+        self.manifest = manifest
+        self.classes = dict()       # name -> model class
+        self.texts = dict()         # path -> file contents
+        self.parsed = dict()        # name -> template.ik sections, core ones included
+
+    def names(self):
+        return list(self.manifest.keys())
+
+    def __getitem__(self, name):
+        """ The manifest entry of a model. """
+        return self.manifest[name]
+
+    def path(self, folder, filename):
+        return os.path.join(MODELS_DIR, folder, filename)
+
+    def modelClass(self, name):
+        if name not in self.classes:
+            folder = self.manifest[name].folder
+            module = importlib.import_module(PACKAGE + "." + folder + "." + folder)
+            self.classes[name] = getattr(module, folder)
+        return self.classes[name]
+
+    def create(self, name, opt, debug=False):
+        """ A new instance of model name, with its cache if the manifest asks. """
+        model = self.modelClass(name)(int(opt), debug)
+        if self.manifest[name].cache > 0:
+            model.setCache(self.manifest[name].cache)
+        return model
+
+    def text(self, folder, filename):
+        path = self.path(folder, filename)
+        if path not in self.texts:
+            with open(path) as f:
+                self.texts[path] = f.read()
+        return self.texts[path]
+
+    def sections(self, name):
+        """ The code sections of the core template.ik, with those of the
+        model appended. A copy, change it at will. """
+        if name not in self.parsed:
+            code = parseSections(self.text(CORE, "template.ik").splitlines(True))
+            parseSections(self.text(self.manifest[name].folder, "template.ik").splitlines(True), code)
+            self.parsed[name] = code
+        return dict(self.parsed[name])
+
+
+registry = ModelRegistry()
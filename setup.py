@@ -12,12 +12,17 @@ setup(name='pypose',
       author_email='ewen.brun@ecam.fr',
       license='GPLv3',
       packages=find_packages(),
+      package_data={
+          'pypose.tools.models': ['core/*', '*/*.jpg', '*/template.ik'],
+      },
       zip_safe=False,
       install_requires=[
           'pyserial',
+          'numpy',
           'wxpython',
       ],
       entry_points={
-          'console_scripts': ['pypose=pypose.pypose:main'],
+          'console_scripts': ['pypose=pypose.pypose:main',
+                              'pypose-bench=pypose.benchmark:main'],
       }
       )
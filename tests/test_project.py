@@ -0,0 +1,55 @@
+import multiprocessing
+import random
+
+import pytest
+
+from pypose import project
+
+
+def writeProject(path, poses=300, sequences=60):
+    """ A .ppr file with a few problems in it, to check they come out alike. """
+    rng = random.Random(7)
+    lines = ["robot:6"]
+    for i in range(poses):
+        lines.append("Pose=p" + str(i) + ":" + ", ".join([str(rng.randint(0, 1023)) for s in range(6)]))
+    lines.append("Pose=short:1, 2, 3")
+    lines.append("Pose=bad:1, x, 3, 4, 5, 6")
+    for i in range(sequences):
+        lines.append("Seq=s" + str(i) + ": " +
+                     ", ".join(["p" + str(rng.randint(0, poses - 1)) + "|" + str(rng.randint(0, 999)) for t in range(5)]))
+    lines.append("Nuke=lizard3,4,1,2,3")
+    path.write_text("\n".join(lines) + "\n")
+    return str(path)
+
+
+@pytest.mark.skipif("fork" not in multiprocessing.get_all_start_methods(), reason="parallel parse needs fork")
+def testParallelParseMatchesSerial(tmp_path, monkeypatch):
+    filename = writeProject(tmp_path / "robot.ppr")
+    monkeypatch.setattr(project, "PARALLEL_LINES", 50)
+    monkeypatch.setattr(project, "CHUNK_LINES", 40)
+
+    serial = project.Project()
+    serial.load(filename)
+    parallel = project.Project()
+    parallel.load(filename, workers=2)
+
+    assert parallel.name == serial.name and parallel.count == serial.count
+    assert parallel.nuke == serial.nuke
+    assert dict([(n, list(p)) for n, p in parallel.poses.items()]) == \
+        dict([(n, list(p)) for n, p in serial.poses.items()])
+    assert dict([(n, list(s)) for n, s in parallel.sequences.items()]) == \
+        dict([(n, list(s)) for n, s in serial.sequences.items()])
+    assert [str(p) for p in parallel.problems] == [str(p) for p in serial.problems]
+    assert len(serial.problems) > 0
+
+
+def testSerialByDefault(tmp_path, monkeypatch):
+    filename = writeProject(tmp_path / "robot.ppr")
+    monkeypatch.setattr(project, "PARALLEL_LINES", 50)
+
+    def noPool(*args, **kwargs):
+        raise AssertionError("parsed in parallel without workers")
+    monkeypatch.setattr(project, "ProcessPoolExecutor", noPool)
+    p = project.Project()
+    p.load(filename)
+    assert len(p.poses) == 302
@@ -0,0 +1,27 @@
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# run in a fresh interpreter, with wx made unimportable
+HEADLESS = """
+import sys
+sys.modules["wx"] = None
+from pypose.tools.models.registry import registry
+names = registry.names()
+assert "Lizard 3DOF" in names
+assert len(registry.sections(names[0])) > 0
+assert "wx" not in [m for m in sys.modules if sys.modules[m] is not None]
+"""
+
+
+def testRegistryImportsWithoutWx():
+    result = subprocess.run([sys.executable, "-c", HEADLESS], capture_output=True, text=True, cwd=ROOT)
+    assert result.returncode == 0, result.stderr
+
+
+def testPanelsNeedWx():
+    script = "import sys\nsys.modules['wx'] = None\nfrom pypose.tools import panels\n"
+    result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, cwd=ROOT)
+    assert result.returncode != 0 and "wx" in result.stderr